@@ -110,23 +110,19 @@ class Configuration:
             result: A dictionary which stores results
             depth: The current depth of the recursion
         """
-        # Initialize path and result. We avoid defaults so path and result are reset on each call
+        # Initialize path and result. We avoid defaults so result is reset on each call
         if path is None:
             path = []
         if result is None:
             result = {}
         for key, value in config_dict.items():
-            if depth == 0:  # Reset path each time the function reaches a top-level key in the dictionary
-                path = [key]
+            key_path = path + [key]  # A new list per key so sibling sections do not share a path
             if type(value) is dict:
-                if key not in path:
-                    path.append(key)
                 if key not in result.keys():
-                    result.update({key: path[:]})  # Create a new list to store path's current state
-                result = self._generate_config_keys(value, path, result, depth=depth + 1)
+                    result.update({key: key_path})
+                result = self._generate_config_keys(value, key_path, result, depth=depth + 1)
             else:
-                result.update({key: path[:]})
-                result[key].append(key)
+                result.update({key: key_path})
 
         return result
 
@@ -184,7 +180,9 @@ Config = create_configuration(settings_file(), config_settings)
 paths = {"directory": project_directory(), "database": database_file(os.getcwd()), "graph_dir": graphs_directory(),
          "settings": settings_file()}
 paths = {"directory": project_directory()}
-paths.update({"database": database_file(os.getcwd())})
+if "://" not in str(Config.get_property("database")):
+    # Default to the project's SQLite database unless a database URL, such as a PostgreSQL URL, is configured
+    paths.update({"database": database_file(os.getcwd())})
 change_paths = check_paths(Config, paths)
 set_paths(Config, change_paths)
 
@@ -0,0 +1,179 @@
+"""
+backend selects the database engine from the 'database' setting and provides bulk write paths for each backend.
+
+SQLite remains the default. When the 'database' setting holds a PostgreSQL URL, engines are created with a sized
+connection pool from the 'database_pool' settings so several pollers and model workers can share one store. Bulk loads
+use COPY on PostgreSQL and executemany inserts elsewhere. Upserts use the native INSERT ... ON CONFLICT of each backend.
+"""
+
+from contextlib import nullcontext
+import csv
+import io
+import sqlite3
+from sqlalchemy import bindparam, create_engine, event, MetaData, select, text
+from sqlalchemy import column as sql_column, table as sql_table
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.declarative import declarative_base
+from datatotable import database as datatotable_database
+from datatotable.database import Database
+
+# Local Imports
+from nbapredict.configuration import Config
+
+NULL_MARKER = r"\N"  # Text written in place of None values in COPY data
+
+
+def is_postgres(url):
+    """Return True if the database url points to a PostgreSQL database."""
+    return str(url).startswith("postgres")
+
+
+def engine(url=None):
+    """Create and return an engine for url, or the configured 'database' url, with backend appropriate pooling."""
+    url = url or Config.get_property("database")
+    if is_postgres(url):
+        return create_engine(url, pool_pre_ping=True,
+                             pool_size=Config.get_property("pool_size"),
+                             max_overflow=Config.get_property("max_overflow"),
+                             pool_timeout=Config.get_property("pool_timeout"))
+    return create_engine(url, pool_pre_ping=True)
+
+
+class PooledDatabase(Database):
+    """A datatotable Database connected through any SQLalchemy url rather than a SQLite file.
+
+    Attributes:
+        location: The database url
+        path: The database url
+        engine: SQLalchemy engine, pooled according to the 'database_pool' settings for server backends
+        metadata: Metadata for the engine, used mostly for table access / reflection
+        Base: SQLalchemy declarative_base() used for table creation
+    """
+
+    def __init__(self, url):
+        """Initialize the engine, metadata, and declarative base for url"""
+        self.location = url
+        self.path = url
+        self.engine = engine(url)
+        self.metadata = MetaData(self.engine)
+        self.Base = declarative_base()
+
+
+def connect(name="nba_db", directory=None):
+    """Return a Database for the configured 'database' url.
+
+    A PooledDatabase is returned for server backends. Otherwise, a SQLite Database named name is returned in directory.
+    """
+    url = Config.get_property("database")
+    if is_postgres(url):
+        return PooledDatabase(url)
+    return Database(name, directory)
+
+
+def bulk_insert(connection, table, rows):
+    """Insert rows into table through connection with the fastest path available to the backend.
+
+    PostgreSQL uses COPY. Other backends use an executemany insert. The insert joins any transaction already open on
+    connection, so pass session.connection() to load within a session's transaction.
+
+    Args:
+        connection: A SQLalchemy connection
+        table: A SQLalchemy Table or a mapped table class
+        rows: A list of dictionaries with column names as keys
+    """
+    table = getattr(table, "__table__", table)
+    rows = list(rows)
+    if not rows:
+        return 0
+    if connection.dialect.name == "postgresql":
+        return _copy(connection, table.name, list(rows[0].keys()), rows)
+    connection.execute(table.insert(), rows)
+    return len(rows)
+
+
+def upsert(connection, table, rows, conflict_columns, update_columns=None):
+    """Insert rows into table and update update_columns for rows which conflict on conflict_columns.
+
+    On PostgreSQL, rows are copied into a temporary table and merged with a single INSERT ... SELECT ... ON CONFLICT. On
+    SQLite, the equivalent INSERT ... ON CONFLICT statement is executed for all rows at once. conflict_columns must be
+    covered by a unique constraint or unique index.
+
+    Args:
+        connection: A SQLalchemy connection
+        table: A SQLalchemy Table or a mapped table class
+        rows: A list of dictionaries with column names as keys
+        conflict_columns: A list of column names which identify a row
+        update_columns: A list of column names to update on conflict. Defaults to every non-conflict column in rows
+    """
+    table = getattr(table, "__table__", table)
+    rows = list(rows)
+    if not rows:
+        return 0
+    columns = list(rows[0].keys())
+    if update_columns is None:
+        update_columns = [col for col in columns if col not in conflict_columns]
+
+    if connection.dialect.name == "postgresql":
+        # The temporary table is dropped on commit. Without an open transaction, autocommit would commit, and drop, the
+        # table as soon as it is created, so the statements run in their own transaction
+        with nullcontext() if connection.in_transaction() else connection.begin():
+            temp_name = "tmp_{}".format(table.name)
+            connection.execute(text('CREATE TEMP TABLE "{tmp}" (LIKE "{tbl}" INCLUDING DEFAULTS) ON COMMIT DROP'.
+                                    format(tmp=temp_name, tbl=table.name)))
+            _copy(connection, temp_name, columns, rows)
+            temp_table = sql_table(temp_name, *[sql_column(col) for col in columns])
+            stmt = postgresql.insert(table).from_select(columns, select([temp_table.c[col] for col in columns]))
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(index_elements=conflict_columns,
+                                                  set_={col: stmt.excluded[col] for col in update_columns})
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+            connection.execute(stmt)
+            connection.execute(text('DROP TABLE "{}"'.format(temp_name)))
+        return len(rows)
+
+    quoted = ['"{}"'.format(col) for col in columns]
+    sql = 'INSERT INTO "{tbl}" ({cols}) VALUES ({params}) ON CONFLICT ({conflict}) DO '.format(
+        tbl=table.name, cols=", ".join(quoted), params=", ".join(":{}".format(col) for col in columns),
+        conflict=", ".join('"{}"'.format(col) for col in conflict_columns))
+    if update_columns:
+        sql += "UPDATE SET {}".format(", ".join('"{0}" = excluded."{0}"'.format(col) for col in update_columns))
+    else:
+        sql += "NOTHING"
+    # Bind the column types so values are stored exactly as SQLalchemy stores them elsewhere (i.e. datetimes)
+    statement = text(sql).bindparams(*[bindparam(col, type_=table.c[col].type) for col in columns])
+    connection.execute(statement, rows)
+    return len(rows)
+
+
+def _copy(connection, tbl_name, columns, rows):
+    """COPY rows into tbl_name through the raw psycopg2 cursor underlying connection and return the row count."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([NULL_MARKER if row[col] is None else row[col] for col in columns])
+    buffer.seek(0)
+    sql = "COPY \"{}\" ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+        tbl_name, ", ".join('"{}"'.format(col) for col in columns), NULL_MARKER)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """SQLalchemy listener function to allow foreign keys in SQLite. Connections to other backends are left as is."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+# datatotable issues its SQLite PRAGMA on every engine, which fails on other backends. Swap in the backend aware listener
+if event.contains(Engine, "connect", datatotable_database.set_sqlite_pragma):
+    event.remove(Engine, "connect", datatotable_database.set_sqlite_pragma)
+if not event.contains(Engine, "connect", set_sqlite_pragma):
+    event.listen(Engine, "connect", set_sqlite_pragma)
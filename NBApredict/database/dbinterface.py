@@ -5,14 +5,14 @@ ToDo: Remove
 
 import os
 from sqlalchemy import Column, Integer, Table
-from sqlalchemy import create_engine, MetaData, event
-from sqlalchemy.engine import Engine
+from sqlalchemy import MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import mapper, clear_mappers
 from sqlalchemy.ext.automap import automap_base
 
 # Local Imports
 from nbapredict.configuration import Config
+from nbapredict.database import backend
 
 
 class DBInterface:
@@ -42,7 +42,7 @@ class DBInterface:
             self.path = Config.get_property("database")
         else:
             self.path = url
-        self.engine = create_engine(self.path, pool_pre_ping=True)
+        self.engine = backend.engine(self.path)
         self.metadata = MetaData(self.engine)
         self.Base = declarative_base()
 
@@ -163,10 +163,3 @@ class DBInterface:
         drop_tbls.drop()
         self.metadata = MetaData(bind=self.engine)  # Updates the metadata to reflect changes
 
-
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    """SQLalchemy listener function to allow foreign keys in SQLite"""
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
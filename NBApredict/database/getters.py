@@ -3,8 +3,13 @@ getters contains functions which may be commonly used to get certain subsets of
 summaries
 """
 
-from datetime import timedelta
+from datetime import date, datetime, timedelta
+import numpy as np
 import pandas as pd
+from sqlalchemy import select
+
+# NumPy dtypes for the python types of SQLalchemy column types. Types not listed here are read into object arrays
+NUMPY_TYPES = {int: "i8", float: "f8", bool: "?", datetime: "datetime64[us]", date: "datetime64[D]"}
 
 
 def get_games_on_day(schedule, session, date):
@@ -61,8 +66,96 @@ def get_pandas_df_from_table(database, session, tbl_name, qualifiers=False):
         qualifiers: A list of columns or a function to filter rows by
     """
     tbl = database.get_table_mappings(tbl_name)
+    if isinstance(qualifiers, list):
+        # Push the column selection down to the database rather than reading every column
+        return read_columns(session, tbl, qualifiers, fmt="pandas")
     query = session.query(tbl)
     if qualifiers:
         return pd.read_sql(query.statement, query.session.bind)[qualifiers]
     else:
         return pd.read_sql(query.statement, query.session.bind)
+
+
+def read_columns(bind, tbl, columns=None, where=None, order_by=None, fmt="numpy"):
+    """Read the specified columns of the rows in tbl which match where and return them in a columnar format.
+
+    Only the requested columns are selected and the predicates in where are evaluated by the database. No ORM objects
+    are built.
+
+    Args:
+        bind: A SQLalchemy session, connection, or engine
+        tbl: A SQLalchemy Table or mapped table class
+        columns: A list of column names to read. Defaults to every column
+        where: An optional list of SQLalchemy predicates on tbl's columns (i.e. [tbl.c.game_date >= today])
+        order_by: An optional list of column names or SQLalchemy expressions to order the rows by
+        fmt: The return format. One of "numpy" (structured array), "arrow" (pyarrow Table), or "pandas" (DataFrame)
+
+    Returns:
+        The selected rows in the format specified by fmt
+    """
+    table = getattr(tbl, "__table__", tbl)
+    selected = [table.c[col] for col in columns] if columns else list(table.c)
+    statement = select(selected)
+    for predicate in where or []:
+        statement = statement.where(predicate)
+    if order_by:
+        statement = statement.order_by(*[table.c[col] if isinstance(col, str) else col for col in order_by])
+    return read_select(bind, statement, fmt=fmt)
+
+
+def read_select(bind, statement, fmt="numpy"):
+    """Execute a SQLalchemy Core select and return the result in a columnar format.
+
+    Args:
+        bind: A SQLalchemy session, connection, or engine
+        statement: A SQLalchemy Core select statement
+        fmt: The return format. One of "numpy" (structured array), "arrow" (pyarrow Table), or "pandas" (DataFrame)
+    """
+    result = bind.execute(statement)
+    names = list(result.keys())
+    rows = result.fetchall()
+    values = list(zip(*rows)) if rows else [() for _ in names]
+
+    if fmt == "arrow":
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow must be installed to read tables in the arrow format")
+        return pyarrow.table({name: pyarrow.array(list(vals)) for name, vals in zip(names, values)})
+
+    python_types = [_python_type(col) for col in statement.c]
+    arrays = [_column_array(vals, py_type) for vals, py_type in zip(values, python_types)]
+    if fmt == "pandas":
+        return pd.DataFrame(dict(zip(names, arrays)), columns=names)
+    elif fmt == "numpy":
+        structured = np.empty(len(rows), dtype=[(name, arr.dtype) for name, arr in zip(names, arrays)])
+        for name, arr in zip(names, arrays):
+            structured[name] = arr
+        return structured
+    else:
+        raise ValueError("fmt must be 'numpy', 'arrow', or 'pandas'; received {}".format(fmt))
+
+
+def _python_type(column):
+    """Return the python type a SQLalchemy column's values are read as or None if the type does not declare one."""
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _column_array(values, python_type):
+    """Convert a sequence of column values to a NumPy array typed for the column's python type.
+
+    Integer columns which contain nulls are read as floats with NaN. Date and datetime nulls are read as NaT. Other
+    columns with nulls, and columns of other types, are read as object arrays.
+    """
+    dtype = NUMPY_TYPES.get(python_type)
+    if dtype is None:
+        return np.array(values, dtype=object)
+    if any(val is None for val in values):
+        if python_type in (int, float):
+            return np.array([np.nan if val is None else val for val in values], dtype="f8")
+        elif python_type is bool:
+            return np.array(values, dtype=object)
+    return np.array(values, dtype=dtype)
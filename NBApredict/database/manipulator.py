@@ -1,10 +1,16 @@
 """
 manipulator holds the DataOperator class which coerces raw_data into SQLalchemy compatible formats.
-ToDo: Remove
+
+ColumnarOperator offers the same interface as datatotable's DataOperator but stores each column as a typed NumPy array
+with a null mask, so large scraped tables are formatted with array operations rather than lists of Python objects.
+ToDo: Remove DataOperator
 """
-from datetime import datetime
+from datetime import date, datetime
+from itertools import chain
+import numpy as np
+import pandas as pd
 from nbapredict.helpers import type
-from sqlalchemy import Integer, Float, String, DateTime, Boolean
+from sqlalchemy import Integer, Float, String, Date, DateTime, Boolean
 
 
 class DataOperator:
@@ -25,33 +31,40 @@ class DataOperator:
         self.data = data
         self.rows = None
 
-    def get_sql_type(self):
+    def get_sql_type(self, nullable=False):
         """Take the object's data and return a dictionary formatted as {key: SQLtype}.
 
+        Args:
+            nullable: If True, return {key: [SQLtype, {"nullable": bool}]}, the column format accepted by datatotable,
+            where nullable is True if the column holds nulls
+
         Returns:
             A dictionary with the same keys as tbl_dict. The dictionary's values are the sql_types of each key:value
             pair in tbl_dict. The sql_types are defined to function with SQLalchemy as column definitions.
         """
-        py_types = self._get_py_type()  # py_types is a dict
-        sql_types = self._py_type_to_sql_type(py_types)
+        inferred = self._get_py_type()  # inferred is a dict
+        sql_types = self._py_type_to_sql_type({key: val.type for key, val in inferred.items()})
+        if nullable:
+            return {key: [sql_type, {"nullable": inferred[key].nullable}] for key, sql_type in sql_types.items()}
         return sql_types
 
     def _get_py_type(self):
-        """Take the classes data values and return a dictionary that holds the python type for the values.
+        """Take the classes data values and return a dictionary that holds the inferred type of the values.
 
         Returns:
-            A dictionary formatted as key:py_type where the type can be integer, float, string, datetime, or none
+            A dictionary formatted as key:InferredType where the type can be integer, float, string, datetime, date,
+            bool, or none
         """
         py_types_dict = {}
         if isinstance(self.data, dict):
             tbl_keys = list(self.data.keys())
-            py_types = [type.get_type(self.data[key]) for key in tbl_keys]
+            py_types = [type.infer_type(self.data[key]) for key in tbl_keys]
             py_types_dict = dict(zip(tbl_keys, py_types))
         elif isinstance(self.data, list):
             if isinstance(self.data[0], dict):
                 data = self.data[0]
                 tbl_keys = list(data.keys())
-                py_types = [type.get_type(data[key]) for key in tbl_keys]
+                py_types = [type.InferredType(type.get_type(data[key]), data[key] is None) for key in tbl_keys]
                 py_types_dict = dict(zip(tbl_keys, py_types))
             else:
                 raise Exception("The data structure ({}) is not handled by _get_py_type".format(type(self.data)))
@@ -62,7 +75,7 @@ class DataOperator:
         """Convert and return a dictionary of python types to a dictionary of sql types.
 
         Raises:
-            An exception if a py_type is not an integer, float, string, datetime, bool, or none
+            TypeError: If a py_type is not an integer, float, string, datetime, date, bool, or none
 
         To-do:
             * Change the logic into a switch statement
@@ -79,12 +92,14 @@ class DataOperator:
                 sql_types[key] = String
             elif py_type == "datetime" or py_type is datetime:
                 sql_types[key] = DateTime
+            elif py_type == "date" or py_type is date:
+                sql_types[key] = Date
             elif py_type == "bool" or py_type is bool:
                 sql_types[key] = Boolean
             elif py_type is None:
                 continue  # We continue here so as to not create a column for null values
             else:
-                raise Exception("Error: py_type {} is not an integer, float, datetime,"
+                raise TypeError("Error: py_type {} is not an integer, float, datetime,"
                                 " none, or string".format(py_types[key]))
         return sql_types
 
@@ -148,3 +163,241 @@ class DataOperator:
             return True
         else:
             return False
+
+
+class ColumnarOperator:
+    """ColumnarOperator holds data as typed NumPy arrays and null masks and converts it to rows or pandas on demand.
+
+    Integer and bool columns are int64 and bool arrays. Their nulls are stored as 0 or False and flagged in the
+    column's mask. Float columns hold NaN and datetime columns hold NaT for nulls. Datetimes are stored as
+    datetime64[us] wall times with any timezone dropped, which is how the database stores them. Dates are stored as
+    datetime64[D]. Strings and other values are held in object arrays with None for nulls.
+
+    Attributes:
+        data: A Columns dictionary of {column name: array}. Assigned lists or arrays are converted to typed arrays
+    """
+
+    def __init__(self, data):
+        """Convert data to typed arrays
+
+        Args:
+            data: A dictionary of {column name: list or array}, a list of row dictionaries which all have the same
+            keys, or a pandas DataFrame
+        """
+        if isinstance(data, list):
+            keys = list(data[0].keys()) if data else []
+            data = {key: [row[key] for row in data] for key in keys}
+        self.data = Columns()
+        for key in data:
+            self.data[key] = data[key]
+
+    @property
+    def masks(self):
+        """A dictionary of {column name: bool array} flagging nulls, or None for columns without nulls."""
+        return self.data.masks
+
+    def masked(self, key):
+        """Return the column named key as a NumPy masked array.
+
+        Arithmetic on masked arrays carries nulls through, and assigning the result to data keeps them null.
+        """
+        return np.ma.MaskedArray(self.data[key], mask=self.masks[key] if self.masks[key] is not None else False)
+
+    def num_rows(self):
+        """Return the number of rows, which is the length of the longest column."""
+        return max((len(values) for values in self.data.values()), default=0)
+
+    def validate_data_length(self):
+        """Return True if every column has the same length. Otherwise, return False."""
+        return len({len(values) for values in self.data.values()}) <= 1
+
+    def fill(self, key, fill_value):
+        """Extend the column named key to num_rows() with fill_value."""
+        missing = self.num_rows() - len(self.data[key])
+        if missing > 0:
+            self.data[key] = self.tolist(key) + [fill_value] * missing
+
+    @property
+    def columns(self):
+        """Return a dictionary formatted as {key: [SQLtype]} from the dtype of each column."""
+        return self.sql_types()
+
+    def sql_types(self, nullable=False):
+        """Return a dictionary formatted as {key: [SQLtype]} from the dtype of each column.
+
+        Columns which are entirely null are left out, as no type can be inferred for them.
+
+        Args:
+            nullable: If True, return {key: [SQLtype, {"nullable": bool}]} where nullable is True if the column holds
+            nulls
+
+        Raises:
+            TypeError: If a column holds values, such as Decimals or dicts, which have no SQL type
+        """
+        sql_types = dict()
+        for key, values in self.data.items():
+            mask = self.masks[key]
+            if len(values) == 0 or (mask is not None and mask.all()):
+                continue
+            sql_type = _sql_type(values)
+            sql_types[key] = [sql_type, {"nullable": mask is not None}] if nullable else [sql_type]
+        return sql_types
+
+    def batches(self, size=1000):
+        """Yield the data as lists of at most size row dictionaries, compatible with SQLalchemy's insert function.
+
+        Only one batch of Python objects exists at a time.
+        """
+        if not self.validate_data_length():
+            raise ValueError("Every column must have the same length to be converted to rows")
+        keys = list(self.data.keys())
+        for start in range(0, self.num_rows(), size):
+            columns = [self.tolist(key, start, start + size) for key in keys]
+            yield [dict(zip(keys, values)) for values in zip(*columns)]
+
+    @property
+    def rows(self):
+        """Return the data as a list of row dictionaries. Use batches() to avoid building every row at once."""
+        return list(chain.from_iterable(self.batches()))
+
+    @property
+    def dataframe(self):
+        """Return the data as a pandas DataFrame.
+
+        Nullable integer and bool columns become pandas masked arrays built on the stored arrays and masks, so no
+        values are copied for them.
+        """
+        if not self.validate_data_length():
+            raise ValueError("Every column must have the same length to be converted to a DataFrame")
+        columns = {}
+        for key, values in self.data.items():
+            mask = self.masks[key]
+            if mask is not None and values.dtype.kind == "i":
+                columns[key] = pd.arrays.IntegerArray(values, mask)
+            elif mask is not None and values.dtype.kind == "b":
+                columns[key] = pd.arrays.BooleanArray(values, mask)
+            else:
+                columns[key] = values
+        return pd.DataFrame(columns, columns=list(self.data.keys()), copy=False)
+
+    def tolist(self, key, start=None, stop=None):
+        """Return the values of the column named key between start and stop as Python objects with None for nulls."""
+        values = self.data[key][start:stop].tolist()
+        mask = self.masks[key]
+        if mask is None or self.data[key].dtype.kind == "M":  # NaT converts to None
+            return values
+        return [None if null else val for val, null in zip(values, mask[start:stop].tolist())]
+
+
+class Columns(dict):
+    """A dictionary of typed NumPy arrays. Values are converted with to_column() when assigned.
+
+    Attributes:
+        masks: A dictionary of {column name: bool array} flagging nulls, or None for columns without nulls
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.masks = {}
+
+    def __setitem__(self, key, values):
+        array, mask = to_column(values)
+        super().__setitem__(key, array)
+        self.masks[key] = mask
+
+    def pop(self, key, *default):
+        self.masks.pop(key, None)
+        return super().pop(key, *default)
+
+    def __delitem__(self, key):
+        self.masks.pop(key, None)
+        super().__delitem__(key)
+
+
+def to_column(values):
+    """Convert a list or array of values to a typed NumPy array and a null mask.
+
+    Returns:
+        An (array, mask) tuple where mask is a bool array flagging nulls or None if there are no nulls
+    """
+    if isinstance(values, np.ma.MaskedArray):
+        mask = _mask_or_none(np.ma.getmaskarray(values))
+        array, _ = to_column(values.data)
+        if mask is not None and array.dtype.kind in "fM":
+            array = array.copy()
+            array[mask] = np.nan if array.dtype.kind == "f" else np.datetime64("NaT")
+        return array, mask
+    if isinstance(values, (pd.Series, pd.Index)):
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_localize(None) if isinstance(values, pd.Series) else values.tz_localize(None)
+        if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and values.dtype.kind in "iub":
+            # Nullable pandas integers and booleans
+            dtype, fill = ("?", False) if values.dtype.kind == "b" else ("i8", 0)
+            return values.to_numpy(dtype=dtype, na_value=fill), _mask_or_none(values.isna().to_numpy())
+        values = values.to_numpy()
+    if isinstance(values, np.ndarray) and values.dtype.kind != "O":
+        if values.dtype.kind in "iu":
+            return values.astype("i8", copy=False), None
+        if values.dtype.kind == "f":
+            return values, _mask_or_none(np.isnan(values))
+        if values.dtype.kind == "M":
+            unit = "datetime64[D]" if values.dtype == np.dtype("datetime64[D]") else "datetime64[us]"
+            values = values.astype(unit, copy=False)
+            return values, _mask_or_none(np.isnat(values))
+        return values, None
+    return _list_to_column(list(values))
+
+
+def _list_to_column(values):
+    """Convert a list of Python objects to a typed array and a null mask.
+
+    Values of classes infer_type() does not support, such as Decimals or dicts, are kept in an object array. An error
+    is only raised if an SQL type is requested for them.
+    """
+    try:
+        inferred = type.infer_type(values)
+    except TypeError:
+        # fromiter keeps sequences, such as lists or tuples, as single objects rather than a second dimension
+        array = np.fromiter(values, dtype=object, count=len(values))
+        return array, _mask_or_none(np.fromiter((val is None for val in values), dtype=bool, count=len(values)))
+    mask = None
+    if inferred.nullable:
+        mask = np.fromiter((val is None for val in values), dtype=bool, count=len(values))
+    if inferred.type in ("bool", "integer"):
+        dtype, fill = ("?", False) if inferred.type == "bool" else ("i8", 0)
+        if mask is None:
+            return np.array(values, dtype=dtype), None
+        return np.array([fill if val is None else val for val in values], dtype=dtype), mask
+    elif inferred.type == "float":
+        return np.array([np.nan if val is None else val for val in values], dtype="f8"), mask
+    elif inferred.type == "datetime":
+        wall_times = [val.replace(tzinfo=None) if isinstance(val, datetime) else val for val in values]
+        return np.array(wall_times, dtype="datetime64[us]"), mask
+    elif inferred.type == "date":
+        return np.array(values, dtype="datetime64[D]"), mask
+    return np.array(values, dtype=object), mask
+
+
+def _mask_or_none(mask):
+    """Return mask if it flags any nulls. Otherwise, return None."""
+    return mask if mask.any() else None
+
+
+def _sql_type(values):
+    """Return the SQLalchemy type for an array from to_column(). Raise a TypeError if the values are not a supported
+    type."""
+    kind = values.dtype.kind
+    if kind == "b":
+        return Boolean
+    elif kind in "iu":
+        return Integer
+    elif kind == "f":
+        return Float
+    elif kind == "M":
+        return Date if values.dtype == np.dtype("datetime64[D]") else DateTime
+    elif kind in "US":
+        return String
+    inferred = type.infer_type(values).type  # Raises a TypeError for unsupported classes
+    if inferred == "string":
+        return String
+    raise TypeError("Values of type {} have no SQL type".format(inferred))
@@ -1,36 +1,44 @@
 """
-At the moment, reconcile contains one function which "reconciles" primary and reference tables for a specific column.
-ToDo: Remove
+reconcile contains a function which "reconciles" columns of a change table with the same columns of a reference table.
+
+The reconciliation is set based. One UPDATE statement copies every differing value in the database, so the Python
+side does the same work no matter how many rows the tables hold.
 """
 
+from sqlalchemy import and_, exists, or_, select
+
 
-def reconcile(ref_tbl, change_tbl, column, ref_key, change_key, session):
-    """Compare the specified column over the two tables and change change_tbl values to ref_tbl values
+def reconcile(ref_tbl, change_tbl, columns, ref_key, change_key, session):
+    """Compare the specified columns over the two tables and change change_tbl values to ref_tbl values
 
-    Note that the change and reference tables must be related by a foreign key.
+    Note that the change and reference tables must be related by a foreign key. On PostgreSQL, a single UPDATE ... FROM
+    is emitted. Other backends use a single UPDATE with correlated subqueries. Only rows where at least one column
+    differs, with nulls compared as values, are updated. The update joins the session's transaction. Objects of
+    change_tbl already loaded in the session are not refreshed.
 
     Args:
         ref_tbl: The reference table which contains the values to be changed in change_tbl
         change_tbl: The table to be changed with values from reference table
-        column: The column to evaluate for changes. Column must be present in both tables.
+        columns: The column, or list of columns, to evaluate for changes. Columns must be present in both tables.
         ref_key: The key in the reference table to join the tables by
         change_key: The key in the change table to join the tables by
         session: An instance of a sqlalchemy Session class bound to the database's engine
 
-    To-do:
-        Figure out how to run with multiple columns
+    Returns:
+        The number of rows updated in change_tbl
     """
-    join_objs = session.query(ref_tbl, change_tbl).join().\
-        filter(getattr(ref_tbl, ref_key) == getattr(change_tbl, change_key)).all()
-
-    changed_objs = []
-    for obj in join_objs:
-        ref_obj = obj[0]
-        change_obj = obj[1]
-        ref_val = getattr(ref_obj, column)
-        change_val = getattr(change_obj, column)
-        if ref_val != change_val:
-            setattr(change_obj, column, ref_val)
-            session.add(change_obj)
-
-    return
+    if isinstance(columns, str):
+        columns = [columns]
+    ref = getattr(ref_tbl, "__table__", ref_tbl)
+    change = getattr(change_tbl, "__table__", change_tbl)
+    joined = ref.c[ref_key] == change.c[change_key]
+    differs = or_(*[ref.c[col].is_distinct_from(change.c[col]) for col in columns])
+
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        # PostgreSQL renders an UPDATE which references another table as UPDATE ... FROM
+        stmt = change.update().values({col: ref.c[col] for col in columns}).where(and_(joined, differs))
+    else:
+        values = {col: select([ref.c[col]]).where(joined).limit(1).as_scalar() for col in columns}
+        stmt = change.update().values(values).where(exists().where(and_(joined, differs)))
+    return connection.execute(stmt).rowcount
@@ -0,0 +1,127 @@
+"""
+transaction holds the UnitOfWork class which groups the writes of a multi-stage process, such as the ETL, into atomic
+units.
+
+With unit='run', every stage shares one transaction that is committed when the unit of work exits and rolled back if
+any stage raises. With unit='stage', each stage is committed as soon as it finishes. In either mode, a stage marked
+recoverable runs inside a savepoint. If a recoverable stage raises, only its own writes are rolled back and the
+remaining stages continue.
+
+Example:
+    with UnitOfWork(session, unit="run") as uow:
+        with uow.stage("schedule"):
+            ...
+        with uow.stage("odds", recoverable=True):
+            ...
+"""
+
+from contextlib import contextmanager
+from sqlalchemy import event
+
+UNITS = ("run", "stage")
+
+
+class UnitOfWork:
+    """UnitOfWork commits or rolls back the session's writes in units of a whole run or of individual stages.
+
+    Attributes:
+        session: The SQLalchemy session whose writes are managed
+        unit: 'run' to commit all stages together or 'stage' to commit each stage as it finishes
+        completed: The names of the stages which finished
+        failed: A dictionary of {stage name: exception} for recoverable stages which were rolled back
+    """
+
+    def __init__(self, session, unit="run"):
+        """Store the session and the unit of commits
+
+        Args:
+            session: A SQLalchemy session
+            unit: 'run' or 'stage'
+        """
+        if unit not in UNITS:
+            raise ValueError("unit must be one of {}; received {}".format(UNITS, unit))
+        self.session = session
+        self.unit = unit
+        self.completed = []
+        self.failed = {}
+        self._savepoints = []  # The names of the recoverable stages whose savepoints are open
+        if session.bind is not None:
+            enable_sqlite_savepoints(session.bind)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Commit the outstanding writes if no exception was raised. Otherwise, roll them back and re-raise."""
+        if exc_type is None:
+            self.session.commit()
+        else:
+            self.session.rollback()
+        return False
+
+    @contextmanager
+    def stage(self, name, recoverable=False):
+        """Run the body of the with statement as a named stage of the unit of work.
+
+        Args:
+            name: The name of the stage
+            recoverable: If True, the stage runs in a savepoint, and an exception rolls back the savepoint and is
+            recorded in failed rather than raised
+        """
+        savepoint = self.session.begin_nested() if recoverable else None
+        if recoverable:
+            self._savepoints.append(name)
+        try:
+            yield self
+        except Exception as exc:
+            if not recoverable:
+                raise
+            if savepoint.is_active:  # A closed savepoint has nothing to roll back, and rolling it back would raise
+                savepoint.rollback()
+            self.failed[name] = exc
+            return
+        finally:
+            if recoverable:
+                self._savepoints.remove(name)
+        if savepoint is not None:
+            savepoint.commit()  # Releases the savepoint. Writes remain in the enclosing transaction
+        if self.unit == "stage":
+            self.session.commit()
+        self.completed.append(name)
+
+    def checkpoint(self):
+        """Commit the writes made so far.
+
+        Table creation runs on a separate connection. SQLite cannot run it while the session holds the write lock, so
+        call checkpoint() before creating tables. Writes committed by a checkpoint are not rolled back by a later failure.
+
+        Inside a recoverable stage, a commit would only release the stage's savepoint and the enclosing transaction
+        would keep the write lock, so checkpoint() raises a RuntimeError there. Create tables before the stage instead.
+        """
+        if self._savepoints:
+            raise RuntimeError("checkpoint() cannot commit inside the recoverable stage '{}'. Create tables before "
+                               "entering the stage".format(self._savepoints[-1]))
+        self.session.commit()
+
+
+def enable_sqlite_savepoints(engine):
+    """Let SQLalchemy, rather than pysqlite, begin transactions on SQLite engines so savepoints nest correctly.
+
+    pysqlite defers BEGIN until the first INSERT, UPDATE, or DELETE. A SAVEPOINT issued before then starts its own
+    transaction, and rolling back the enclosing transaction does not undo it. This applies the workaround from the
+    SQLalchemy SQLite dialect documentation. Engines for other backends are left as is.
+    """
+    if engine.dialect.name != "sqlite" or event.contains(engine, "begin", _emit_begin):
+        return
+    event.listen(engine, "connect", _disable_pysqlite_transactions)
+    event.listen(engine, "begin", _emit_begin)
+
+
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    """Stop pysqlite from emitting BEGIN itself."""
+    dbapi_connection.isolation_level = None
+
+
+def _emit_begin(connection):
+    """Emit BEGIN when SQLalchemy begins a transaction."""
+    connection.execute("BEGIN")
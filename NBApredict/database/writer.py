@@ -0,0 +1,265 @@
+"""
+writer holds the WriteCoordinator class which funnels every database write through a single writer thread.
+
+SQLite allows one writer at a time. When scraping, line polling, and prediction each open a session and commit whenever
+they like, they contend for the database lock. Instead, workers submit write intents to the coordinator and only read
+from the database themselves. The coordinator drains its queue, groups intents into one transaction, and commits them
+together. The queue is bounded, so producers block once the writer falls behind.
+
+The queue may be a queue.Queue for threads in one process or a multiprocessing.Queue shared with other processes.
+Intents put on the queue by other processes are applied in the same way, but only submit() returns a Future which
+resolves when the intent is committed.
+
+Writes which need reads between them or their own transaction, such as an ETL run, are submitted as a function with
+call(). The function runs on the writer thread between the other intents, so it never writes concurrently with them.
+
+Example:
+    coordinator = WriteCoordinator(db.engine)
+    coordinator.start()
+    coordinator.submit("odds_2020", "insert", odds_data.rows).result()  # Wait for the commit
+    coordinator.call(etl.load, db, etl.extract()).result()
+    coordinator.stop()
+"""
+
+from collections import namedtuple
+from concurrent.futures import Future
+import itertools
+import queue
+import threading
+import time
+from sqlalchemy import MetaData, and_, bindparam
+
+# Local Imports
+from nbapredict.database import backend
+
+# A write for the coordinator. operation is one of OPERATIONS or 'call'. keys are the columns which identify rows for
+# updates, upserts, and deletes. For 'call' intents, rows holds the function and its arguments. intent_id links the
+# intent to the Future returned by submit() or call() and is None for external intents.
+WriteIntent = namedtuple("WriteIntent", ["tbl_name", "operation", "rows", "keys", "intent_id"])
+OPERATIONS = ("insert", "upsert", "update", "delete")
+_STOP = "stop"  # Sentinel put on the queue to stop the writer
+
+
+class WriteCoordinator:
+    """WriteCoordinator owns the only write connection to a database and commits queued intents in grouped transactions.
+
+    Attributes:
+        engine: SQLalchemy engine for the database
+        queue: The queue of WriteIntents. Bounded by max_pending to apply backpressure to producers
+        batch_size: The number of rows after which a group of intents is committed
+        max_wait: Seconds to wait for more intents before committing a partial group
+        commits: The number of transactions the coordinator committed. Commits made by call() functions are not counted
+        rows_written: The number of rows written
+    """
+
+    def __init__(self, engine, write_queue=None, batch_size=1000, max_wait=0.25, max_pending=100):
+        """Store the engine and queue. The writer thread does not run until start() is called.
+
+        Args:
+            engine: SQLalchemy engine for the database
+            write_queue: An optional queue.Queue or multiprocessing.Queue to consume intents from. Defaults to a
+            queue.Queue holding at most max_pending intents
+            batch_size: The number of rows after which a group of intents is committed
+            max_wait: Seconds to wait for more intents before committing a partial group
+            max_pending: The maximum number of intents held in the default queue
+        """
+        self.engine = engine
+        self.queue = write_queue if write_queue is not None else queue.Queue(maxsize=max_pending)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.commits = 0
+        self.rows_written = 0
+        self._metadata = MetaData()
+        self._futures = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """Start the writer thread. On SQLite, switch the database to WAL mode so readers do not block the writer."""
+        if self.engine.dialect.name == "sqlite":
+            with self.engine.connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+        self._thread = threading.Thread(target=self._run, name="write-coordinator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Commit every intent already queued, then stop the writer thread.
+
+        Intents submitted after stop() raise a RuntimeError, and the Futures of any which reached the queue regardless
+        are resolved with one.
+        """
+        with self._lock:
+            self._stopped = True
+        self.queue.put(_STOP)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, tbl_name, operation, rows, keys=None, timeout=None):
+        """Queue a write and return a Future which resolves to the number of rows written once it is committed.
+
+        Blocks while the queue is full. Raises queue.Full if timeout elapses first, and a RuntimeError if the
+        coordinator is stopped.
+
+        Args:
+            tbl_name: The name of the table to write to
+            operation: One of 'insert', 'upsert', 'update', or 'delete'
+            rows: A list of dictionaries with column names as keys
+            keys: The columns which identify a row. Required for 'upsert', 'update', and 'delete'
+            timeout: Optional seconds to wait for space in the queue
+        """
+        if operation not in OPERATIONS:
+            raise ValueError("operation must be one of {}; received {}".format(OPERATIONS, operation))
+        if operation != "insert" and not keys:
+            raise ValueError("keys must be specified for '{}' writes".format(operation))
+        return self._queue(lambda intent_id: WriteIntent(tbl_name, operation, list(rows), keys, intent_id), timeout)
+
+    def call(self, function, *args, timeout=None, **kwargs):
+        """Queue function(*args, **kwargs) to run on the writer thread and return a Future which resolves to its result.
+
+        The intents queued before the function are committed before it runs, and those queued after it wait until it
+        returns. The function manages its own session and transaction, i.e. an ETL UnitOfWork, and must commit its own
+        writes. Blocks while the queue is full. Raises queue.Full if timeout elapses first, and a RuntimeError if the
+        coordinator is stopped.
+
+        Args:
+            function: The function to run
+            args: Positional arguments of function
+            timeout: Optional seconds to wait for space in the queue
+            kwargs: Keyword arguments of function
+        """
+        return self._queue(lambda intent_id: WriteIntent(None, "call", (function, args, kwargs), None, intent_id),
+                           timeout)
+
+    def _queue(self, make_intent, timeout):
+        """Attach a Future to the intent returned by make_intent(intent_id), put the intent on the queue, and return
+        the Future. The Future is discarded if the intent cannot be queued.
+        """
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("The write coordinator is stopped")
+            intent_id = next(self._ids)
+            self._futures[intent_id] = future
+        try:
+            self.queue.put(make_intent(intent_id), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._futures.pop(intent_id, None)
+            raise
+        return future
+
+    def _run(self):
+        """Consume intents from the queue, grouping them until batch_size rows or max_wait seconds are reached.
+
+        A 'call' intent ends the group being collected, and runs after the group is committed."""
+        stopping = False
+        pending = None
+        while not stopping:
+            intent = pending if pending is not None else self.queue.get()
+            pending = None
+            if intent == _STOP:
+                break
+            intent = WriteIntent(*intent)  # Intents from other processes may arrive as plain tuples
+            if intent.operation == "call":
+                self._call(intent)
+                continue
+            group = [intent]
+            rows = len(intent.rows)
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.batch_size:
+                try:
+                    intent = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if intent == _STOP:
+                    stopping = True
+                    break
+                intent = WriteIntent(*intent)
+                if intent.operation == "call":
+                    pending = intent
+                    break
+                group.append(intent)
+                rows += len(intent.rows)
+            self._commit(group)
+        self._fail_pending()
+
+    def _commit(self, group):
+        """Apply a group of intents in one transaction. If the transaction fails, apply each intent on its own so one
+        bad intent does not discard the others."""
+        try:
+            with self.engine.begin() as connection:
+                counts = [self._apply(connection, intent) for intent in group]
+        except Exception as exc:
+            if len(group) == 1:
+                self._resolve(group[0], exception=exc)
+                return
+            for intent in group:
+                self._commit([intent])
+            return
+        self.commits += 1
+        self.rows_written += sum(counts)
+        for intent, count in zip(group, counts):
+            self._resolve(intent, count)
+
+    def _call(self, intent):
+        """Run the function of a 'call' intent and resolve its Future with the function's result or exception."""
+        function, args, kwargs = intent.rows
+        try:
+            result = function(*args, **kwargs)
+        except Exception as exc:
+            self._resolve(intent, exception=exc)
+            return
+        self._resolve(intent, result)  # The function commits its own writes, so they are not counted in commits
+
+    def _fail_pending(self):
+        """Resolve the Futures of intents left on the queue, or never queued, after stopping with a RuntimeError."""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(RuntimeError("The write coordinator stopped before the intent was written"))
+
+    def _apply(self, connection, intent):
+        """Execute a single intent on connection and return the number of rows written."""
+        table = self._table(intent.tbl_name)
+        rows = intent.rows
+        if not rows:
+            return 0
+        if intent.operation == "insert":
+            count = backend.bulk_insert(connection, table, rows)
+        elif intent.operation == "upsert":
+            count = backend.upsert(connection, table, rows, intent.keys)
+        else:
+            # Key values are bound under a prefix so they do not collide with the values being set
+            key_match = and_(*[table.c[key] == bindparam("key_{}".format(key)) for key in intent.keys])
+            params = [dict(row, **{"key_{}".format(key): row[key] for key in intent.keys}) for row in rows]
+            if intent.operation == "update":
+                values = {col: bindparam(col) for col in rows[0] if col not in intent.keys}
+                connection.execute(table.update().where(key_match).values(values), params)
+            else:
+                connection.execute(table.delete().where(key_match), params)
+            count = len(rows)
+        return count
+
+    def _table(self, tbl_name):
+        """Return the reflected table named tbl_name, reflecting it on first use."""
+        if tbl_name not in self._metadata.tables:
+            self._metadata.reflect(bind=self.engine, only=[tbl_name])
+        return self._metadata.tables[tbl_name]
+
+    def _resolve(self, intent, count=None, exception=None):
+        """Resolve the Future attached to intent, if any, with count, or a call's result, or exception."""
+        with self._lock:
+            future = self._futures.pop(intent.intent_id, None)
+        if future is None:
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(count)
@@ -169,6 +169,40 @@ team_to_team_abbreviation = {
     "VANCOUVER GRIZZLIES": "VAN"
 }
 
+team_to_conference = {  # Conferences of the current teams
+    "ATLANTA HAWKS": "EAST",
+    "BOSTON CELTICS": "EAST",
+    "BROOKLYN NETS": "EAST",
+    "CHARLOTTE HORNETS": "EAST",
+    "CHICAGO BULLS": "EAST",
+    "CLEVELAND CAVALIERS": "EAST",
+    "DETROIT PISTONS": "EAST",
+    "INDIANA PACERS": "EAST",
+    "MIAMI HEAT": "EAST",
+    "MILWAUKEE BUCKS": "EAST",
+    "NEW YORK KNICKS": "EAST",
+    "ORLANDO MAGIC": "EAST",
+    "PHILADELPHIA 76ERS": "EAST",
+    "TORONTO RAPTORS": "EAST",
+    "WASHINGTON WIZARDS": "EAST",
+
+    "DALLAS MAVERICKS": "WEST",
+    "DENVER NUGGETS": "WEST",
+    "GOLDEN STATE WARRIORS": "WEST",
+    "HOUSTON ROCKETS": "WEST",
+    "LOS ANGELES CLIPPERS": "WEST",
+    "LOS ANGELES LAKERS": "WEST",
+    "MEMPHIS GRIZZLIES": "WEST",
+    "MINNESOTA TIMBERWOLVES": "WEST",
+    "NEW ORLEANS PELICANS": "WEST",
+    "OKLAHOMA CITY THUNDER": "WEST",
+    "PHOENIX SUNS": "WEST",
+    "PORTLAND TRAIL BLAZERS": "WEST",
+    "SACRAMENTO KINGS": "WEST",
+    "SAN ANTONIO SPURS": "WEST",
+    "UTAH JAZZ": "WEST"
+}
+
 POSITION_ABBREVIATIONS_TO_POSITION = {
     "PG": Position.POINT_GUARD,
     "SG": Position.SHOOTING_GUARD,
@@ -0,0 +1,39 @@
+"""
+Contains functions which hash row contents so changes can be detected without comparing every column
+"""
+
+from datetime import date, datetime
+import hashlib
+
+
+def content_hash(values):
+    """Return a 16 character hex digest of a sequence of values.
+
+    Values are normalized before hashing so equal values read from the database, a scraper, or pandas hash the same.
+    Timezones are dropped from datetimes, which are stored as wall times. NumPy and pandas scalars are converted to
+    their python equivalents.
+
+    Args:
+        values: A list or tuple of values
+    """
+    text = "|".join(_normalize(val) for val in values)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize(val):
+    """Return a canonical string for val."""
+    if val is None:
+        return ""
+    if hasattr(val, "to_pydatetime"):  # pandas Timestamp
+        val = val.to_pydatetime()
+    elif hasattr(val, "item"):  # NumPy scalar
+        val = val.item()
+    if isinstance(val, datetime):
+        return val.replace(tzinfo=None).isoformat(sep=" ")
+    if isinstance(val, date):
+        return val.isoformat()
+    if isinstance(val, float) and val.is_integer():
+        return str(int(val))
+    if isinstance(val, float) and val != val:  # NaN
+        return ""
+    return str(val)
@@ -2,9 +2,22 @@
 Contains type checks and type conversion functions
 """
 
-from datetime import datetime
+from collections import namedtuple
+from datetime import date, datetime
 from enum import Enum
 import os
+import numpy as np
+
+# The number of evenly spaced values inspected to choose a candidate type for a list
+SAMPLE_SIZE = 64
+
+# An inferred type name, one of TYPE_NAMES or None, and whether the values include nulls
+InferredType = namedtuple("InferredType", ["type", "nullable"])
+TYPE_NAMES = ("integer", "float", "bool", "datetime", "date", "string")
+
+# Type names for NumPy dtype kinds
+DTYPE_KINDS = {"i": "integer", "u": "integer", "f": "float", "b": "bool", "M": "datetime", "U": "string",
+               "S": "string"}
 
 
 def set_type(values):
@@ -53,28 +66,114 @@ def _set_type(values, new_type):
 
 
 def get_type(values):
-    """Return the type of the values where type is defined as the modal type in the list.
+    """Return the type of the values as inferred by infer_type().
 
     Args:
-        values: A list or value to get the type for.
+        values: A list, array, or value to get the type for.
 
     Returns:
-        The modal type of a list or the type of the element. Can be integer, float, string, datetime, or none
-
-    To-Do:
-        Modal type isn't a full proof method. Need to determine a better method.
+        The type of a list or array or the type of the element. Can be integer, float, bool, datetime, date, string,
+        or none
     """
-    if hasattr(values, "__len__") and (type(values) != type):  # Checks if the object is iterable
-        val_types = []
-        for i in values:
-            val_types.append(_get_type(i))
-        return max(set(val_types), key=val_types.count)  # The max, set, and key combo returns the modal type
+    if hasattr(values, "__len__") and (type(values) != type) and not isinstance(values, str):
+        return infer_type(values).type
     elif isinstance(values, Enum):  # For enum objects, pass the value to the get_type function (right choice? IDK)
         return _get_type(values.value)
     else:
         return _get_type(values)
 
 
+def infer_type(values, sample_size=SAMPLE_SIZE, confirm=True):
+    """Infer the type of the values in a list or array and whether they include nulls.
+
+    Arrays and pandas Series are typed by their dtype. For lists, a candidate type is chosen from an evenly spaced
+    sample of at most sample_size values. A confirmation pass then collects the distinct classes of every value in one
+    pass of map(), which runs in C, and the candidate is kept if every class fits it. Otherwise, the type is resolved
+    from all of the classes. Integers and floats resolve to float, dates and datetimes resolve to datetime, and any
+    other mix resolves to string.
+
+    Args:
+        values: A list, array, or pandas Series
+        sample_size: The maximum number of values sampled to choose a candidate type
+        confirm: If False, skip the confirmation pass and return the type of the sample
+
+    Returns:
+        An InferredType namedtuple of (type, nullable). type is None if every value is null
+
+    Raises:
+        TypeError: If a value is not an int, float, datetime, date, string, bool, or None
+    """
+    dtype = getattr(values, "dtype", None)
+    if dtype is not None and dtype.kind != "O":
+        return _infer_dtype(values, dtype)
+
+    sample = values[::max(len(values) // sample_size, 1)]
+    candidate = _resolve({_class_type(cls) for cls in set(map(type, sample))})
+    if not confirm:
+        return candidate
+    classes = set(map(type, values))
+    nullable = type(None) in classes
+    if candidate.type is not None and all(_class_type(cls) in (candidate.type, None) for cls in classes):
+        return InferredType(candidate.type, nullable)
+    return _resolve({_class_type(cls) for cls in classes})
+
+
+def _infer_dtype(values, dtype):
+    """Return the InferredType of an array or Series from its dtype. Nulls are found with vectorized checks."""
+    if dtype.kind == "M":
+        name = "date" if dtype == np.dtype("datetime64[D]") else "datetime"
+    else:
+        name = DTYPE_KINDS.get(dtype.kind)
+        if name is None and str(dtype).startswith("datetime64"):  # pandas timezone aware datetimes
+            name = "datetime"
+    if hasattr(values, "isna"):
+        nullable = bool(values.isna().any())
+    elif dtype.kind == "f":
+        nullable = bool(np.isnan(values).any())
+    elif dtype.kind == "M":
+        nullable = bool(np.isnat(values).any())
+    else:
+        nullable = False
+    return InferredType(name, nullable)
+
+
+def _class_type(cls):
+    """Return the type name for values of the class cls. Raise a TypeError for unsupported classes."""
+    if cls is type(None):
+        return None
+    elif issubclass(cls, (bool, np.bool_)):  # Checked before int as bool is a subclass of int
+        return "bool"
+    elif issubclass(cls, (int, np.integer)):
+        return "integer"
+    elif issubclass(cls, (float, np.floating)):
+        return "float"
+    elif issubclass(cls, datetime):
+        return "datetime"
+    elif issubclass(cls, date):
+        return "date"
+    elif issubclass(cls, str):
+        return "string"
+    else:
+        raise TypeError("{} values are not an int, float, datetime, date, string, Bool, or None".format(cls.__name__))
+
+
+def _resolve(type_names):
+    """Return the InferredType which holds values of every type name in type_names."""
+    nullable = None in type_names
+    type_names = type_names - {None}
+    if not type_names:
+        return InferredType(None, nullable)
+    if len(type_names) == 1:
+        return InferredType(type_names.pop(), nullable)
+    if type_names <= {"bool", "integer"}:
+        return InferredType("integer", nullable)
+    if type_names <= {"bool", "integer", "float"}:
+        return InferredType("float", nullable)
+    if type_names <= {"date", "datetime"}:
+        return InferredType("datetime", nullable)
+    return InferredType("string", nullable)
+
+
 def _get_type(val):
     """Return the type of the value if it is a int, float, or datetime. Otherwise, return a string.
 
@@ -83,24 +182,26 @@ def _get_type(val):
     Returns:
         The type of the value passed into the function if it is an int, float, datetime, or string
     Raise:
-        Exception: An exception raised if the val is not int, float, datetime, or string.
+        TypeError: An exception raised if the val is not int, float, datetime, or string.
     """
-    if isinstance(val, int):
+    if isinstance(val, bool):  # Checked before int as bool is a subclass of int
+        return "bool"
+    elif isinstance(val, int):
         return "integer"
     elif isinstance(val, float):
         return "float"
     elif isinstance(val, datetime):
         return "datetime"
+    elif isinstance(val, date):
+        return "date"
     elif isinstance(val, str):
         return "string"
-    elif isinstance(val, bool):
-        return "bool"
     elif val is None:
         return None
     elif is_python_type(val):  # Handles types that are passed explicitly
         return val
     else:
-        raise Exception("Val is not an int, float, datetime, string, Bool, or None")
+        raise TypeError("Val is not an int, float, datetime, string, Bool, or None")
 
 
 def is_int(x):
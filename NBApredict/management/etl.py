@@ -5,105 +5,196 @@ Main() calls the necessary ETL functions from scrapers and management.tables for
 Tables:
     teams
     schedule
+    schedule_changes
     odds
     team_stats
+    team_stats_latest
 """
 
 from datetime import datetime
-from datatotable.database import Database
 from datatotable.data import DataOperator
 from nbapredict.configuration import Config
+from nbapredict.database import backend
+from nbapredict.database.manipulator import ColumnarOperator
+from nbapredict.database.transaction import UnitOfWork
+from nbapredict.database.writer import WriteCoordinator
 import nbapredict.management
 import nbapredict.management.conversion as convert
-from nbapredict.management.tables import teams, team_stats, odds, schedule
+from nbapredict.management import migrations
+from nbapredict.management.tables import teams, team_stats, odds, schedule, schedule_changes
 from nbapredict.scrapers import team_scraper, line_scraper, season_scraper
 
 
-def main(db):
+def extract():
+    """Scrape teams and team stats, the schedule, and odds and return them in a dictionary.
+
+    Scraping only reads from the web, so it can run while another process or thread writes to the database. Odds are
+    recoverable, so if the odds scrape fails, its exception is returned in place of the odds and only fails the odds
+    stages of load().
+    """
+    try:
+        odds_dict = line_scraper.scrape()
+    except Exception as exc:
+        odds_dict = exc
+    return {"teams": team_scraper.scrape(), "schedule": season_scraper.scrape(), "odds": odds_dict}
+
+
+def load(db, scraped, unit=None):
+    """Format and load scraped teams, team stats, the schedule, and odds for the league year.
+
+    Writes are grouped by a UnitOfWork. With unit='run', the whole ETL run is committed at once and a failure rolls
+    every stage back. With unit='stage', each stage is committed as it finishes. Odds stages are recoverable: if they
+    fail, their writes are rolled back to a savepoint and the remaining stages are still committed. Tables are created
+    on a separate connection, so any pending writes are committed before a table is created, and tables are never
+    created inside a recoverable stage.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        scraped: A dictionary of scraped data from extract()
+        unit: 'run' or 'stage'. Defaults to the 'transaction_unit' setting
+
+    Returns:
+        The UnitOfWork of the load
+    """
     year = Config.get_property("league_year")
+    unit = unit or Config.get_property("transaction_unit")
+    migrations.migrate(db)  # Bring tables from earlier releases up to date before the session holds any locks
     session = nbapredict.management.Session(bind=db.engine)
+    uow = UnitOfWork(session, unit=unit)
+
+    with uow:
+        # ~~~~~~~~~~~~~
+        # Teams
+        # ~~~~~~~~~~~~~
+        with uow.stage("teams"):
+            team_dict = scraped["teams"]
+            teams_data = DataOperator({"team_name": team_dict["team_name"]})
+            teams_tbl_name = "teams_{}".format(year)
+            if not db.table_exists(teams_tbl_name):
+                uow.checkpoint()
+                teams.create_team_table(db=db, teams_data=teams_data, tbl_name=teams_tbl_name)
+                teams_tbl = db.table_mappings[teams_tbl_name]
+                session.add_all([teams_tbl(**row) for row in teams_data.rows])
+                del teams_tbl
+
+        # ~~~~~~~~~~~~~
+        # Team Stats
+        # ~~~~~~~~~~~~~
+        with uow.stage("team_stats"):
+            team_stats_tbl_name = "team_stats_{}".format(year)
+            teams_tbl = db.table_mappings[teams_tbl_name]
+            team_dict['team_id'] = team_dict.pop('team_name')
+            team_dict['team_id'] = convert.values_to_foreign_key(session=session, foreign_tbl=teams_tbl,
+                                                                 foreign_key="id", foreign_value="team_name",
+                                                                 child_data=team_dict['team_id'])
+            # When team_stats_tbl is created, the teams_tbl automap object is changed. The changed format does not
+            # follow the expected behavior of an automapped table. I suspect this is because a relationship is
+            # established. If we reloaded, teams_tbl works fine. Therefore, delete the variable here for now
+            del teams_tbl
+            team_dict['scrape_date'] = [datetime.date(s_time) for s_time in team_dict['scrape_time']]
+            team_stats_data = team_stats.format_data(DataOperator(team_dict))
+            latest_tbl_name = "team_stats_latest_{}".format(year)
+            if not db.table_exists(team_stats_tbl_name):
+                uow.checkpoint()
+                team_stats.create_table(db=db, team_stats_data=team_stats_data, tbl_name=team_stats_tbl_name)
+            latest_created = not db.table_exists(latest_tbl_name)
+            if latest_created:
+                uow.checkpoint()
+                team_stats.create_latest_table(db, team_stats_data, latest_tbl_name, team_stats_tbl_name)
+            team_stats_tbl = db.table_mappings[team_stats_tbl_name]
+            latest_tbl = db.table_mappings[latest_tbl_name]
+            team_stats.insert(session, team_stats_tbl, team_stats_data, latest_tbl)
+            if latest_created:
+                team_stats.refresh_latest(session, latest_tbl, team_stats_tbl)
 
-    # ~~~~~~~~~~~~~
-    # Teams
-    # ~~~~~~~~~~~~~
-    team_dict = team_scraper.scrape()
-    teams_data = DataOperator({"team_name": team_dict["team_name"]})
-    teams_tbl_name = "teams_{}".format(year)
-    if not db.table_exists(teams_tbl_name):
-        teams.create_team_table(db=db, teams_data=teams_data, tbl_name=teams_tbl_name)
-        teams_tbl = db.table_mappings[teams_tbl_name]
-        session.add_all([teams_tbl(**row) for row in teams_data.rows])
-        session.commit()
-        del teams_tbl
-
-    # ~~~~~~~~~~~~~
-    # Team Stats
-    # ~~~~~~~~~~~~~
-    team_stats_tbl_name = "team_stats_{}".format(year)
-    teams_tbl = db.table_mappings[teams_tbl_name]
-    team_dict['team_id'] = team_dict.pop('team_name')
-    team_dict['team_id'] = convert.values_to_foreign_key(session=session, foreign_tbl=teams_tbl, foreign_key="id",
-                                                         foreign_value="team_name", child_data=team_dict['team_id'])
-    # When team_stats_tbl is created, the teams_tbl automap object is changed. The changed format does not follow
-    # the expected behavior of an automapped table. I suspect this is because a relationship is established.
-    # If we reloaded, teams_tbl works fine. Therefore, delete the variable here for now
-    del teams_tbl
-    team_dict['scrape_date'] = [datetime.date(s_time) for s_time in team_dict['scrape_time']]
-    team_stats_data = DataOperator(team_dict)
-    if not db.table_exists(team_stats_tbl_name):
-        team_stats.create_table(db=db, team_stats_data=team_stats_data, tbl_name=team_stats_tbl_name)
-        team_stats_tbl = db.table_mappings[team_stats_tbl_name]
-        session.add_all([team_stats_tbl(**row) for row in team_stats_data.rows])
-        session.commit()
-    else:
-        team_stats_tbl = db.table_mappings[team_stats_tbl_name]
-        team_stats.insert(session, team_stats_tbl, team_stats_data)
-
-    # ~~~~~~~~~~~~~
-    # Schedule
-    # ~~~~~~~~~~~~~
-    schedule_dict = season_scraper.scrape()
-    schedule_data = DataOperator(schedule_dict)
-    teams_tbl = db.table_mappings['teams_{}'.format(year)]
-    schedule_data = schedule.format_data(session=session, schedule_data=schedule_data,
-                                         team_tbl=teams_tbl, team_stats_tbl=team_stats_tbl)
-    schedule_tbl_name = "schedule_{}".format(year)
-    if not db.table_exists(schedule_tbl_name):
-        schedule.create_table(db, schedule_data, schedule_tbl_name, teams_tbl, team_stats_tbl)
-        schedule_tbl = db.table_mappings[schedule_tbl_name]
-        session.add_all([schedule_tbl(**row) for row in schedule_data.rows])
-        session.commit()
-    else:
-        schedule_tbl = db.table_mappings[schedule_tbl_name]
-        update_rows = schedule.update_table(session, schedule_data, schedule_tbl, team_stats_tbl)
-        session.add_all(update_rows)
-        session.commit()
-
-    # ~~~~~~~~~~~~~
-    # Odds
-    # ~~~~~~~~~~~~~
-    odds_dict = line_scraper.scrape()
-    odds_data = None
-    if odds_dict:
-        odds_dict = odds.format_data(session, odds_dict, teams_tbl, schedule_tbl)
-        odds_data = DataOperator(odds_dict)
-    # Evaluate if you have the correct columns in odds_data (i.e. home\away team id's)
-    odds_tbl_name = "odds_{}".format(year)
-    if not db.table_exists(odds_tbl_name) and odds_data:
-        odds.create_table(db, odds_tbl_name, odds_data, schedule_tbl)
-        odds_tbl = db.table_mappings[odds_tbl_name]
-        session.add_all(odds_tbl(**row) for row in odds_data.rows)
-        session.commit()
-    elif odds_data:
-        odds_tbl = db.table_mappings[odds_tbl_name]
-        session.add_all(odds_tbl(**row) for row in odds_data.rows)
-        session.commit()
-        odds.update_table(session, odds_tbl, odds_data)
-        session.commit()
-        odds.delete(session, odds_tbl)
+        # ~~~~~~~~~~~~~
+        # Schedule
+        # ~~~~~~~~~~~~~
+        with uow.stage("schedule"):
+            schedule_dict = scraped["schedule"]
+            schedule_data = ColumnarOperator(schedule_dict)
+            teams_tbl = db.table_mappings['teams_{}'.format(year)]
+            schedule_data = schedule.format_data(session=session, schedule_data=schedule_data,
+                                                 team_tbl=teams_tbl, latest_tbl=latest_tbl)
+            schedule_tbl_name = "schedule_{}".format(year)
+            changes_tbl_name = "schedule_changes_{}".format(year)
+            # The change log is created with the schedule so readers of it can rely on it existing
+            if not db.table_exists(changes_tbl_name):
+                uow.checkpoint()
+                schedule_changes.create_table(db, changes_tbl_name)
+            if not db.table_exists(schedule_tbl_name):
+                uow.checkpoint()
+                schedule.create_table(db, schedule_data, schedule_tbl_name, teams_tbl, team_stats_tbl)
+                schedule_tbl = db.table_mappings[schedule_tbl_name]
+                for batch in schedule_data.batches():
+                    backend.bulk_insert(session.connection(), schedule_tbl, batch)
+            else:
+                schedule_tbl = db.table_mappings[schedule_tbl_name]
+                changes_tbl = db.table_mappings[changes_tbl_name]
+                schedule.update_table(session, schedule_data, schedule_tbl, team_stats_tbl, changes_tbl)
 
+        # ~~~~~~~~~~~~~
+        # Odds
+        # ~~~~~~~~~~~~~
+        odds_data = None
+        odds_tbl_name = "odds_{}".format(year)
+        with uow.stage("odds_format", recoverable=True):
+            odds_dict = scraped["odds"]
+            if isinstance(odds_dict, Exception):
+                raise odds_dict
+            if odds_dict:
+                odds_dict = odds.format_data(session, odds_dict, teams_tbl, schedule_tbl)
+                odds_data = DataOperator(odds_dict)
+        # Evaluate if you have the correct columns in odds_data (i.e. home\away team id's)
+        odds_created = False
+        if odds_data and not db.table_exists(odds_tbl_name):
+            # The table is created before the recoverable stages since a checkpoint cannot commit inside a savepoint
+            uow.checkpoint()
+            odds.create_table(db, odds_tbl_name, odds_data, schedule_tbl)
+            odds_created = True
+        if odds_data:
+            with uow.stage("odds_add", recoverable=True):
+                odds_tbl = db.table_mappings[odds_tbl_name]
+                backend.bulk_insert(session.connection(), odds_tbl, odds_data.rows)
+
+        # A new table has no rows to update or delete
+        if odds_data and not odds_created and "odds_add" not in uow.failed:
+            with uow.stage("odds_update", recoverable=True):
+                odds.update_table(session, odds_tbl, odds_data)
+            with uow.stage("odds_delete", recoverable=True):
+                odds.delete(session, odds_tbl)
+
+    for stage, exc in uow.failed.items():
+        print("ETL stage '{}' was rolled back: {}".format(stage, exc))
     session.close()
+    return uow
+
+
+def main(db, unit=None, coordinator=None):
+    """Scrape, format, and load teams, team stats, the schedule, and odds for the league year.
+
+    With a coordinator, the load runs on its writer thread so the ETL never writes while another writer does. Scraping
+    still runs on the calling thread.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        unit: 'run' or 'stage'. Defaults to the 'transaction_unit' setting
+        coordinator: An optional started database.writer.WriteCoordinator for the database
+
+    Returns:
+        The UnitOfWork of the load
+    """
+    scraped = extract()
+    if coordinator is None:
+        return load(db, scraped, unit)
+    return coordinator.call(load, db, scraped, unit).result()
+
 
 if __name__ == "__main__":
-    db = Database("test", Config.get_property("outputs"))
-    main(db)
+    db = backend.connect("test", Config.get_property("outputs"))
+    coordinator = WriteCoordinator(db.engine)
+    coordinator.start()
+    try:
+        main(db, coordinator=coordinator)
+    finally:
+        coordinator.stop()
@@ -0,0 +1,233 @@
+"""
+Migrations holds the secondary indexes and added columns declared for the season tables and the functions that apply
+them.
+
+Indexes are applied when a table is created by its management.tables module. migrate() adds declared columns missing
+from tables created before the column existed and applies the declared indexes to an existing database, skipping any
+column or index that already exists, so it is safe to run repeatedly. check_query_plans()
+runs EXPLAIN on the queries the project runs most often and raises if any of them falls back to a full table scan.
+
+Example:
+    From the project directory, run 'python -m nbapredict.management.migrations'
+"""
+
+import re
+from sqlalchemy import DateTime, Index, String, inspect, text
+
+# Local Imports
+from nbapredict.configuration import Config
+
+# Secondary indexes for each season table keyed by the table prefix (i.e. 'schedule' for 'schedule_2020'). Each index
+# is a dictionary with the indexed 'columns', an optional 'where' clause for partial indexes, and an optional 'name'
+# suffix used in place of the column names.
+INDEXES = {
+    "schedule": [
+        {"columns": ["start_time"]},
+        {"columns": ["game_date"]},
+        {"columns": ["home_team_id", "game_date"]},
+        {"columns": ["home_stats_id"], "where": "home_stats_id IS NULL", "name": "pending_stats"},
+    ],
+    "odds": [
+        {"columns": ["game_id"]},
+    ],
+    "team_stats": [
+        {"columns": ["team_id", "scrape_time"]},
+        {"columns": ["team_id"], "where": "valid_to IS NULL", "name": "current"},
+    ],
+    "schedule_changes": [
+        {"columns": ["game_id"]},
+    ],
+    "predictions": [
+        {"columns": ["game_id"]},
+    ],
+}
+
+# Columns added to a season table after its first release, keyed by the table prefix. Tables created before a column
+# was added receive it, empty, through ALTER TABLE. The table's management.tables module fills in existing rows.
+COLUMNS = {
+    "schedule": [("row_hash", String)],
+    "team_stats": [("stats_hash", String), ("valid_from", DateTime), ("valid_to", DateTime)],
+}
+
+# The queries run on every ETL or prediction run. Each must be answered with an index rather than a full scan.
+HOT_QUERIES = {
+    "schedule": [
+        ("games_on_day", "SELECT id FROM {tbl} WHERE start_time > :start AND start_time < :end",
+         {"start": "2020-01-01 00:00:00", "end": "2020-01-02 00:00:00"}),
+        ("games_in_week", "SELECT id FROM {tbl} WHERE game_date >= :start AND game_date <= :end",
+         {"start": "2020-01-01", "end": "2020-01-08"}),
+        ("home_team_game", "SELECT id FROM {tbl} WHERE home_team_id = :team AND game_date = :date",
+         {"team": 1, "date": "2020-01-01"}),
+        ("pending_stats", "SELECT id FROM {tbl} WHERE home_stats_id IS NULL", {}),
+    ],
+    "odds": [
+        ("odds_for_game", "SELECT id FROM {tbl} WHERE game_id = :game", {"game": 1}),
+    ],
+    "schedule_changes": [
+        ("changes_since", "SELECT id FROM {tbl} WHERE id > :watermark", {"watermark": 0}),
+        ("game_changes", "SELECT id FROM {tbl} WHERE game_id = :game", {"game": 1}),
+    ],
+    "team_stats": [
+        ("team_snapshots", "SELECT id FROM {tbl} WHERE team_id = :team ORDER BY scrape_time DESC",
+         {"team": 1}),
+        ("current_stats", "SELECT id, team_id FROM {tbl} WHERE valid_to IS NULL", {}),
+    ],
+}
+
+
+def table_prefix(tbl_name):
+    """Return the prefix of a season table name (i.e. 'team_stats' for 'team_stats_2020') or None if unmatched."""
+    match = re.match(r"^(\w+?)_(\d{4})$", tbl_name)
+    if match and match.group(1) in INDEXES:
+        return match.group(1)
+    return None
+
+
+def index_name(tbl_name, declaration):
+    """Return the name of a declared index on tbl_name."""
+    suffix = declaration.get("name") or "_".join(declaration["columns"])
+    return "ix_{}_{}".format(tbl_name, suffix)
+
+
+def declared_indexes(table):
+    """Return SQLalchemy Index objects for each index declared for the table.
+
+    Args:
+        table: A SQLalchemy Table object, typically reflected from the database
+    """
+    prefix = table_prefix(table.name)
+    if not prefix:
+        return []
+    indexes = []
+    for declaration in INDEXES[prefix]:
+        columns = [table.c[col] for col in declaration["columns"]]
+        kwargs = {}
+        if declaration.get("where"):
+            kwargs["sqlite_where"] = text(declaration["where"])
+            kwargs["postgresql_where"] = text(declaration["where"])
+        indexes.append(Index(index_name(table.name, declaration), *columns, **kwargs))
+    return indexes
+
+
+def existing_indexes(engine, tbl_name):
+    """Return the names and column lists of indexes and unique constraints that already exist on tbl_name.
+
+    Unique constraints are included because the database backs them with an index which serves the same queries.
+    """
+    inspector = inspect(engine)
+    names = set()
+    column_sets = set()
+    for idx in inspector.get_indexes(tbl_name) + inspector.get_unique_constraints(tbl_name):
+        names.add(idx["name"])
+        column_sets.add(tuple(idx["column_names"]))
+    return names, column_sets
+
+
+def create_indexes(db, tbl_name):
+    """Create any declared indexes which do not already exist on tbl_name and return the names of created indexes.
+
+    Indexes are skipped if an index of the same name exists or if an index or unique constraint already covers the
+    same columns. Partial indexes are only considered covered by an index of the same name.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        tbl_name: The name of the table to index
+    """
+    table = db.tables[tbl_name]
+    names, column_sets = existing_indexes(db.engine, tbl_name)
+    created = []
+    for index in declared_indexes(table):
+        columns = tuple(col.name for col in index.columns)
+        partial = index.dialect_options["sqlite"]["where"] is not None
+        if index.name in names or (not partial and columns in column_sets):
+            continue
+        index.create(bind=db.engine)
+        created.append(index.name)
+    return created
+
+
+def add_columns(db, tbl_name):
+    """Add any declared columns which do not already exist on tbl_name and return the names of added columns.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        tbl_name: The name of the table to alter
+    """
+    existing = {col["name"] for col in inspect(db.engine).get_columns(tbl_name)}
+    added = []
+    for col_name, col_type in COLUMNS.get(table_prefix(tbl_name), []):
+        if col_name in existing:
+            continue
+        type_name = col_type().compile(dialect=db.engine.dialect)
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(tbl_name, col_name, type_name)))
+        added.append(col_name)
+    return added
+
+
+def migrate(db):
+    """Apply declared columns and indexes to every season table in the database.
+
+    Returns:
+        A dict of {tbl_name: created} where created is the list of added columns and created indexes
+    """
+    created = {}
+    for tbl_name in db.tables:
+        if table_prefix(tbl_name):
+            created[tbl_name] = add_columns(db, tbl_name) + create_indexes(db, tbl_name)
+    return created
+
+
+def _explain(connection, sql, params):
+    """Return the query plan for sql as a list of strings."""
+    if connection.dialect.name == "postgresql":
+        # Small tables are always sequentially scanned by Postgres. Disable sequential scans so the plan shows whether
+        # an index is usable at all.
+        connection.execute(text("SET enable_seqscan = off"))
+        plan = [row[0] for row in connection.execute(text("EXPLAIN " + sql), params)]
+        connection.execute(text("RESET enable_seqscan"))
+        return plan
+    return [row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+
+
+def _is_full_scan(plan_line, tbl_name):
+    """Return True if the plan line reads every row of tbl_name."""
+    if "Seq Scan on {}".format(tbl_name) in plan_line:
+        return True
+    # SQLite reports "SCAN tbl" for full scans and "SCAN tbl USING [COVERING] INDEX" for full index scans
+    return bool(re.match(r"^SCAN (TABLE )?{}\b".format(tbl_name), plan_line)) and "INDEX" not in plan_line
+
+
+def check_query_plans(db, tbl_names=None):
+    """Explain the hot queries for each season table and raise a ValueError if any falls back to a full scan.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        tbl_names: Optional list of tables to check. Defaults to every season table in the database
+
+    Returns:
+        A dictionary of {(tbl_name, query_name): plan} for every checked query
+    """
+    if tbl_names is None:
+        tbl_names = [name for name in db.tables if table_prefix(name)]
+    plans = {}
+    full_scans = []
+    with db.engine.connect() as connection:
+        for tbl_name in tbl_names:
+            for query_name, sql, params in HOT_QUERIES.get(table_prefix(tbl_name), []):
+                plan = _explain(connection, sql.format(tbl=tbl_name), params)
+                plans[(tbl_name, query_name)] = plan
+                if any(_is_full_scan(line, tbl_name) for line in plan):
+                    full_scans.append("{}.{}: {}".format(tbl_name, query_name, "; ".join(plan)))
+    if full_scans:
+        raise ValueError("Hot queries fall back to a full table scan:\n{}".format("\n".join(full_scans)))
+    return plans
+
+
+if __name__ == "__main__":
+    from datatotable.database import Database
+    db = Database("test", Config.get_property("outputs"))
+    for tbl, indexes in migrate(db).items():
+        print("{}: created {}".format(tbl, indexes or "nothing"))
+    check_query_plans(db)
+    print("All hot queries use an index")
@@ -1,6 +1,7 @@
 """odds.py contains function to create the odds table in the database"""
 
 import nbapredict.management.conversion as convert
+from nbapredict.management import migrations
 from sqlalchemy import ForeignKey, or_, func
 from sqlalchemy.orm import aliased
 from datetime import timedelta
@@ -76,6 +77,7 @@ def create_table(db, tbl_name, odds_data, schedule_tbl):
     db.map_table(tbl_name=tbl_name, columns=columns)
     db.create_tables()
     db.clear_mappers()
+    migrations.create_indexes(db, tbl_name)
 
 
 def update_table(session, odds_tbl, odds_data):
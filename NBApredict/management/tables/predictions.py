@@ -1,13 +1,57 @@
-"""Functions for prediction table creation and operations."""
+"""Functions for prediction table creation and operations.
 
+Each row is one model's prediction for a game. The model column holds the registered name of the model and model_id
+holds the id of the fitted model, such as the artifact id of a cached regression, so predictions can be traced to the
+model which produced them. model_id is empty for models without an id.
+"""
 
-def format_data():
-    pass
+from sqlalchemy import ForeignKey, String
 
+# Local Imports
+from nbapredict.database import backend
+from nbapredict.database.manipulator import ColumnarOperator
+from nbapredict.management import migrations
 
-def create_table(db, prediction_data):
-    pass
 
+def format_data(prediction_rows):
+    """Return a ColumnarOperator of the prediction dictionaries returned by bets.predict_games_in_odds()."""
+    return ColumnarOperator(prediction_rows)
 
-def insert():
-    pass
+
+def create_table(db, tbl_name, prediction_data, schedule_tbl):
+    """Create a table of predictions in the database.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        tbl_name: The desired name of the table
+        prediction_data: A ColumnarOperator object with prediction data from format_data()
+        schedule_tbl: A mapped schedule table to set the game_id foreign key on
+    """
+    columns = prediction_data.columns
+    # model_id is None for every model without an id, and empty columns are left out of prediction_data.columns
+    columns['model'] = [String]
+    columns['model_id'] = [String]
+    schedule_tbl_name = schedule_tbl.__table__.fullname
+    columns['game_id'].append(ForeignKey("{}.id".format(schedule_tbl_name)))
+    db.map_table(tbl_name=tbl_name, columns=columns)
+    db.create_tables()
+    db.clear_mappers()
+    migrations.create_indexes(db, tbl_name)
+
+
+def insert(session, pred_tbl, prediction_data):
+    """Insert the predictions which are not already in pred_tbl and return the number of rows inserted.
+
+    A prediction is already stored if pred_tbl holds a row with the same game_id, model, and model_id.
+
+    Args:
+        session: A SQLalchemy session
+        pred_tbl: A mapped prediction table
+        prediction_data: A ColumnarOperator object with prediction data from format_data()
+    """
+    key = ['game_id', 'model', 'model_id']
+    game_ids = sorted(set(prediction_data.tolist('game_id')))
+    # Read as tuples rather than pandas, which would turn empty model_ids into NaN
+    stored = set(session.query(*[getattr(pred_tbl, col) for col in key]).filter(pred_tbl.game_id.in_(game_ids)))
+    rows = [row for row in prediction_data.rows if tuple(row.get(col) for col in key) not in stored]
+    return backend.bulk_insert(session.connection(), pred_tbl, rows)
@@ -1,53 +1,69 @@
-"""schedule.py contains function to create the schedule table in the database"""
+"""schedule.py contains function to create the schedule table in the database
 
+Every row carries a row_hash, a content hash of the game's teams, time, and score. Updates compare and rewrite the hash
+and, when given a schedule change log table, append an entry for each changed game. See schedule_changes.py.
+"""
+
+from collections import namedtuple
 from datetime import datetime, timedelta
-import math
+from nbapredict.database import backend, getters
+from nbapredict.helpers import hashing
 import nbapredict.management.conversion as convert
-from sqlalchemy import ForeignKey, func, tuple_
-from sqlalchemy.orm import aliased
+from nbapredict.management import migrations
+from nbapredict.management.tables import schedule_changes
+from sqlalchemy import ForeignKey, and_, bindparam, func, inspect, literal, select, text, union_all
+import numpy as np
 import pandas as pd
 
+ScheduleChanges = namedtuple('ScheduleChanges', ['inserts', 'deletes', 'time_changes', 'date_changes', 'old_hashes'])
+
+# The columns hashed into row_hash. The team ids never change for a game but keep hashes distinct between games
+HASHED_COLUMNS = ['home_team_id', 'away_team_id', 'start_time', 'game_date', 'home_team_score', 'away_team_score']
+
+
+def row_hash(row):
+    """Return the content hash of a game from a dictionary holding the HASHED_COLUMNS."""
+    return hashing.content_hash([row[col] for col in HASHED_COLUMNS])
+
 
-def format_data(session, schedule_data, team_tbl, team_stats_tbl):
+def format_data(session, schedule_data, team_tbl, latest_tbl):
     """Format and return schedule data to match the database schema.
 
-    Adds a Margin of Victory column and adds/modifies foreign key columns
+    Adds a Margin of Victory column and adds/modifies foreign key columns. Columns are computed with array operations
+    on the typed columns of a ColumnarOperator.
 
     Args:
-        schedule_data: A DataOperator object with schedule data
+        schedule_data: A database.manipulator.ColumnarOperator object with schedule data
         team_tbl: A mapped instance of the team_tbl
-        team_stats_tbl: A mapped instance of the team_stats_tbl
+        latest_tbl: A mapped instance of the team stats latest table, which holds each team's current stats
     """
-    h_score = schedule_data.data['home_team_score']
-    a_score = schedule_data.data['away_team_score']
-    schedule_data.data['MOV'] = [h_score[i] - a_score[i] for i in range(schedule_data.num_rows())]
-    schedule_data.data['playoffs'] = ['']
-    schedule_data.data['game_date'] = [datetime.date(t) for t in schedule_data.data['start_time']]
+    data = schedule_data.data
+    data['MOV'] = schedule_data.masked('home_team_score') - schedule_data.masked('away_team_score')
+    data['playoffs'] = ['']
+    data['game_date'] = data['start_time'].astype('datetime64[D]')
     schedule_data.fill('playoffs', None)
-    schedule_data.data["home_team_id"] = convert.values_to_foreign_key(session, foreign_tbl=team_tbl, foreign_key="id",
-                                                                       foreign_value="team_name",
-                                                                       child_data=schedule_data.data.pop("home_team"))
-    schedule_data.data["away_team_id"] = convert.values_to_foreign_key(session, foreign_tbl=team_tbl, foreign_key="id",
-                                                                       foreign_value="team_name",
-                                                                       child_data=schedule_data.data.pop("away_team"))
+    data["home_team_id"] = convert.values_to_foreign_key(session, foreign_tbl=team_tbl, foreign_key="id",
+                                                         foreign_value="team_name",
+                                                         child_data=data.pop("home_team").tolist())
+    data["away_team_id"] = convert.values_to_foreign_key(session, foreign_tbl=team_tbl, foreign_key="id",
+                                                         foreign_value="team_name",
+                                                         child_data=data.pop("away_team").tolist())
 
     today = datetime.date(datetime.now())
     tomorrow = today + timedelta(days=1)
-    tmrw_idx = 0
-    for idx in range(len(schedule_data.data['start_time'])):
-        if schedule_data.data['start_time'][idx].date() >= tomorrow:
-            tmrw_idx = idx
-            break
-    if not tmrw_idx:
+    future_games = np.flatnonzero(data['game_date'] >= np.datetime64(tomorrow))
+    if len(future_games) == 0:
         raise ValueError("tmrw_idx was not found")
-    subquery = session.query(team_stats_tbl.id, team_stats_tbl.team_id, func.max(team_stats_tbl.scrape_time)). \
-        filter(team_stats_tbl.scrape_date <= today).group_by(team_stats_tbl.team_id).subquery()
-    schedule_data.data['home_stats_id'] = convert.values_to_foreign_key(session, subquery, 'id', 'team_id',
-                                                                        schedule_data.data['home_team_id'][:tmrw_idx])
-    schedule_data.data['away_stats_id'] = convert.values_to_foreign_key(session, subquery, 'id', 'team_id',
-                                                                        schedule_data.data['away_team_id'][:tmrw_idx])
+    tmrw_idx = future_games[0]
+    # Games through today are assigned each team's current stats
+    data['home_stats_id'] = convert.values_to_foreign_key(session, latest_tbl, 'stats_id', 'team_id',
+                                                          data['home_team_id'][:tmrw_idx].tolist())
+    data['away_stats_id'] = convert.values_to_foreign_key(session, latest_tbl, 'stats_id', 'team_id',
+                                                          data['away_team_id'][:tmrw_idx].tolist())
     schedule_data.fill('home_stats_id', None)
     schedule_data.fill('away_stats_id', None)
+    data['row_hash'] = [hashing.content_hash(values) for values in
+                        zip(*[schedule_data.tolist(col) for col in HASHED_COLUMNS])]
 
     return schedule_data
 
@@ -71,148 +87,285 @@ def create_table(db, schedule_data, tbl_name, team_tbl, team_stats_tbl):
     db.map_table(tbl_name=tbl_name, columns=columns)
     db.create_tables()
     db.clear_mappers()
+    migrations.create_indexes(db, tbl_name)
 
 
-def update_table(session, schedule_data, schedule_tbl, team_stats_tbl):
-    """Wrap and run update functions for the schedule_tbl."""
-
-    update_games(session, schedule_tbl, schedule_data)
-    score_updates = update_scores(session, schedule_tbl, schedule_data)
-    stats_updates = update_stats(session, schedule_tbl, team_stats_tbl)
-    time_updates = update_start_time(session, schedule_tbl, schedule_data)
-
-    # Some rows may be updated in different functions. Use a set to remove duplicates
-    return set(score_updates + stats_updates + time_updates)
-
-
-def update_scores(session, schedule_tbl, schedule_data) -> list:
-    date = datetime.date(datetime.now())
-    update_query = session.query(schedule_tbl).filter(schedule_tbl.start_time < date,
-                                                      schedule_tbl.home_team_score == 0). \
-        order_by(schedule_tbl.start_time)
-    # if update_query.count() == 0:
-    #     return
-    rows = update_query.all()
-    if len(rows) == 0:
-        return []
-    first_game_time = rows[0].start_time
-    last_game_time = rows[len(rows) - 1].start_time
-
-    sched_df = schedule_data.dataframe
-    sched_df["start_time"] = sched_df["start_time"].dt.tz_localize(None)
-    update_df = sched_df.loc[(sched_df.start_time >= first_game_time) & (sched_df.start_time <= last_game_time)]
-
-    update_rows = []
-    for row in rows:
-        game = update_df.loc[(update_df.home_team_id == row.home_team_id) & (update_df.away_team_id == row.away_team_id)
-                             & (update_df.start_time.dt.date == datetime.date(row.start_time))]
-        row.home_team_score = int(game.home_team_score)
-        row.away_team_score = int(game.away_team_score)
-        row.MOV = row.home_team_score - row.away_team_score
-        row.start_time = game.start_time.dt.to_pydatetime()[0]  # Convert Pandas TimeStamp to datetime
-        update_rows.append(row)
-    return update_rows
-
-
-def update_stats(session, schedule_tbl, team_stats_tbl) -> list:
-    tomorrow = datetime.date(datetime.now()) + timedelta(days=1)
+def update_table(session, schedule_data, schedule_tbl, team_stats_tbl, changes_tbl=None):
+    """Wrap and run update functions for the schedule_tbl.
 
-    d_time = session.query(func.min(schedule_tbl.start_time)).filter(schedule_tbl.home_stats_id == None).all()[0][0]
-    date = datetime.date(d_time)
-    date_ranges = []
-    while date < tomorrow:
-        next_day = date + timedelta(days=1)
-        date_ranges.append((date, next_day))
-        date = next_day
-
-    update_rows = []
-    for d in date_ranges:
-        # Get the team stats with the greatest scrape_time before the end date of the range (31 obs, all teams + L. AVG)
-        stats_q = session.query(team_stats_tbl.id, team_stats_tbl.team_id,
-                                func.max(team_stats_tbl.scrape_time).label('s_time')). \
-            filter(team_stats_tbl.scrape_time < d[1]).group_by(team_stats_tbl.team_id).subquery()
-        home_stats = aliased(stats_q, 'home_stats')
-        away_stats = aliased(stats_q, 'away_stats')
-
-        sched_rows = session.query(schedule_tbl, home_stats.c.id.label('h_s_id'), away_stats.c.id.label('a_s_id')). \
-            filter(schedule_tbl.home_stats_id == None, schedule_tbl.start_time > d[0], schedule_tbl.start_time < d[1]).\
-            join(home_stats, schedule_tbl.home_team_id == home_stats.c.team_id). \
-            join(away_stats, schedule_tbl.away_team_id == away_stats.c.team_id).all()
-
-        # ToDo: remove explicit 2020 references
-        for row in sched_rows:
-            row.schedule_2020.home_stats_id = row.a_s_id
-            row.schedule_2020.away_stats_id = row.h_s_id
-            update_rows.append(row.schedule_2020)
-    return update_rows
-
-
-def update_start_time(session, schedule_tbl, schedule_data) -> list:
-    """Return updated rows for any games where the start_time has changed.
-
-    Note this will not check if the date of a game has changed."""
-    today = datetime.date(datetime.now())
-    end_week = datetime.date(datetime.now()) + timedelta(days=7)
-
-    games = session.query(schedule_tbl).filter(schedule_tbl.game_date >= today,
-                                                    schedule_tbl.game_date <= end_week).all()
-
-    df = schedule_data.dataframe[['start_time', 'game_date', 'home_team_id', 'away_team_id']]
-    df.start_time = df.start_time.dt.tz_localize(None)
-    df = df[(df.start_time >= pd.Timestamp(today)) & (df.game_date <= end_week)]
-
-    update_rows = []
-    for game in games:
-        if df[(df.start_time == game.start_time) & (df.home_team_id == game.home_team_id)].empty:
-            date = game.game_date
-            changed_game = df[(df.home_team_id == game.home_team_id) & (df.away_team_id == game.away_team_id) &
-                              (df.game_date == game.game_date)]
-            if changed_game.empty:
-                raise ValueError('Game time for {} @ {} has changed,'
-                                 ' but cannot find the new game time'.format(game.home_team_id,
-                                                                             game.away_team_id))
-            elif len(changed_game) == 1:
-                new_time = changed_game.start_time
-                new_time_timestamp = pd.to_datetime(new_time.values[0])
-                game.start_time = new_time_timestamp
-                update_rows.append(game)
-            else:
-                raise ValueError('Game time for {} @ {} has changed,'
-                                 'but there are multiple replacement values available'.format(game.home_team_id,
-                                                                                              game.away_team_id))
-    return update_rows
-
-
-def update_games(session, schedule_tbl, schedule_data):
-    """Check if any games have been removed or added from the schedule and add that change to the database.
-
-    ToDo: Add check for new games (i.e. when Clippers-Lakers gets rescheduled)
-    ToDo: This should work for playoff games too, right?
-    ToDo: Iterating through indices potentially slow, though great alternatives don't seem to exist
+    If changes_tbl, a mapped schedule change log, is given, an entry is appended to it for every inserted, deleted,
+    rescheduled, and scored game.
+    """
+    fill_hashes(session, schedule_tbl)
+    log = []
+    changes = detect_changes(session, schedule_tbl, schedule_data)
+    apply_changes(session, schedule_tbl, schedule_data, changes, log)
+    unmatched = update_scores(session, schedule_tbl, schedule_data, log)
+    if len(unmatched) > 0:
+        print("{} past games without a score were not found in the scraped schedule:\n{}".format(len(unmatched),
+                                                                                                 unmatched))
+    update_stats(session, schedule_tbl, team_stats_tbl)
+    if changes_tbl is not None and log:
+        schedule_changes.insert(session, changes_tbl, log)
+    return changes
+
+
+def fill_hashes(session, schedule_tbl):
+    """Set the row_hash of every game without one and return the number of games updated.
+
+    Rows only lack a hash if they were loaded before the row_hash column was added by migrations.migrate().
     """
+    missing = getters.read_columns(session, schedule_tbl, ['id'] + HASHED_COLUMNS,
+                                   where=[schedule_tbl.row_hash == None], fmt="pandas")
+    if missing.empty:
+        return 0
+    missing['start_time'] = pd.to_datetime(missing.start_time)
+    missing['game_date'] = pd.to_datetime(missing.game_date).dt.date
+    mappings = [{'id': int(row['id']), 'row_hash': row_hash(row)} for row in missing.to_dict('records')]
+    session.bulk_update_mappings(schedule_tbl, mappings)
+    return len(mappings)
 
-    data_len = len(schedule_data.data['start_time'])
-    tbl_len = session.query(schedule_tbl).count()
-    if data_len < tbl_len:
-        data_df = pd.DataFrame({'home_team_id': schedule_data.data['home_team_id'],
-                                'game_date': schedule_data.data['game_date']})
 
-        tbl_id_dates = session.query(schedule_tbl.home_team_id, schedule_tbl.game_date).all()
-        id_dates_dict = {'home_team_id': [r.home_team_id for r in tbl_id_dates],
-                         'game_date': [r.game_date for r in tbl_id_dates]}
-        tbl_df = pd.DataFrame(id_dates_dict)
+def update_scores(session, schedule_tbl, schedule_data, log=None):
+    """Set the scores, MOV, start_time, and row_hash of every past game without a score in one bulk update.
 
-        # Outer join for all rows, indicator for diff column
-        comp = data_df.merge(tbl_df, how='outer', indicator=True)
-        tbl_only = comp[comp['_merge'] == 'right_only']
-        ids = tbl_only['home_team_id'].values.tolist()
-        dates = tbl_only['game_date'].values.tolist()
-        cancelled_games = [(ids[i], dates[i]) for i in range(len(ids))]
+    Games in the table are matched to scraped games on (home_team_id, away_team_id, game_date) with a single merge.
+
+    Args:
+        session: A SQLalchemy session bound to the db
+        schedule_tbl: A mapped schedule table
+        schedule_data: A DataOperator object with formatted schedule data
+        log: An optional list to which a schedule_changes entry is appended for each scored game
+
+    Returns:
+        A DataFrame of the unscored games, identified by id, home_team_id, away_team_id, and game_date, which had no
+        scored match in the scraped schedule
+    """
+    today = datetime.date(datetime.now())
+    key = ['home_team_id', 'away_team_id', 'game_date']
+    pending = getters.read_columns(session, schedule_tbl, ['id', 'row_hash'] + key,
+                                   where=[schedule_tbl.start_time < today, schedule_tbl.home_team_score == 0],
+                                   fmt="pandas")
+    if pending.empty:
+        return pending
+
+    scraped = schedule_data.dataframe[key + ['start_time', 'home_team_score', 'away_team_score']].copy()
+    if scraped.start_time.dt.tz is not None:
+        scraped['start_time'] = scraped.start_time.dt.tz_localize(None)
+    scraped['game_date'] = pd.to_datetime(scraped.game_date)
+    pending['game_date'] = pd.to_datetime(pending.game_date)
+
+    merged = pending.merge(scraped, on=key, how='left')
+    scored = merged.home_team_score.notna() & (merged.home_team_score > 0)
+    matched = merged[scored]
+    unmatched = merged.loc[~scored, ['id'] + key]
+
+    if not matched.empty:
+        home_scores = matched.home_team_score.astype(int).tolist()
+        away_scores = matched.away_team_score.astype(int).tolist()
+        mappings = []
+        for game_id, h_id, a_id, h_score, a_score, start_time in zip(
+                matched.id.astype(int).tolist(), matched.home_team_id.astype(int).tolist(),
+                matched.away_team_id.astype(int).tolist(), home_scores, away_scores, matched.start_time):
+            start_time = start_time.to_pydatetime()
+            mapping = {'id': game_id, 'home_team_id': h_id, 'away_team_id': a_id, 'home_team_score': h_score,
+                       'away_team_score': a_score, 'MOV': h_score - a_score, 'start_time': start_time,
+                       'game_date': start_time.date()}
+            mapping['row_hash'] = row_hash(mapping)
+            mappings.append(mapping)
+        session.bulk_update_mappings(schedule_tbl, mappings)
+        if log is not None:
+            log.extend(schedule_changes.entry(mapping['id'], 'score', old_hash, mapping['row_hash'])
+                       for mapping, old_hash in zip(mappings, matched.row_hash.tolist()))
+    return unmatched
+
+
+def update_stats(session, schedule_tbl, team_stats_tbl):
+    """Assign home and away stats ids to every game through today which does not have them, and return the count.
+
+    Each game is assigned the latest team stats scraped on or before its game date. The as-of join ranks every
+    candidate team_stats row with ROW_NUMBER, partitioned by game and side and ordered by scrape_time. A single select
+    finds the top ranked rows for all pending games, and one bulk update writes them.
 
-        delete_rows = session.query(schedule_tbl).filter(tuple_(schedule_tbl.home_team_id, schedule_tbl.game_date).
-                                                         in_(cancelled_games))
-        if delete_rows.count() > 0:
-            for row in delete_rows:
-                session.delete(row)
+    Args:
+        session: A SQLalchemy session bound to the db
+        schedule_tbl: A mapped schedule table for any season
+        team_stats_tbl: A mapped team stats table for the same season
+    """
+    tomorrow = datetime.date(datetime.now()) + timedelta(days=1)
+    sched = schedule_tbl.__table__
+    stats = team_stats_tbl.__table__
+
+    def candidates(side):
+        """Select every team_stats row available to the side ('home' or 'away') of each pending game."""
+        team_id = sched.c['{}_team_id'.format(side)]
+        rank = func.row_number().over(partition_by=sched.c.id, order_by=stats.c.scrape_time.desc())
+        return select([sched.c.id.label('game_id'), literal(side).label('side'), stats.c.id.label('stats_id'),
+                       rank.label('rank')]).\
+            select_from(sched.join(stats, and_(stats.c.team_id == team_id, stats.c.scrape_date <= sched.c.game_date))).\
+            where(and_(sched.c.home_stats_id == None, sched.c.game_date < tomorrow))
+
+    ranked = union_all(candidates('home'), candidates('away')).alias('ranked')
+    latest = select([ranked.c.game_id, ranked.c.side, ranked.c.stats_id]).where(ranked.c.rank == 1)
+
+    assignments = {}
+    for game_id, side, stats_id in session.execute(latest):
+        assignments.setdefault(game_id, {'id': game_id})['{}_stats_id'.format(side)] = stats_id
+    # Only games with stats for both teams are updated
+    mappings = [m for m in assignments.values() if 'home_stats_id' in m and 'away_stats_id' in m]
+    if mappings:
+        session.bulk_update_mappings(schedule_tbl, mappings)
+    return len(mappings)
+
+
+def detect_changes(session, schedule_tbl, schedule_data):
+    """Compare the scraped schedule to schedule_tbl and return the games to insert, delete, and reschedule.
+
+    Only the stored games between the first and last dates of the scraped schedule are read and compared. First, games
+    are matched on (home_team_id, away_team_id, game_date). Matched games whose row_hash, a hash of the teams, time,
+    and score, is unchanged are skipped, and those whose start_time differs have a new start time. Score changes are
+    left to update_scores(). Then, the unmatched games on each side are paired by (home_team_id, away_team_id) in
+    order of start time. Paired games moved to a new date. Unpaired scraped games are inserts, and unpaired stored
+    games are deletes. Each step is a single merge.
 
+    Args:
+        session: A SQLalchemy session bound to the db
+        schedule_tbl: A mapped schedule table
+        schedule_data: A DataOperator object with formatted schedule data
+
+    Returns:
+        A ScheduleChanges namedtuple of:
+            inserts: The positions in schedule_data of games which are not in schedule_tbl
+            deletes: The ids of games in schedule_tbl, within the scraped dates, which are not in the scraped schedule
+            time_changes: {'id', 'start_time', 'row_hash'} mappings for games whose start time changed on the same date
+            date_changes: {'id', 'start_time', 'game_date', 'row_hash', ...} mappings for games which moved to a new
+            date
+            old_hashes: A dictionary of {id: row_hash} for the deleted, retimed, and moved games before the changes
+    """
+    scraped = schedule_data.dataframe[['home_team_id', 'away_team_id', 'start_time', 'row_hash']].copy()
+    if scraped.start_time.dt.tz is not None:
+        scraped['start_time'] = scraped.start_time.dt.tz_localize(None)
+    scraped['position'] = range(len(scraped))
+    scraped = _signed(scraped).drop(columns='row_hash')  # Keeps row_hash unambiguous as the stored hash after merges
+    first_day, last_day = scraped.game_date.min(), scraped.game_date.max()
+    window = [schedule_tbl.start_time >= first_day.to_pydatetime(),
+              schedule_tbl.start_time < (last_day + pd.Timedelta(days=1)).to_pydatetime()]
+    stored = getters.read_columns(session, schedule_tbl, ['id', 'home_team_id', 'away_team_id', 'start_time',
+                                                          'home_team_score', 'away_team_score', 'row_hash'],
+                                  where=window, fmt="pandas")
+    stored = _signed(stored)
+
+    same_day = scraped.merge(stored, on=['home_team_id', 'away_team_id', 'game_date'], how='outer',
+                             suffixes=('', '_stored'), indicator=True)
+    both = same_day[same_day['_merge'] == 'both']
+    changed = both[both['signature'] != both['signature_stored']]
+    retimed = changed[changed['start_time'] != changed['start_time_stored']]
+    time_changes = [{'id': game_id, 'start_time': start_time.to_pydatetime()}
+                    for game_id, start_time in zip(retimed.id.astype(int).tolist(), retimed.start_time)]
+    _rehash(time_changes, retimed)
+
+    # Pair the remaining games between the same teams in the order they are played
+    key = ['home_team_id', 'away_team_id', 'meeting']
+    new_games = _meetings(scraped[scraped.position.isin(same_day.loc[same_day['_merge'] == 'left_only', 'position'])])
+    old_games = _meetings(stored[stored.id.isin(same_day.loc[same_day['_merge'] == 'right_only', 'id'])])
+    paired = new_games.merge(old_games, on=key, how='outer', suffixes=('', '_stored'), indicator=True)
+    moved = paired[paired['_merge'] == 'both']
+    date_changes = [{'id': game_id, 'start_time': start_time.to_pydatetime(), 'game_date': start_time.date(),
+                     'home_stats_id': None, 'away_stats_id': None}
+                    for game_id, start_time in zip(moved.id.astype(int).tolist(), moved.start_time)]
+    _rehash(date_changes, moved)
+    inserts = paired.loc[paired['_merge'] == 'left_only', 'position'].astype(int).tolist()
+    removed = paired[paired['_merge'] == 'right_only']
+    deletes = removed.id.astype(int).tolist()
+
+    old_hashes = {}
+    for games in (retimed, moved, removed):
+        old_hashes.update(zip(games.id.astype(int).tolist(), games.row_hash.tolist()))
+    return ScheduleChanges(inserts, deletes, time_changes, date_changes, old_hashes)
+
+
+def apply_changes(session, schedule_tbl, schedule_data, changes, log=None):
+    """Apply the ScheduleChanges from detect_changes() to schedule_tbl with one bulk statement per kind of change.
+
+    Games which move to a new date have their stats ids cleared so update_stats() assigns stats as of the new date.
+    Rows of other tables which reference a deleted game, such as its odds and predictions, are deleted with it in the
+    same transaction.
 
+    Args:
+        session: A SQLalchemy session bound to the db
+        schedule_tbl: A mapped schedule table
+        schedule_data: A DataOperator object with formatted schedule data
+        changes: A ScheduleChanges namedtuple from detect_changes()
+        log: An optional list to which a schedule_changes entry is appended for each changed game
+    """
+    if changes.inserts:
+        columns = [col.name for col in schedule_tbl.__table__.c if col.name in schedule_data.data]
+        values = {col: schedule_data.tolist(col) for col in columns}
+        rows = [{col: values[col][i] for col in columns} for i in changes.inserts]
+        backend.bulk_insert(session.connection(), schedule_tbl, rows)
+    if changes.deletes:
+        delete_dependents(session, schedule_tbl, changes.deletes)
+        session.query(schedule_tbl).filter(schedule_tbl.id.in_(changes.deletes)).delete(synchronize_session=False)
+    if changes.time_changes or changes.date_changes:
+        session.bulk_update_mappings(schedule_tbl, changes.time_changes + changes.date_changes)
+    if log is None:
+        return
+
+    if changes.inserts:
+        # Inserted rows are found by their hashes, which include the teams and start time of each game
+        new_hashes = [values['row_hash'][i] for i in changes.inserts]
+        inserted = session.query(schedule_tbl.id, schedule_tbl.row_hash).\
+            filter(schedule_tbl.row_hash.in_(new_hashes)).order_by(schedule_tbl.id)
+        log.extend(schedule_changes.entry(game_id, 'insert', None, new_hash) for game_id, new_hash in inserted)
+    log.extend(schedule_changes.entry(game_id, 'delete', changes.old_hashes.get(game_id), None)
+               for game_id in changes.deletes)
+    for change_type, mappings in (('time', changes.time_changes), ('date', changes.date_changes)):
+        log.extend(schedule_changes.entry(m['id'], change_type, changes.old_hashes.get(m['id']), m['row_hash'])
+                   for m in mappings)
+
+
+def delete_dependents(session, schedule_tbl, game_ids):
+    """Delete the rows of every table with a foreign key to schedule_tbl which reference the games in game_ids.
+
+    Returns:
+        A dictionary of {table name: number of rows deleted}
+    """
+    connection = session.connection()
+    inspector = inspect(connection)
+    tbl_name = schedule_tbl.__table__.name
+    deleted = {}
+    for name in inspector.get_table_names():
+        for foreign_key in inspector.get_foreign_keys(name):
+            if foreign_key['referred_table'] != tbl_name:
+                continue
+            for column in foreign_key['constrained_columns']:
+                statement = text('DELETE FROM "{}" WHERE "{}" IN :ids'.format(name, column)).\
+                    bindparams(bindparam('ids', expanding=True))
+                count = connection.execute(statement, ids=list(game_ids)).rowcount
+                deleted[name] = deleted.get(name, 0) + count
+    return deleted
+
+
+def _rehash(mappings, games):
+    """Set the row_hash of each mapping from its new start time and the teams and scores of its row in games."""
+    for mapping, h_id, a_id, h_score, a_score in zip(mappings, games.home_team_id.tolist(),
+                                                     games.away_team_id.tolist(), games.home_team_score.tolist(),
+                                                     games.away_team_score.tolist()):
+        mapping['row_hash'] = row_hash({'home_team_id': h_id, 'away_team_id': a_id,
+                                        'start_time': mapping['start_time'], 'game_date': mapping['start_time'].date(),
+                                        'home_team_score': h_score, 'away_team_score': a_score})
+
+
+def _signed(games):
+    """Add the game date and a signature, the row_hash of the game's teams, time, and score, to a DataFrame of games."""
+    games['start_time'] = pd.to_datetime(games.start_time)
+    games['game_date'] = games.start_time.dt.normalize()
+    games['signature'] = games.row_hash
+    return games
+
+
+def _meetings(games):
+    """Number the games between the same home and away teams in order of start time."""
+    games = games.sort_values('start_time', kind='mergesort')
+    games['meeting'] = games.groupby(['home_team_id', 'away_team_id']).cumcount()
+    return games.drop(columns=['game_date', 'signature'])
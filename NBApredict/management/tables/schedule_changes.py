@@ -0,0 +1,75 @@
+"""schedule_changes.py contains functions to create, write, and read the append-only log of schedule changes.
+
+Each row records one change to one game in the schedule table: its id, the kind of change, and the game's row_hash
+before and after the change. Rows are only ever appended, so the log's id is a watermark. A consumer stores the highest
+id it has processed and later reads only the changes after it with changes_since().
+"""
+
+from datetime import datetime
+from nbapredict.database import backend, getters
+from nbapredict.management import migrations
+from sqlalchemy import DateTime, Integer, String, func
+
+# The kinds of change written to the log
+CHANGE_TYPES = ("insert", "delete", "time", "date", "score")
+
+
+def create_table(db, tbl_name):
+    """Create an empty schedule change log named tbl_name in the database.
+
+    game_id is not a foreign key because the log keeps the changes of games which were deleted from the schedule.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        tbl_name: The desired name of the table
+    """
+    columns = {"game_id": [Integer], "change_type": [String], "old_hash": [String], "new_hash": [String],
+               "changed_at": [DateTime]}
+    db.map_table(tbl_name=tbl_name, columns=columns)
+    db.create_tables()
+    db.clear_mappers()
+    migrations.create_indexes(db, tbl_name)
+
+
+def entry(game_id, change_type, old_hash=None, new_hash=None):
+    """Return a log entry for a change to the game with game_id.
+
+    Args:
+        game_id: The id of the game in the schedule table
+        change_type: One of CHANGE_TYPES
+        old_hash: The game's row_hash before the change. None for inserts
+        new_hash: The game's row_hash after the change. None for deletes
+    """
+    if change_type not in CHANGE_TYPES:
+        raise ValueError("change_type must be one of {}; received {}".format(CHANGE_TYPES, change_type))
+    return {"game_id": game_id, "change_type": change_type, "old_hash": old_hash, "new_hash": new_hash}
+
+
+def insert(session, changes_tbl, entries):
+    """Append entries to changes_tbl within the session's transaction and return the number of rows written.
+
+    Args:
+        session: A SQLalchemy session bound to the db
+        changes_tbl: A mapped schedule change log table
+        entries: A list of dictionaries from entry()
+    """
+    changed_at = datetime.now()
+    rows = [dict(row, changed_at=changed_at) for row in entries]
+    return backend.bulk_insert(session.connection(), changes_tbl, rows)
+
+
+def changes_since(session, changes_tbl, watermark=0, fmt="pandas"):
+    """Return the changes logged after watermark, in the order they were written.
+
+    Args:
+        session: A SQLalchemy session bound to the db
+        changes_tbl: A mapped schedule change log table
+        watermark: The id of the last change already processed. 0 returns every change
+        fmt: The return format accepted by getters.read_columns()
+    """
+    return getters.read_columns(session, changes_tbl, where=[changes_tbl.id > watermark], order_by=["id"], fmt=fmt)
+
+
+def watermark(session, changes_tbl):
+    """Return the id of the most recent change in changes_tbl or 0 if the log is empty."""
+    return session.query(func.max(changes_tbl.id)).scalar() or 0
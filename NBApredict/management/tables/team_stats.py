@@ -1,8 +1,39 @@
-"""Team_stats.py contains function to create the team_stats table in the database"""
+"""Team_stats.py contains function to create the team_stats table in the database
+
+A team's stats are only stored when they change. Each row holds a stats_hash of the team's stat values and the range of
+time it is valid for, from valid_from up to, but not including, valid_to. The current row of each team has a null
+valid_to. The stats of a team at any time are found with a range query in as_of().
+
+The current row of each team is also materialized in a small team_stats_latest table, keyed by team_id, which insert()
+keeps up to date in the same transaction. Consumers which only need current stats read it rather than aggregating the
+history.
+"""
 
-from datetime import datetime
 from nbapredict.configuration import Config
-from sqlalchemy import ForeignKey, UniqueConstraint
+from nbapredict.database import backend, getters
+from nbapredict.helpers import hashing
+from nbapredict.management import migrations
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UniqueConstraint, and_, or_
+import pandas as pd
+
+# Columns which describe a snapshot rather than the team's stats. Every other column is hashed into stats_hash
+SNAPSHOT_COLUMNS = ["id", "team_id", "scrape_time", "scrape_date", "stats_hash", "valid_from", "valid_to"]
+# Columns of team_stats which are not copied to team_stats_latest. The team_stats id is copied as stats_id
+LATEST_EXCLUDED = ["id", "scrape_date", "valid_from", "valid_to"]
+
+
+def format_data(team_stats_data):
+    """Add the stats_hash and validity range columns to team_stats_data and return it.
+
+    Args:
+        team_stats_data: A datatotable.data.DataOperator object with data on NBA team stats
+    """
+    data = team_stats_data.data
+    stat_columns = [col for col in data if col not in SNAPSHOT_COLUMNS]
+    data['stats_hash'] = [hashing.content_hash(values) for values in zip(*[data[col] for col in stat_columns])]
+    data['valid_from'] = list(data['scrape_time'])
+    data['valid_to'] = [None] * len(data['scrape_time'])
+    return team_stats_data
 
 
 def create_table(db, team_stats_data, tbl_name):
@@ -10,30 +41,141 @@ def create_table(db, team_stats_data, tbl_name):
 
     Args:
         db: a datotable.database.Database object connected to a database
-        team_stats_data: A datatotable.data.DataOperator object with data on NBA team stats
+        team_stats_data: A datatotable.data.DataOperator object with data on NBA team stats from format_data()
         tbl_name: The desired table name
-    ToDo: Currently allows duplicate rows if those values are on different days. Solve with a constraint
     """
     columns = team_stats_data.columns
     columns['team_id'].append(ForeignKey("teams_{}.id".format(Config.get_property('league_year'))))
+    columns['stats_hash'] = [String]
+    columns['valid_from'] = [DateTime]
+    columns['valid_to'] = [DateTime]  # Every value is null on creation, so the type is not inferred from the data
     constraints = [UniqueConstraint("team_id", "scrape_time")]
     db.map_table(tbl_name=tbl_name, columns=columns, constraints=constraints)
     db.create_tables()
     db.clear_mappers()
+    migrations.create_indexes(db, tbl_name)
+
+
+def create_latest_table(db, team_stats_data, tbl_name, team_stats_tbl_name):
+    """Create the table of each team's current stats, with one row per team.
+
+    Args:
+        db: a datotable.database.Database object connected to a database
+        team_stats_data: A datatotable.data.DataOperator object with data on NBA team stats from format_data()
+        tbl_name: The desired table name
+        team_stats_tbl_name: The name of the team stats table the current rows are copied from
+    """
+    columns = {col: sql_type for col, sql_type in team_stats_data.columns.items() if col not in LATEST_EXCLUDED}
+    columns['team_id'].append(ForeignKey("teams_{}.id".format(Config.get_property('league_year'))))
+    columns['stats_id'] = [Integer, ForeignKey("{}.id".format(team_stats_tbl_name))]
+    columns['stats_hash'] = [String]
+    constraints = [UniqueConstraint("team_id")]
+    db.map_table(tbl_name=tbl_name, columns=columns, constraints=constraints)
+    db.create_tables()
+    db.clear_mappers()
 
 
-def insert(session, team_stats_tbl, team_stats_data):
-    """Insert new data into the team_stats_tbl.
+def insert(session, team_stats_tbl, team_stats_data, latest_tbl=None):
+    """Insert the stats of each team whose stats changed and close the team's previous snapshot.
+
+    A team's scraped stats are inserted if their stats_hash differs from the team's current row. The current row's
+    valid_to is then set to the new row's valid_from. Unchanged teams are skipped, so scraping on days without games
+    adds no rows. If latest_tbl is given, the changed teams' rows in it are replaced in the same transaction. The rows
+    are added to the session and committed by the caller.
 
     Args:
         session: An instantiated SQLalchemy session object
         team_stats_tbl: A mapped team stats table object
-        team_stats_data: A datatotable.data.DataOperator object with data on NBA team stats
+        team_stats_data: A datatotable.data.DataOperator object with data on NBA team stats from format_data()
+        latest_tbl: An optional mapped team stats latest table from create_latest_table()
+
+    Returns:
+        The number of teams whose stats changed
     """
-    last_insert_scrape_time = session.query(team_stats_tbl.scrape_time). \
-        order_by(team_stats_tbl.scrape_time.desc()).first().scrape_time
-    last_insert_date = datetime.date(last_insert_scrape_time)
-    current_scrape_date = datetime.date(datetime.now())
-    if last_insert_date < current_scrape_date:
-        session.add_all([team_stats_tbl(**row) for row in team_stats_data.rows])
-        session.commit()
+    fill_validity(session, team_stats_tbl)
+    current = dict(session.query(team_stats_tbl.team_id, team_stats_tbl.stats_hash).
+                   filter(team_stats_tbl.valid_to == None))
+    rows = [row for row in team_stats_data.rows if current.get(row['team_id']) != row['stats_hash']]
+    if not rows:
+        return 0
+
+    for valid_from in set(row['valid_from'] for row in rows):
+        changed = [row['team_id'] for row in rows if row['valid_from'] == valid_from]
+        session.query(team_stats_tbl).filter(team_stats_tbl.team_id.in_(changed), team_stats_tbl.valid_to == None).\
+            update({team_stats_tbl.valid_to: valid_from}, synchronize_session=False)
+    session.add_all([team_stats_tbl(**row) for row in rows])
+    if latest_tbl is not None:
+        refresh_latest(session, latest_tbl, team_stats_tbl, [row['team_id'] for row in rows])
+    return len(rows)
+
+
+def refresh_latest(session, latest_tbl, team_stats_tbl, team_ids=None):
+    """Copy the current team_stats row of each team in team_ids, or of every team, into latest_tbl.
+
+    Rows are upserted on team_id within the session's transaction, so latest_tbl always matches the committed history.
+
+    Args:
+        session: An instantiated SQLalchemy session object
+        latest_tbl: A mapped team stats latest table from create_latest_table()
+        team_stats_tbl: A mapped team stats table object
+        team_ids: An optional list of the team ids to refresh
+
+    Returns:
+        The number of teams refreshed
+    """
+    session.flush()  # Assigns ids to team_stats rows added to the session
+    columns = [col.name for col in latest_tbl.__table__.c if col.name not in ("id", "stats_id")]
+    where = [team_stats_tbl.valid_to == None]
+    if team_ids is not None:
+        where.append(team_stats_tbl.team_id.in_(team_ids))
+    current = getters.read_columns(session, team_stats_tbl, ["id"] + columns, where=where, fmt="pandas")
+    rows = [dict(zip(columns, values), stats_id=stats_id) for stats_id, *values in
+            zip(current.id.tolist(), *[_column_values(current[col]) for col in columns])]
+    return backend.upsert(session.connection(), latest_tbl, rows, ["team_id"])
+
+
+def _column_values(series):
+    """Return the values of a DataFrame column as Python objects with None for nulls."""
+    if series.dtype.kind == "M":
+        return [None if pd.isna(val) else val for val in series.dt.to_pydatetime()]
+    return [None if pd.isna(val) else val for val in series.tolist()]
+
+
+def as_of(session, team_stats_tbl, when=None):
+    """Return a query for the stats of every team at the datetime when, or the current stats if when is None.
+
+    Args:
+        session: An instantiated SQLalchemy session object
+        team_stats_tbl: A mapped team stats table object
+        when: An optional datetime
+    """
+    query = session.query(team_stats_tbl)
+    if when is None:
+        return query.filter(team_stats_tbl.valid_to == None)
+    return query.filter(and_(team_stats_tbl.valid_from <= when,
+                             or_(team_stats_tbl.valid_to == None, team_stats_tbl.valid_to > when)))
+
+
+def fill_validity(session, team_stats_tbl):
+    """Set the stats_hash and validity range of every row without them and return the number of rows updated.
+
+    Rows only lack them if they were inserted before the columns were added by migrations.migrate(). Each row is
+    valid from its scrape_time until the team's next scrape_time. Existing rows with unchanged stats are kept, since
+    schedule rows may reference them.
+    """
+    if session.query(team_stats_tbl.id).filter(team_stats_tbl.valid_from == None).first() is None:
+        return 0
+    stats = getters.read_columns(session, team_stats_tbl, fmt="pandas")
+    stat_columns = [col for col in stats.columns if col not in SNAPSHOT_COLUMNS]
+    stats = stats.sort_values(['team_id', 'scrape_time'], kind='mergesort')
+    stats['scrape_time'] = pd.to_datetime(stats.scrape_time)
+    next_scrape = stats.groupby('team_id').scrape_time.shift(-1)
+
+    mappings = []
+    for stats_id, scrape_time, valid_to, values in zip(stats.id.tolist(), stats.scrape_time.dt.to_pydatetime(),
+                                                      next_scrape.dt.to_pydatetime(),
+                                                      stats[stat_columns].itertuples(index=False, name=None)):
+        mappings.append({'id': stats_id, 'stats_hash': hashing.content_hash(values), 'valid_from': scrape_time,
+                         'valid_to': None if pd.isna(valid_to) else valid_to})
+    session.bulk_update_mappings(team_stats_tbl, mappings)
+    return len(mappings)
@@ -0,0 +1,170 @@
+"""
+artifacts holds the ArtifactStore class which caches fitted models under the outputs directory.
+
+A fitted model is saved as a compact artifact of its coefficients, their covariance, and the residual standard deviation.
+Artifacts are keyed by a fingerprint of the training rows, the feature list, and the model's settings. If none of them
+changed since the last run, the artifact is served instead of refitting. The fingerprint doubles as the artifact id,
+which is recorded with each prediction so predictions can be traced to the model which produced them.
+
+Example:
+    store = ArtifactStore()
+    key = fingerprint(regression_df, features, Config.get_property("four_factor_regression"))
+    artifact = store.get(key) or store.put(key, reg.coefs, reg.cov_params, reg.resid_std, len(regression_df))
+    artifact.predict(pred_df)
+"""
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from nbapredict import configuration
+from nbapredict.configuration import Config
+
+
+def fingerprint(training, features, config=None):
+    """Return a 16 character hex digest of the training data, features, and model config.
+
+    Args:
+        training: A DataFrame of training rows or a list of arrays, such as the sufficient statistics of a regression.
+        The order of DataFrame rows does not change the fingerprint
+        features: A list of the feature names
+        config: An optional dictionary of the model's settings
+    """
+    digest = hashlib.sha1()
+    if isinstance(training, pd.DataFrame):
+        digest.update(json.dumps(list(map(str, training.columns))).encode("utf-8"))
+        digest.update(np.sort(pd.util.hash_pandas_object(training, index=False).to_numpy()).tobytes())
+    else:
+        for array in training:
+            digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    digest.update(json.dumps(list(features)).encode("utf-8"))
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class Artifact:
+    """A fitted linear model loaded from an ArtifactStore.
+
+    Attributes:
+        artifact_id: The fingerprint the artifact is stored under
+        coefs: values of the coefficients
+        cov_params: covariance matrix of the coefficients
+        resid_std: standard deviation of the residuals
+        n: The number of training rows
+        created: The time, in seconds since the epoch, the artifact was stored
+    """
+
+    def __init__(self, artifact_id, coefs, cov_params, resid_std, n, created):
+        """Store the fitted values of the artifact"""
+        self.artifact_id = artifact_id
+        self.coefs = coefs
+        self.cov_params = cov_params
+        self.resid_std = resid_std
+        self.n = n
+        self.created = created
+
+    @property
+    def std_errors(self):
+        return pd.Series(np.sqrt(np.diag(self.cov_params)), index=self.coefs.index)
+
+    def predict(self, pred_df):
+        """Return an array of predictions for each observation in pred_df.
+
+        Args:
+            pred_df: A dataframe of observations with a column for each predictor. A constant column is optional
+        """
+        x = pred_df.reindex(columns=self.coefs.index)
+        if "const" in x and "const" not in pred_df:
+            x["const"] = 1.0
+        return x.to_numpy(dtype=float) @ self.coefs.to_numpy()
+
+
+class ArtifactStore:
+    """ArtifactStore saves, serves, and evicts model artifacts in a directory.
+
+    Each artifact is an .npz file named by its fingerprint. Serving an artifact marks it as used, and eviction removes
+    the least recently used artifacts first.
+
+    Attributes:
+        directory: The directory artifacts are stored in
+        max_age: Artifacts unused for more than max_age seconds are evicted. None to keep artifacts of any age
+        max_count: At most max_count artifacts are kept. None to keep any number of artifacts
+    """
+
+    def __init__(self, directory=None, max_age=None, max_count=None):
+        """Create the directory if it does not exist
+
+        Args:
+            directory: The directory to store artifacts in. Defaults to 'artifacts' in the outputs directory
+            max_age: Maximum seconds since an artifact was last used. Defaults to the 'max_artifact_age_days' setting
+            max_count: Maximum number of artifacts. Defaults to the 'max_artifacts' setting
+        """
+        self.directory = directory or os.path.join(configuration.output_directory(), "artifacts")
+        if max_age is None and Config.get_property("max_artifact_age_days") is not None:
+            max_age = Config.get_property("max_artifact_age_days") * 24 * 60 * 60
+        self.max_age = max_age
+        self.max_count = max_count if max_count is not None else Config.get_property("max_artifacts")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, artifact_id):
+        """Return the path of the artifact with artifact_id."""
+        return os.path.join(self.directory, "{}.npz".format(artifact_id))
+
+    def get(self, artifact_id):
+        """Return the Artifact with artifact_id, or None if it is not stored, and mark it as used."""
+        path = self.path(artifact_id)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            columns = saved["columns"].tolist()
+            artifact = Artifact(artifact_id, pd.Series(saved["coefs"], index=columns),
+                                pd.DataFrame(saved["cov_params"], index=columns, columns=columns),
+                                float(saved["resid_std"]), int(saved["n"]), float(saved["created"]))
+        os.utime(path)
+        return artifact
+
+    def put(self, artifact_id, coefs, cov_params, resid_std, n):
+        """Store a fitted model, evict old artifacts, and return the stored Artifact.
+
+        Args:
+            artifact_id: The fingerprint of the model's training data and settings
+            coefs: A Series of the coefficients indexed by their names
+            cov_params: The covariance matrix of the coefficients
+            resid_std: The standard deviation of the residuals
+            n: The number of training rows
+        """
+        created = time.time()
+        temp_path = self.path(artifact_id) + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(file, columns=np.array(coefs.index, dtype=str), coefs=coefs.to_numpy(dtype=float),
+                     cov_params=np.asarray(cov_params, dtype=float), resid_std=resid_std, n=n, created=created)
+        os.replace(temp_path, self.path(artifact_id))  # Readers never see a partially written artifact
+        self.evict(keep=artifact_id)
+        return self.get(artifact_id)
+
+    def evict(self, keep=None):
+        """Remove artifacts older than max_age and the least recently used beyond max_count.
+
+        Args:
+            keep: An optional artifact id which is never evicted
+
+        Returns:
+            The ids of the evicted artifacts
+        """
+        files = [name for name in os.listdir(self.directory) if name.endswith(".npz")]
+        last_used = {name[:-len(".npz")]: os.path.getmtime(os.path.join(self.directory, name)) for name in files}
+        by_recency = sorted((artifact_id for artifact_id in last_used if artifact_id != keep),
+                            key=last_used.get, reverse=True)
+        evicted = []
+        if self.max_age is not None:
+            evicted = [artifact_id for artifact_id in by_recency if time.time() - last_used[artifact_id] > self.max_age]
+        if self.max_count is not None:
+            kept = [artifact_id for artifact_id in by_recency if artifact_id not in evicted]
+            evicted += kept[max(self.max_count - (keep in last_used), 0):]
+        for artifact_id in evicted:
+            os.remove(self.path(artifact_id))
+        return evicted
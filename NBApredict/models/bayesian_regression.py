@@ -0,0 +1,224 @@
+"""
+bayesian_regression holds the BayesianRegression class, a conjugate Bayesian version of the four factor regression.
+
+The coefficients b and the residual variance s2 have a normal-inverse-gamma prior: s2 ~ InverseGamma(shape, rate) and
+b | s2 ~ Normal(0, s2 * prior_coef_variance * I). The prior is conjugate, so the posterior is normal-inverse-gamma as
+well and is found in closed form without sampling. It is summarized by the posterior mean of the coefficients, their
+covariance scaled by s2, and the shape and rate of s2.
+
+Each finished game updates the posterior with a rank one Sherman-Morrison update of the covariance, which is O(p^2) in
+the number of predictors. The posterior predictive distribution of a game's margin of victory is a Student's t
+distribution, and the distributions of a whole slate are returned as one vectorized scipy distribution. Unlike
+bets.line_probability(), cover probabilities account for uncertainty in both the coefficients and the residual
+variance.
+
+Example:
+    model = bayesian_regression.main(session, team_stats_tbl, sched_tbl)
+    model.predictive(features).interval(0.9)
+    model.cover_probability(features, lines)
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+# Local Imports
+from nbapredict import configuration
+from nbapredict.configuration import Config
+from nbapredict.database import getters
+from nbapredict.models import four_factor_regression as ff_reg
+from nbapredict.models.feature_store import FeatureStore
+from nbapredict.models.registry import Model, register
+
+
+@register("bayesian_regression")
+class BayesianRegression(Model):
+    """BayesianRegression holds the normal-inverse-gamma posterior of a linear regression.
+
+    Attributes:
+        columns: The names of the coefficients. The first is 'const'
+        mean: The posterior mean of the coefficients
+        cov: The posterior covariance of the coefficients divided by the residual variance
+        shape: The shape of the inverse gamma posterior of the residual variance
+        rate: The rate of the inverse gamma posterior of the residual variance
+        n: The number of games in the posterior
+        game_ids: The ids of the games in the posterior, if they were given
+    """
+
+    def __init__(self, prior_coef_variance=None, prior_shape=None, prior_rate=None):
+        """Store the prior. The posterior is set by fit()
+
+        Args:
+            prior_coef_variance: The prior variance of each coefficient divided by the residual variance. Defaults to
+            the 'prior_coef_variance' setting
+            prior_shape: The shape of the inverse gamma prior. Defaults to the 'prior_shape' setting
+            prior_rate: The rate of the inverse gamma prior. Defaults to the 'prior_rate' setting
+        """
+        super().__init__()
+        self.prior_coef_variance = prior_coef_variance or Config.get_property("prior_coef_variance")
+        self.prior_shape = prior_shape or Config.get_property("prior_shape")
+        self.prior_rate = prior_rate or Config.get_property("prior_rate")
+        self.columns = None
+        self.mean = None
+        self.cov = None
+        self.shape = None
+        self.rate = None
+        self.n = 0
+        self.game_ids = set()
+
+    @property
+    def coefs(self):
+        """The posterior mean of the coefficients as a Series."""
+        return pd.Series(self.mean, index=self.columns)
+
+    @property
+    def cov_params(self):
+        """The posterior covariance matrix of the coefficients, marginal of the residual variance."""
+        return pd.DataFrame(self.cov * self.rate / (self.shape - 1), index=self.columns, columns=self.columns)
+
+    def _design(self, frame):
+        """Return frame's predictors, in the order of columns with a constant, as a 2D array."""
+        x = frame.reindex(columns=self.columns)
+        x["const"] = 1.0
+        return x.to_numpy(dtype=float)
+
+    def fit(self, predictors, target, game_ids=None):
+        """Set the posterior to the prior updated with every game and return the model.
+
+        The games are applied at once through the posterior precision, which equals applying them one by one.
+
+        Args:
+            predictors: A DataFrame of predictors without a constant column
+            target: A Series of the target
+            game_ids: Optional ids of the games so later updates can skip games already in the posterior
+        """
+        self.columns = ["const"] + list(predictors.columns)
+        x = self._design(predictors)
+        y = np.asarray(target, dtype=float)
+        precision = np.eye(len(self.columns)) / self.prior_coef_variance + x.T @ x
+        self.cov = np.linalg.inv(precision)
+        self.mean = self.cov @ (x.T @ y)
+        self.shape = self.prior_shape + len(y) / 2
+        self.rate = self.prior_rate + (y @ y - self.mean @ precision @ self.mean) / 2
+        self.n = len(y)
+        self.game_ids = set(game_ids) if game_ids is not None else set()
+        self.resid_std = np.sqrt(self.rate / self.shape)
+        return self
+
+    def update(self, predictors, target, game_ids=None):
+        """Update the posterior with each game in turn with O(p^2) Sherman-Morrison updates.
+
+        Args:
+            predictors: A DataFrame of predictors of the finished games
+            target: A Series of the target of the finished games
+            game_ids: Optional ids of the games, which are added to game_ids
+        """
+        for x, y in zip(self._design(predictors), np.asarray(target, dtype=float)):
+            cov_x = self.cov @ x
+            denominator = 1 + x @ cov_x
+            error = y - x @ self.mean
+            self.cov -= np.outer(cov_x, cov_x) / denominator
+            self.mean += cov_x * error / denominator
+            self.shape += 0.5
+            self.rate += error ** 2 / (2 * denominator)
+        self.n += len(predictors)
+        self.game_ids.update(game_ids if game_ids is not None else [])
+        self.resid_std = np.sqrt(self.rate / self.shape)
+        return self
+
+    def predictive(self, features):
+        """Return the posterior predictive Student's t distribution of the margin of victory of each game in features.
+
+        Args:
+            features: A DataFrame of observations with a column for each predictor. A constant column is optional
+
+        Returns:
+            A frozen scipy.stats.t distribution whose loc and scale are arrays with one value per game
+        """
+        x = self._design(features)
+        inflation = 1 + np.einsum("ij,jk,ik->i", x, self.cov, x)  # Coefficient uncertainty widens each prediction
+        return stats.t(df=2 * self.shape, loc=x @ self.mean, scale=np.sqrt(self.rate / self.shape * inflation))
+
+    def predict_batch(self, features):
+        return self._design(features) @ self.mean
+
+    def cover_probability(self, features, lines):
+        """Return an array of the posterior predictive probability that the home team covers each line.
+
+        Args:
+            features: A DataFrame of observations with a column for each predictor. A constant column is optional
+            lines: An array of the home team's line for each observation
+        """
+        return self.predictive(features).sf(-1 * np.asarray(lines, dtype=float))
+
+    def save(self, path):
+        """Write the posterior to an .npz file at path."""
+        np.savez(path, columns=np.array(self.columns), mean=self.mean, cov=self.cov, shape=self.shape,
+                 rate=self.rate, n=self.n, game_ids=np.array(sorted(self.game_ids), dtype="i8"),
+                 prior=[self.prior_coef_variance, self.prior_shape, self.prior_rate])
+
+    @classmethod
+    def load(cls, path, predictors):
+        """Return the posterior saved at path, or an unfit model if there is none or it differs in predictors or prior.
+
+        Args:
+            path: The path of an .npz file written by save()
+            predictors: The names of the predictor columns, excluding the constant
+        """
+        model = cls()
+        if not os.path.exists(path):
+            return model
+        with np.load(path) as saved:
+            prior = [model.prior_coef_variance, model.prior_shape, model.prior_rate]
+            if saved["columns"].tolist() != ["const"] + list(predictors) or saved["prior"].tolist() != prior:
+                return model
+            model.columns = saved["columns"].tolist()
+            model.mean, model.cov = saved["mean"], saved["cov"]
+            model.shape, model.rate, model.n = float(saved["shape"]), float(saved["rate"]), int(saved["n"])
+            model.game_ids = set(saved["game_ids"].tolist())
+        model.resid_std = np.sqrt(model.rate / model.shape)
+        return model
+
+
+def posterior_file(league_year):
+    """Return the path of the saved posterior for the league year."""
+    return os.path.join(configuration.output_directory(), "bayesian_posterior_{}.npz".format(league_year))
+
+
+def main(session, team_stats_tbl, sched_tbl, path=None):
+    """Load the saved posterior, update it with the games finished since it was saved, save it, and return it.
+
+    Each game's predictors are its teams' stats as known at tip-off. If a game in the posterior is no longer finished,
+    for example after a correction to the schedule, the posterior is refit from the prior on every finished game.
+
+    Args:
+        session: An instantiated Session object from sqlalchemy
+        team_stats_tbl: A mapped team stats table class holding every snapshot of team stats
+        sched_tbl: A mapped schedule table class
+        path: The path of the saved posterior. Defaults to posterior_file() for the configured league year
+
+    Returns:
+        A fitted BayesianRegression
+    """
+    path = path or posterior_file(Config.get_property("league_year"))
+    ff_list = ff_reg.four_factors_list()
+    predictors = ["home_{}".format(f) for f in ff_list] + ["away_{}".format(f) for f in ff_list]
+    model = BayesianRegression.load(path, predictors)
+
+    games = getters.read_columns(session, sched_tbl, ["id", "home_team_id", "away_team_id", "start_time", "MOV"],
+                                 where=[sched_tbl.home_team_score > 0], fmt="pandas")
+    if len(games) == 0:
+        raise ValueError("No finished games in {} to fit the posterior on".format(getattr(sched_tbl, "__table__", sched_tbl).name))
+    refit = model.n == 0 or not model.game_ids <= set(games.id.tolist())
+    new_games = games if refit else games[~games.id.isin(model.game_ids)]
+    if len(new_games) > 0:
+        store = FeatureStore.from_table(session, team_stats_tbl, ff_list)
+        regression_df = store.regression_frame(new_games.set_index("id"))
+        if refit:
+            model.fit(regression_df[predictors], regression_df["sched_MOV"], regression_df.index)
+        else:
+            model.update(regression_df[predictors], regression_df["sched_MOV"], regression_df.index)
+    print("{} {} games; {} games in the posterior".format("Fit" if refit else "Updated with", len(new_games), model.n))
+    model.save(path)
+    return model
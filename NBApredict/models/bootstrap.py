@@ -0,0 +1,140 @@
+"""
+bootstrap holds the Bootstrap class which estimates the uncertainty of the four factor regression by resampling.
+
+Resampling the rows of the regression frame with replacement is equivalent to weighting each row by the number of
+times it was drawn. The weights of every resample are drawn as one multinomial array, and the weighted normal
+equations X'WX b = X'Wy of all resamples are built with two matrix products and solved in one batched call. Large
+numbers of resamples may be split into chunks and fit in a process pool; the draws are the same either way.
+
+The coefficient and residual standard deviation draws are cached, so the prediction intervals and cover probabilities
+of a whole slate of games are computed from them without refitting. Unlike bets.line_probability(), which treats the
+coefficients as known, each draw's probability is averaged, so uncertainty in the coefficients widens the result.
+
+Example:
+    boot = Bootstrap.fit(regression.predictors, regression.target, n_boot=2000, seed=1)
+    boot.prediction_intervals(slate_df)
+    boot.cover_probability(slate_df, lines)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+# Local Imports
+from nbapredict.configuration import Config
+from nbapredict.models.artifacts import fingerprint
+
+CHUNK_SIZE = 500  # Resamples fit per chunk. Each chunk has its own random stream, so draws do not depend on processes
+_cache = {}  # {(fingerprint, n_boot, seed): Bootstrap} of fitted bootstraps in this process
+
+
+def fit_chunk(x, y, n_resamples, seed):
+    """Draw n_resamples bootstrap resamples of the rows of x and y and return their coefficients and residual stds.
+
+    Args:
+        x: A 2D array of predictors, including a constant column
+        y: An array of the target
+        n_resamples: The number of resamples
+        seed: A numpy SeedSequence or int seeding the resample weights
+
+    Returns:
+        A tuple of a (resample, coefficient) array and an array of the residual std of each resample
+    """
+    n, p = x.shape
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(n, np.full(n, 1 / n), size=n_resamples).astype(float)
+    xtx = (weights @ np.einsum("ni,nj->nij", x, x).reshape(n, p * p)).reshape(n_resamples, p, p)
+    xty = weights @ (x * y[:, None])
+    coefs = np.linalg.solve(xtx, xty[:, :, None])[:, :, 0]
+    ssr = weights @ y ** 2 - np.einsum("bi,bi->b", coefs, xty)  # y'Wy - b'X'Wy since X'WX b = X'Wy
+    return coefs, np.sqrt(np.maximum(ssr, 0) / (n - p))
+
+
+class Bootstrap:
+    """Bootstrap holds coefficient and residual standard deviation draws of a linear regression.
+
+    Attributes:
+        columns: The names of the coefficients
+        coefs: A (resample, coefficient) array of coefficient draws
+        resid_std: An array of the residual standard deviation of each resample
+    """
+
+    def __init__(self, columns, coefs, resid_std):
+        """Store the draws"""
+        self.columns = list(columns)
+        self.coefs = coefs
+        self.resid_std = resid_std
+
+    @classmethod
+    def fit(cls, predictors, target, n_boot=None, seed=None, processes=1):
+        """Fit n_boot bootstrap resamples of the regression of target on predictors and return the Bootstrap.
+
+        Results are cached by a fingerprint of the data, n_boot, and seed, so repeated calls within a process are free.
+
+        Args:
+            predictors: A DataFrame of predictors. Include a constant column to fit an intercept, i.e. the predictors
+            attribute of a LinearRegression
+            target: A Series of the target
+            n_boot: The number of resamples. Defaults to the 'n_bootstrap' setting
+            seed: An optional seed. Draws are random if None
+            processes: The number of worker processes to fit chunks of resamples in
+        """
+        n_boot = n_boot or Config.get_property("n_bootstrap")
+        key = (fingerprint(pd.concat([predictors, target], axis=1), list(predictors.columns)), n_boot, seed)
+        if seed is not None and key in _cache:
+            return _cache[key]
+
+        x = predictors.to_numpy(dtype=float)
+        y = np.asarray(target, dtype=float)
+        sizes = [min(CHUNK_SIZE, n_boot - start) for start in range(0, n_boot, CHUNK_SIZE)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        args = [[x] * len(sizes), [y] * len(sizes), sizes, seeds]
+        if processes > 1 and len(sizes) > 1:
+            with ProcessPoolExecutor(max_workers=min(processes, len(sizes))) as pool:
+                chunks = list(pool.map(fit_chunk, *args))
+        else:
+            chunks = list(map(fit_chunk, *args))
+        bootstrap = cls(predictors.columns, np.concatenate([chunk[0] for chunk in chunks]),
+                        np.concatenate([chunk[1] for chunk in chunks]))
+        if seed is not None:
+            _cache[key] = bootstrap
+        return bootstrap
+
+    def _means(self, pred_df):
+        """Return a (resample, game) array of each resample's expected margin for the observations in pred_df."""
+        x = pred_df.reindex(columns=self.columns)
+        if "const" in x and "const" not in pred_df:
+            x["const"] = 1.0
+        return self.coefs @ x.to_numpy(dtype=float).T
+
+    def prediction_intervals(self, pred_df, alpha=0.1, seed=None):
+        """Return a DataFrame of the prediction and the 1 - alpha prediction interval of each observation in pred_df.
+
+        The interval covers the game's margin of victory, not only its expected value. One margin per resample is
+        drawn around that resample's expected margin with that resample's residual std.
+
+        Args:
+            pred_df: A dataframe of observations with a column for each predictor. A constant column is optional
+            alpha: The share of outcomes outside the interval
+            seed: An optional seed for the margin draws
+        """
+        means = self._means(pred_df)
+        rng = np.random.default_rng(seed)
+        margins = means + self.resid_std[:, None] * rng.standard_normal(means.shape)
+        lower, upper = np.quantile(margins, [alpha / 2, 1 - alpha / 2], axis=0)
+        return pd.DataFrame({"prediction": means.mean(axis=0), "lower": lower, "upper": upper}, index=pred_df.index)
+
+    def cover_probability(self, pred_df, lines):
+        """Return an array of the probability that the home team covers each line.
+
+        The home team covers if its margin of victory plus its line is positive. Each resample's normal probability is
+        averaged, so no margins are drawn.
+
+        Args:
+            pred_df: A dataframe of observations with a column for each predictor. A constant column is optional
+            lines: An array of the home team's line for each observation
+        """
+        means = self._means(pred_df)
+        line_prediction = -1 * np.asarray(lines, dtype=float)
+        return stats.norm.sf(line_prediction, loc=means, scale=self.resid_std[:, None]).mean(axis=0)
@@ -0,0 +1,136 @@
+"""
+feature_store holds the FeatureStore class which serves the four factors of each team as they were known at any time.
+
+Training a model on stats scraped after a game was played leaks the game's result into its own predictors. The
+FeatureStore keeps every snapshot of each team's stats and answers as-of queries: for a (team, time) pair, it returns
+the stats of the latest snapshot which was valid at that time. Snapshots are sorted by team and time once, and lookups
+are binary searches, so the stats for a whole season of games are found with one vectorized call.
+
+Example:
+    store = FeatureStore.from_table(session, team_stats_tbl, br.four_factors)
+    store.as_of(team_id, datetime(2020, 1, 1, 19))
+    regression_df = store.regression_frame(games)
+"""
+
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from nbapredict.database import getters
+
+
+class FeatureStore:
+    """FeatureStore holds snapshots of team features sorted by team and time and performs as-of lookups on them.
+
+    Each snapshot is keyed by a single int64 which combines its team's position in teams with its time in microseconds.
+    Keys sort by team and then time, so one np.searchsorted call finds the as-of snapshot for any number of lookups.
+
+    Attributes:
+        features: The names of the features, in the order of the columns of values
+        teams: A sorted array of the team ids in the store
+        times: The datetime64[us] time each snapshot became valid, sorted within each team
+        values: A float array with a row of feature values for each snapshot
+    """
+
+    def __init__(self, team_ids, times, values, features):
+        """Sort the snapshots and build the lookup keys
+
+        Args:
+            team_ids: An array of the team id of each snapshot
+            times: An array of the time each snapshot became valid
+            values: A 2D array with a row of feature values for each snapshot
+            features: The names of the feature columns in values
+        """
+        times = np.asarray(times, dtype="datetime64[us]")
+        valid = ~np.isnat(times)  # Snapshots without a time can never be known
+        team_ids = np.asarray(team_ids, dtype="i8")[valid]
+        times = times[valid]
+        values = np.asarray(values, dtype="f8")[valid]
+        order = np.lexsort((times, team_ids))
+        self.features = list(features)
+        self.teams = np.unique(team_ids)
+        self.times = times[order]
+        self.values = values[order]
+        self._team_codes = np.searchsorted(self.teams, team_ids[order])
+        self._origin = self.times.min() if len(self.times) else np.datetime64(0, "us")
+        # Keys must leave room for any lookup time within the span of the snapshots, plus one for later lookups
+        self._span = int((self.times.max() - self._origin).astype("i8")) + 2 if len(self.times) else 1
+        self._keys = self._key(self._team_codes, self.times)
+
+    @classmethod
+    def from_table(cls, session, team_stats_tbl, features):
+        """Return a FeatureStore of every snapshot in a team stats table.
+
+        Args:
+            session: A SQLalchemy session
+            team_stats_tbl: A mapped team stats table with team_id and valid_from columns
+            features: A list of the feature columns to store, i.e. br.four_factors
+        """
+        snapshots = getters.read_columns(session, team_stats_tbl, ["team_id", "valid_from"] + list(features))
+        return cls(snapshots["team_id"], snapshots["valid_from"],
+                   np.column_stack([snapshots[col] for col in features]) if len(snapshots) else
+                   np.empty((0, len(features))), features)
+
+    def _key(self, team_codes, times):
+        """Return the int64 lookup keys for team codes and datetime64[us] times."""
+        offsets = (times - self._origin).astype("i8")
+        return team_codes.astype("i8") * self._span + offsets
+
+    def batch_as_of(self, team_ids, times):
+        """Return the features of each team as known at the paired time.
+
+        A snapshot is known at a time if it became valid at or before that time. Lookups for unknown teams or for times
+        before a team's first snapshot return a row of NaN.
+
+        Args:
+            team_ids: An array of team ids
+            times: An array of times, the same length as team_ids
+
+        Returns:
+            A 2D float array with one row of features for each lookup
+        """
+        team_ids = np.asarray(team_ids, dtype="i8")
+        times = np.asarray(times, dtype="datetime64[us]")
+        result = np.full((len(team_ids), len(self.features)), np.nan)
+        if len(self.teams) == 0 or len(team_ids) == 0:
+            return result
+
+        codes = np.searchsorted(self.teams, team_ids).clip(max=len(self.teams) - 1)
+        known_team = self.teams[codes] == team_ids
+        # Times after the last snapshot are clipped so the key stays within the team's range of keys
+        offsets = (times - self._origin).astype("i8").clip(min=-1, max=self._span - 1)
+        keys = codes.astype("i8") * self._span + offsets
+        positions = np.searchsorted(self._keys, keys, side="right") - 1
+        found = known_team & (offsets >= 0) & (positions >= 0)
+        found[found] = self._team_codes[positions[found]] == codes[found]
+        result[found] = self.values[positions[found]]
+        return result
+
+    def as_of(self, team_id, time):
+        """Return the features of team_id as known at time as a pandas Series, or None if none were known."""
+        values = self.batch_as_of([team_id], [np.datetime64(pd.Timestamp(time).tz_localize(None), "us")])[0]
+        if np.isnan(values).all():
+            return None
+        return pd.Series(values, index=self.features)
+
+    def regression_frame(self, games, time_column="start_time", target="MOV"):
+        """Return a regression dataframe of each game's target and both teams' features as known at tip-off.
+
+        Games where either team had no stats yet are dropped. The remaining rows keep the index of games. Columns are
+        named as in alt_regression_df(): 'sched_MOV' for the target and 'home_{feature}' and 'away_{feature}' for the
+        features.
+
+        Args:
+            games: A DataFrame of games with home_team_id, away_team_id, time_column, and target columns
+            time_column: The column holding the time each game started
+            target: The column holding the regression target
+        """
+        times = pd.to_datetime(games[time_column]).to_numpy(dtype="datetime64[us]")
+        home = self.batch_as_of(games["home_team_id"].to_numpy(), times)
+        away = self.batch_as_of(games["away_team_id"].to_numpy(), times)
+        frame = pd.DataFrame(np.hstack([home, away]), index=games.index,
+                             columns=["home_{}".format(f) for f in self.features] +
+                                     ["away_{}".format(f) for f in self.features])
+        frame.insert(0, "sched_{}".format(target), games[target].to_numpy())
+        known = ~(np.isnan(home).any(axis=1) | np.isnan(away).any(axis=1))
+        return frame[known]
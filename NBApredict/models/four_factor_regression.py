@@ -12,22 +12,24 @@ Returns:
     Returns a LinearRegression class
 """
 from datetime import datetime
+from functools import cached_property
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import os
 import scipy.stats as stats
 from sqlalchemy.orm import Session
-from sqlalchemy import func, alias
+from sqlalchemy import alias, select
 
 import statsmodels.api as sm
-from statsmodels.stats.outliers_influence import variance_inflation_factor as vif
 
 # Local Packages
 from datatotable.database import Database
 from nbapredict.database import getters
 from nbapredict.helpers import br_references as br
 from nbapredict.management import conversion
+from nbapredict.models.artifacts import ArtifactStore, fingerprint
+from nbapredict.models.feature_store import FeatureStore
 from nbapredict.models import graphing
 from nbapredict.configuration import Config
 
@@ -35,41 +37,123 @@ from nbapredict.configuration import Config
 class LinearRegression:
     """A class that creates and holds linear regression information and functions for regression evaluation.
 
-    LinearRegression is initialized with a target variable and the desired predictors. Then, a regression is run and
-    necessary regression stats are stored as class parameters. Member functions generate evaluative graphs and/or
+    LinearRegression is initialized with a target variable and the desired predictors. The coefficients are fit with
+    NumPy least squares, and only the coefficients and the residual standard deviation are computed on initialization.
+    Other regression stats are computed when first accessed and cached. The statsmodels results, which are the
+    reference implementation, are likewise fit on first access. Member functions generate evaluative graphs and/or
     stats for the regression.
 
     Attributes:
         target: The target variable
         predictors: The predictive variables
-        results: statsmodels results wrapper
+        coefs: values of the coefficients
+        resid_std: standard deviation of the residuals, with degrees of freedom corrected for the coefficients
+        df_resid: residual degrees of freedom
+        results: statsmodels results wrapper, fit on first access
         predictions: predicted results from the regression
         r_squared: r_squared of the regression
         adj_r_squared: adj_r_squared of the regression
         r_squared_rnd: r_squared rounded to three decimal places
         residuals: residuals of the gression
+        std_errors: standard errors of the coefficients
+        cov_params: covariance matrix of the coefficients
         p_values: p_values of the coefficients
-        coefs: values of the coefficients
-        output: data frame of coefficients with their values and p_values"""
+        condition_number: the largest condition index of the predictors scaled to unit length
+        leverage: diagonal of the hat matrix for each observation
+        cooks: cook's distance of each observation
+        output: data frame of coefficients with their values and p_values
+        artifact_id: The id of the cached artifact of the fit if one was stored by main()"""
 
     def __init__(self, target, predictors):
-        """Performs a linear regression and stores pertinent regression outputs as class variables
+        """Performs a linear regression and stores the coefficients and residual standard deviation
 
         Args:
             target: The target variable
             predictors: The prediction variables"""
         self.target = target
+        self.artifact_id = None
         self.predictors = sm.add_constant(predictors)
-        self.results = sm.OLS(target, self.predictors).fit()
-        self.predictions = self.results.predict(self.predictors)
-        self.r_squared = self.results.rsquared
-        self.adj_r_squared = self.results.rsquared_adj
-        self.r_squared_rnd = np.around(self.r_squared, 3)
-        self.residuals = self.results.resid
-        self.p_values = self.results.pvalues
-        self.coefs = self.results.params
-        self.output = pd.concat([self.coefs, self.p_values], axis=1)
-        self.output.columns = ["coefficient", "p_value"]
+        self._x = self.predictors.to_numpy(dtype=float)
+        self._y = np.asarray(target, dtype=float)
+        coefs, _, self._rank, _ = np.linalg.lstsq(self._x, self._y, rcond=None)
+        self.coefs = pd.Series(coefs, index=self.predictors.columns)
+        self._fitted = self._x @ coefs
+        self._resid = self._y - self._fitted
+        self.df_resid = len(self._y) - self._rank
+        self.resid_std = np.sqrt(self._resid @ self._resid / self.df_resid)
+
+    def predict(self, pred_df):
+        """Return an array of predictions for each observation in pred_df.
+
+        Args:
+            pred_df: A dataframe of observations with a column for each predictor. A constant column is optional
+        """
+        x = pred_df.reindex(columns=self.coefs.index)
+        if "const" in x and "const" not in pred_df:
+            x["const"] = 1.0
+        return x.to_numpy(dtype=float) @ self.coefs.to_numpy()
+
+    @cached_property
+    def results(self):
+        """The statsmodels OLS results for the same target and predictors."""
+        return sm.OLS(self.target, self.predictors).fit()
+
+    @cached_property
+    def predictions(self):
+        return pd.Series(self._fitted, index=self.predictors.index)
+
+    @cached_property
+    def residuals(self):
+        return pd.Series(self._resid, index=self.predictors.index)
+
+    @cached_property
+    def r_squared(self):
+        # Uncentered if the predictors lack a constant, as in statsmodels
+        centered = self._y - self._y.mean() if "const" in self.coefs else self._y
+        return 1 - (self._resid @ self._resid) / (centered @ centered)
+
+    @cached_property
+    def adj_r_squared(self):
+        df_model = self._rank - ("const" in self.coefs)
+        return 1 - (1 - self.r_squared) * (self.df_resid + df_model) / self.df_resid
+
+    @cached_property
+    def r_squared_rnd(self):
+        return np.around(self.r_squared, 3)
+
+    @cached_property
+    def _xtx_inv(self):
+        """The (pseudo) inverse of X'X, from which coefficient and observation diagnostics are derived."""
+        return np.linalg.pinv(self._x.T @ self._x)
+
+    @cached_property
+    def std_errors(self):
+        return pd.Series(self.resid_std * np.sqrt(np.diag(self._xtx_inv)), index=self.coefs.index)
+
+    @cached_property
+    def cov_params(self):
+        return pd.DataFrame(self.resid_std ** 2 * self._xtx_inv, index=self.coefs.index, columns=self.coefs.index)
+
+    @cached_property
+    def p_values(self):
+        t_values = self.coefs / self.std_errors
+        return pd.Series(2 * stats.t.sf(np.abs(t_values), self.df_resid), index=self.coefs.index)
+
+    @cached_property
+    def leverage(self):
+        return pd.Series(np.einsum("ij,jk,ik->i", self._x, self._xtx_inv, self._x), index=self.predictors.index)
+
+    @cached_property
+    def cooks(self):
+        leverage = self.leverage.to_numpy()
+        distance = self._resid ** 2 / (self._rank * self.resid_std ** 2) * leverage / (1 - leverage) ** 2
+        return pd.Series(distance, index=self.predictors.index)
+
+    @cached_property
+    def output(self):
+        output = pd.concat([self.coefs, self.p_values], axis=1)
+        output.columns = ["coefficient", "p_value"]
+        return output
 
     def predicted_vs_actual(self, out_path=None):
         """Generate a predicted vs. actual graph, save to out_path if it exists, and return the graph."""
@@ -98,10 +182,7 @@ class LinearRegression:
 
     def cooks_distance(self, out_path=None):
         """Generate a cook's distance graph, save to out_path if it exists, and return the graph."""
-        influence = self.results.get_influence()
-        # c is the distance and p is p-value
-        (c, p) = influence.cooks_distance
-        graph = graphing.cooks_distance(c, out_path)
+        graph = graphing.cooks_distance(self.cooks, out_path)
         return graph
 
     def residual_independence(self, out_path=None):
@@ -115,11 +196,18 @@ class LinearRegression:
     def vif(self):
         """Determine the Variance Inflation Factor (vif) of the coefficients and return a dataframe of the vif's."""
         vif_out = pd.DataFrame()
-        predictors = np.array(self.predictors)
-        vif_out["VIF Factor"] = [vif(predictors, i) for i in range(predictors.shape[1])]
+        vif_out["VIF Factor"] = variance_inflation_factors(self.predictors).to_numpy()
         vif_out["features"] = self.predictors.columns
         return vif_out
 
+    @cached_property
+    def condition_number(self):
+        return self.collinearity()["condition_index"].max()
+
+    def collinearity(self):
+        """Return the eigenvalue diagnostics of the predictors. See collinearity()."""
+        return collinearity(self.predictors)
+
     def residual_distribution(self):
         """Calculate the normal curve of the residuals and return the distribution"""
         norm = stats.norm
@@ -156,12 +244,12 @@ def create_ff_regression_df(session, team_stats_tbl, sched_tbl, ff_list):
     return df
 
 
-def alt_regression_df(session, team_stats_tbl, sched_tbl, ff_list, qualifiers=None):
+def alt_regression_df(session, latest_tbl, sched_tbl, ff_list, qualifiers=None):
     """Alternate regression df where the latest team_stats are applied to all games in schedule.
 
     Args:
         session: A sqlalchemy session object
-        team_stats_tbl: A mapped team stats table object
+        latest_tbl: A mapped team stats latest table object, which holds each team's current stats
         sched_tbl: a mapped schedule table object'
         qualifiers: Optional qualifiers to apply to the returned regression dataframe. Can be columns to subset from the
         regression dataframe or a function
@@ -169,27 +257,89 @@ def alt_regression_df(session, team_stats_tbl, sched_tbl, ff_list, qualifiers=No
     Returns:
         A regression dataframe, modified by qualifiers if specified, with the four factors
     """
-    team_stats = session.query(team_stats_tbl).group_by(team_stats_tbl.team_id).having(func.max(team_stats_tbl.id)).\
-        subquery()
-    home_stats = alias(team_stats, name='home')
-    away_stats = alias(team_stats, name='away')
+    # Only the target and the four factors are selected; the remaining schedule and team_stats columns are not read
+    home_stats = alias(latest_tbl, name='home')
+    away_stats = alias(latest_tbl, name='away')
     sched = alias(sched_tbl, name='sched')
-    home_stat_ff = [getattr(home_stats.c, col) for col in ff_list if col in home_stats.c.keys()]
-    away_stat_ff = [getattr(away_stats.c, col) for col in ff_list if col in away_stats.c.keys()]
+    home_stat_ff = [home_stats.c[col].label('home_{}'.format(col)) for col in ff_list]
+    away_stat_ff = [away_stats.c[col].label('away_{}'.format(col)) for col in ff_list]
 
-    sched_stats_query = session.query(sched, *home_stat_ff, *away_stat_ff).filter(sched.c['home_team_score'] > 0).\
-        join(home_stats, home_stats.c['team_id'] == sched.c['home_team_id']).\
-        join(away_stats, away_stats.c['team_id'] == sched.c['away_team_id']).subquery(with_labels=True)
-
-    sched_stats = session.query(sched_stats_query)
+    sched_stats = select([sched.c['MOV'].label('sched_MOV'), *home_stat_ff, *away_stat_ff]).\
+        select_from(sched.join(home_stats, home_stats.c['team_id'] == sched.c['home_team_id']).
+                    join(away_stats, away_stats.c['team_id'] == sched.c['away_team_id'])).\
+        where(sched.c['home_team_score'] > 0)
 
+    df = getters.read_select(session, sched_stats, fmt="pandas")
     if qualifiers:
-        df = conversion.convert_sql_statement_to_table(session, sched_stats.statement, qualifiers)
-    else:
-        df = conversion.convert_sql_statement_to_table(session, sched_stats.statement)
+        df = df[qualifiers]
     return(df)
 
 
+def variance_inflation_factors(predictors):
+    """Return a Series of the variance inflation factor of each column of predictors.
+
+    The VIF of a column is 1 / (1 - R^2) of the regression of that column on the others, with R^2 centered. Rather than
+    fitting each auxiliary regression, every VIF is read from the diagonal of the inverse of the predictors' correlation
+    matrix. A 'const' column is uncorrelated with the centered predictors and its VIF is 1. The results match statsmodels'
+    variance_inflation_factor() with standardized predictors.
+
+    Args:
+        predictors: A DataFrame of predictors with or without a 'const' column
+    """
+    vifs = pd.Series(1.0, index=predictors.columns)
+    varying = [col for col in predictors.columns if col != "const"]
+    if varying:
+        correlation = np.corrcoef(predictors[varying].to_numpy(dtype=float), rowvar=False).reshape(len(varying), -1)
+        vifs[varying] = np.diag(np.linalg.pinv(correlation))
+    return vifs
+
+
+def collinearity(predictors):
+    """Return a DataFrame of eigenvalue diagnostics for multicollinearity in predictors.
+
+    Columns are scaled to unit length, as in Belsley, Kuh, and Welsch, and decomposed with one SVD. Each row is a
+    dimension of the predictors with its eigenvalue, its condition index (sqrt(largest eigenvalue / eigenvalue)), and,
+    for each predictor, the proportion of the predictor's coefficient variance associated with the dimension. A
+    condition index above 30 with two or more proportions above 0.5 indicates harmful collinearity.
+
+    Args:
+        predictors: A DataFrame of predictors with or without a 'const' column
+    """
+    x = predictors.to_numpy(dtype=float)
+    _, singular_values, vt = np.linalg.svd(x / np.linalg.norm(x, axis=0), full_matrices=False)
+    phi = vt.T ** 2 / singular_values ** 2  # phi[j, k]: share of the variance of coefficient j from dimension k
+    proportions = (phi / phi.sum(axis=1, keepdims=True)).T
+    diagnostics = pd.DataFrame(proportions, columns=predictors.columns)
+    diagnostics.insert(0, "eigenvalue", singular_values ** 2)
+    diagnostics.insert(1, "condition_index", singular_values[0] / singular_values)
+    return diagnostics
+
+
+def point_in_time_regression_df(session, team_stats_tbl, sched_tbl, ff_list, qualifiers=None):
+    """Regression df where each game is paired with the team_stats known when the game started.
+
+    Unlike alt_regression_df(), stats scraped after a game do not leak into its predictors.
+
+    Args:
+        session: A sqlalchemy session object
+        team_stats_tbl: A mapped team stats table object holding every snapshot of team stats
+        sched_tbl: a mapped schedule table object
+        ff_list: List of the four factors variable
+        qualifiers: Optional qualifiers to apply to the returned regression dataframe. Can be columns to subset from the
+        regression dataframe or a function
+
+    Returns:
+        A regression dataframe, modified by qualifiers if specified, with the four factors
+    """
+    games = getters.read_columns(session, sched_tbl, ['home_team_id', 'away_team_id', 'start_time', 'MOV'],
+                                 where=[sched_tbl.home_team_score > 0], fmt="pandas")
+    store = FeatureStore.from_table(session, team_stats_tbl, ff_list)
+    df = store.regression_frame(games).reset_index(drop=True)
+    if qualifiers:
+        df = df[qualifiers]
+    return df
+
+
 def get_team_ff(ff_df, team, ff_list, home):
     """Extract the four factors for a specific team from the ff_df and return the result.
 
@@ -254,14 +404,23 @@ def four_factors_list():
     return ff_list
 
 
-def main(session, team_stats_tbl, sched_tbl, graph=False):
+def main(session, latest_tbl, sched_tbl, graph=False, team_stats_tbl=None):
     """Create a regression data frame, run a regression through the LinearRegression class, and return the class
 
+    If the 'point_in_time' setting is True and team_stats_tbl is given, each game is paired with the stats known when it
+    started. Otherwise, the latest stats are applied to every game.
+
+    If the 'cache_artifacts' setting is True and no graphs are requested, the fitted model is cached as an Artifact
+    keyed by a fingerprint of the regression data and settings, unless it is already cached, and the fingerprint is set
+    as the regression's artifact_id. The regression is always fit, as the data is read either way and the least squares
+    fit is cheap by comparison.
+
     Args:
         session: An instantiated Session object from sqlalchemy
-        team_stats_tbl: A mapped team stats table class
+        latest_tbl: A mapped team stats latest table class
         sched_tbl: A mapped schedule table class
         graph: A boolean that creates graphs if true
+        team_stats_tbl: An optional mapped team stats table class holding every snapshot of team stats
 
     Returns:
         A LinearRegression class
@@ -275,14 +434,23 @@ def main(session, team_stats_tbl, sched_tbl, graph=False):
     ff_list = four_factors_list()
 
     # regression_df = create_ff_regression_df(session, team_stats_tbl, sched_tbl, ff_list)
-    regression_df = alt_regression_df(session, team_stats_tbl, sched_tbl, ff_list)
-    print('using alternative/old regression_df')
+    if Config.get_property("point_in_time") and team_stats_tbl is not None:
+        regression_df = point_in_time_regression_df(session, team_stats_tbl, sched_tbl, ff_list)
+    else:
+        regression_df = alt_regression_df(session, latest_tbl, sched_tbl, ff_list)
+        print('using alternative/old regression_df')
 
     # Separate DF's into them into X (predictors) and y (target)
     predictors = regression_df[regression_df.columns.drop(list(regression_df.filter(regex='sched')))]
     target = regression_df["sched_MOV"]
 
     ff_reg = LinearRegression(target, predictors)
+    if Config.get_property("cache_artifacts") and not graph:
+        store = ArtifactStore()
+        artifact_id = fingerprint(regression_df, ff_list, Config.get_property("four_factor_regression"))
+        if store.get(artifact_id) is None:
+            store.put(artifact_id, ff_reg.coefs, ff_reg.cov_params, ff_reg.resid_std, len(target))
+        ff_reg.artifact_id = artifact_id
 
     # Note: On Windows, graphs will not appear to update
     # To change that, go to folder properties -> customize -> optimize for: Documents
@@ -306,6 +474,6 @@ if __name__ == "__main__":
     session = Session(db.engine)
     year = Config.get_property('league_year')
     sched_tbl = db.table_mappings['schedule_{}'.format(year)]
-    team_stats_tbl = db.table_mappings['team_stats_{}'.format(year)]
-    test = main(session, graph=True)
+    latest_tbl = db.table_mappings['team_stats_latest_{}'.format(year)]
+    test = main(session, latest_tbl, sched_tbl, graph=True)
     t=2
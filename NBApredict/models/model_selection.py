@@ -0,0 +1,294 @@
+"""
+model_selection contains functions which tune a regularized four factor regression with time series cross validation.
+
+Ridge, lasso, and elastic net regressions are fit along a shared grid of penalties, alpha, from strongest to weakest.
+Each fold trains on the games before a date and is scored on the block of games after it, so no fold is scored on games
+played before its training games. Within a fold, the training predictors are standardized once, and their Gram matrix
+X'X and X'y are computed once and shared by every fit:
+    - The ridge path of every alpha comes from one SVD of the standardized predictors
+    - The lasso and elastic net paths are fit by coordinate descent on the Gram matrix. Each alpha starts from the
+      coefficients of the previous, stronger, alpha, so later fits take few iterations
+
+Folds are independent and fit in a process pool. The configuration with the lowest mean squared error across folds is
+refit on every game and saved as JSON in the outputs directory, with its coefficients on the unstandardized predictors.
+
+Penalties follow sklearn's elastic net objective, 1 / (2n) * ||y - Xb||^2 + alpha * l1_ratio * ||b||_1
++ alpha * (1 - l1_ratio) / 2 * ||b||^2, where ridge is an l1_ratio of 0 and the lasso an l1_ratio of 1.
+
+Example:
+    selection, cv_results = model_selection.main(range(2015, 2021))
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import enet_path
+
+# Local Imports
+from nbapredict import configuration
+from nbapredict.configuration import Config
+from nbapredict.database import backend
+from nbapredict.models import four_factor_regression as ff_reg
+from nbapredict.predict import backtest
+
+ALPHA_RANGE = 1e-4  # The weakest alpha in the grid as a share of the strongest
+
+
+def model_name(l1_ratio):
+    """Return the name of the regularized regression with l1_ratio."""
+    if l1_ratio == 0:
+        return "ridge"
+    elif l1_ratio == 1:
+        return "lasso"
+    return "elastic_net"
+
+
+def time_series_folds(dates, n_folds):
+    """Return a list of (train, test) index arrays of expanding window folds over dates.
+
+    The unique dates are split into n_folds + 1 consecutive blocks. Fold k trains on the games in the first k blocks and
+    tests on the games in block k + 1, so games on the same date are never split between train and test.
+
+    Args:
+        dates: An array of each game's date
+        n_folds: The number of folds
+    """
+    dates = np.asarray(dates)
+    blocks = np.array_split(np.unique(dates), n_folds + 1)
+    if len(blocks[-1]) == 0:
+        raise ValueError("{} folds need at least {} game dates; there are {}".format(
+            n_folds, n_folds + 1, len(np.unique(dates))))
+    folds = []
+    for k in range(1, n_folds + 1):
+        train = np.flatnonzero(dates < blocks[k][0])
+        test = np.flatnonzero((dates >= blocks[k][0]) & (dates <= blocks[k][-1]))
+        folds.append((train, test))
+    return folds
+
+
+def standardize(x):
+    """Return x standardized to zero mean and unit variance, and the mean and scale of each column.
+
+    Columns without variance are left with a scale of 1.
+    """
+    mean = x.mean(axis=0)
+    scale = x.std(axis=0)
+    scale[scale == 0] = 1.0
+    return np.asfortranarray((x - mean) / scale), mean, scale
+
+
+def alpha_grid(x, y, l1_ratios, n_alphas):
+    """Return a decreasing array of n_alphas alphas.
+
+    The strongest alpha sets every coefficient of the smallest positive l1_ratio to zero on the standardized predictors.
+
+    Args:
+        x: A 2D array of predictors without a constant column
+        y: An array of the target
+        l1_ratios: A list of l1_ratios
+        n_alphas: The number of alphas
+    """
+    xs, _, _ = standardize(x)
+    positive = [ratio for ratio in l1_ratios if ratio > 0] or [1.0]
+    alpha_max = np.abs(xs.T @ (y - y.mean())).max() / (len(y) * min(positive))
+    return alpha_max * np.logspace(0, np.log10(ALPHA_RANGE), n_alphas)
+
+
+def ridge_path(x, y, alphas):
+    """Return an (alpha, coefficient) array of the ridge coefficients of each alpha from one SVD of x.
+
+    Args:
+        x: A 2D array of centered predictors
+        y: An array of the centered target
+        alphas: An array of alphas
+    """
+    u, s, vt = np.linalg.svd(x, full_matrices=False)
+    shrink = s / (s ** 2 + len(y) * np.asarray(alphas)[:, None])  # The 1 / (2n) loss scales alpha by n
+    return (shrink * (u.T @ y)) @ vt
+
+
+def fit_path(xs, yc, l1_ratio, alphas, gram=None, xy=None):
+    """Return an (alpha, coefficient) array of the coefficients of each alpha on standardized predictors.
+
+    Args:
+        xs: A 2D array of standardized predictors
+        yc: An array of the centered target
+        l1_ratio: The share of the penalty on the L1 norm. 0 fits the ridge path
+        alphas: A decreasing array of alphas
+        gram: An optional precomputed xs'xs shared between paths
+        xy: An optional precomputed xs'yc shared between paths
+    """
+    if l1_ratio == 0:
+        return ridge_path(xs, yc, alphas)
+    gram = xs.T @ xs if gram is None else gram
+    xy = xs.T @ yc if xy is None else xy
+    _, coefs, _ = enet_path(xs, yc, l1_ratio=l1_ratio, alphas=alphas, precompute=gram, Xy=xy)
+    return coefs.T
+
+
+def fit_fold(x, y, train, test, alphas, l1_ratios):
+    """Fit the path of each l1_ratio on the train rows and return the mean squared error of each fit on the test rows.
+
+    Args:
+        x: A 2D array of predictors without a constant column
+        y: An array of the target
+        train: An array of the indices of the training rows
+        test: An array of the indices of the test rows
+        alphas: A decreasing array of alphas
+        l1_ratios: A list of l1_ratios
+
+    Returns:
+        An (l1_ratio, alpha) array of mean squared errors
+    """
+    xs, mean, scale = standardize(x[train])
+    y_mean = y[train].mean()
+    yc = y[train] - y_mean
+    gram, xy = xs.T @ xs, xs.T @ yc
+    x_test = (x[test] - mean) / scale
+
+    errors = np.empty((len(l1_ratios), len(alphas)))
+    for i, l1_ratio in enumerate(l1_ratios):
+        coefs = fit_path(xs, yc, l1_ratio, alphas, gram, xy)
+        errors[i] = ((y[test] - y_mean - coefs @ x_test.T) ** 2).mean(axis=1)
+    return errors
+
+
+def search(x, y, dates, n_folds=None, n_alphas=None, l1_ratios=None, processes=None):
+    """Cross validate every l1_ratio and alpha over time series folds and return the results.
+
+    Args:
+        x: A 2D array of predictors without a constant column, sorted by date
+        y: An array of the target
+        dates: An array of each game's date
+        n_folds: The number of folds. Defaults to the 'n_folds' setting
+        n_alphas: The number of alphas in the grid. Defaults to the 'n_alphas' setting
+        l1_ratios: A list of l1_ratios. Defaults to the 'l1_ratios' setting
+        processes: The number of worker processes. Defaults to the 'selection_processes' setting, or one per fold
+
+    Returns:
+        A DataFrame with the model, l1_ratio, alpha, and the mean and standard deviation of the mean squared error
+        across folds of each configuration, sorted from the lowest mean squared error
+    """
+    n_folds = n_folds or Config.get_property("n_folds")
+    n_alphas = n_alphas or Config.get_property("n_alphas")
+    l1_ratios = list(l1_ratios if l1_ratios is not None else Config.get_property("l1_ratios"))
+    processes = processes or Config.get_property("selection_processes") or n_folds
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    alphas = alpha_grid(x, y, l1_ratios, n_alphas)
+    folds = time_series_folds(dates, n_folds)
+    args = [[x] * n_folds, [y] * n_folds, [fold[0] for fold in folds], [fold[1] for fold in folds],
+            [alphas] * n_folds, [l1_ratios] * n_folds]
+    if processes == 1:
+        errors = np.array(list(map(fit_fold, *args)))
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, n_folds)) as pool:
+            errors = np.array(list(pool.map(fit_fold, *args)))
+
+    ratio_values, alpha_values = np.meshgrid(l1_ratios, alphas, indexing="ij")
+    results = pd.DataFrame({"model": [model_name(ratio) for ratio in ratio_values.ravel()],
+                            "l1_ratio": ratio_values.ravel(), "alpha": alpha_values.ravel(), "mse": errors.mean(axis=0).ravel(),
+                            "mse_std": errors.std(axis=0).ravel()})
+    return results.sort_values("mse", kind="stable").reset_index(drop=True)
+
+
+def refit(x, y, columns, l1_ratio, alpha):
+    """Fit the configuration on every row and return a Series of its coefficients on the unstandardized predictors.
+
+    The lasso and elastic net are fit along the grid's path down to alpha so the fit starts from nearby coefficients.
+
+    Args:
+        x: A 2D array of predictors without a constant column
+        y: An array of the target
+        columns: The names of the predictors
+        l1_ratio: The configuration's l1_ratio
+        alpha: The configuration's alpha
+    """
+    xs, mean, scale = standardize(np.asarray(x, dtype=float))
+    y = np.asarray(y, dtype=float)
+    alphas = alpha_grid(x, y, [l1_ratio], Config.get_property("n_alphas"))
+    alphas = np.append(alphas[alphas > alpha], alpha)
+    coefs = fit_path(xs, y - y.mean(), l1_ratio, alphas)[-1] / scale
+    return pd.Series(np.append(y.mean() - mean @ coefs, coefs), index=["const"] + list(columns))
+
+
+def selection_file(league_year):
+    """Return the path of the saved model selection for the league year."""
+    return os.path.join(configuration.output_directory(), "model_selection_{}.json".format(league_year))
+
+
+def save(selection, path):
+    """Write the selection dictionary to path as JSON."""
+    with open(path, "w") as file:
+        json.dump(selection, file, indent=4)
+
+
+def load(path):
+    """Return the selection dictionary saved at path with its coefficients as a Series, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        selection = json.load(file)
+    selection["coefs"] = pd.Series(selection["coefs"])
+    return selection
+
+
+def load_seasons(seasons, url=None):
+    """Return a DataFrame of every finished game of the seasons with point-in-time four factors, sorted by start time.
+
+    Args:
+        seasons: An iterable of league years
+        url: The database url. Defaults to the 'database' setting
+    """
+    ff_list = ff_reg.four_factors_list()
+    engine = backend.engine(url)
+    try:
+        with engine.connect() as connection:
+            frames = [backtest.load_season(connection, league_year, ff_list).assign(season=league_year)
+                      for league_year in seasons]
+    finally:
+        engine.dispose()
+    games = pd.concat(frames)
+    games["start_time"] = pd.to_datetime(games.start_time)
+    return games.sort_values("start_time", kind="stable")
+
+
+def main(seasons, url=None, processes=None, path=None):
+    """Cross validate regularized four factor regressions on the seasons, and save and return the best configuration.
+
+    Args:
+        seasons: An iterable of league years
+        url: The database url. Defaults to the 'database' setting
+        processes: The number of worker processes. Defaults to the 'selection_processes' setting, or one per fold
+        path: The path to save the selection to. Defaults to selection_file() for the configured league year
+
+    Returns:
+        A tuple of the selection dictionary, with coefficients as a Series, and the cross validation results DataFrame
+    """
+    seasons = list(seasons)
+    path = path or selection_file(Config.get_property("league_year"))
+    ff_list = ff_reg.four_factors_list()
+    predictors = ["home_{}".format(f) for f in ff_list] + ["away_{}".format(f) for f in ff_list]
+    games = load_seasons(seasons, url).dropna(subset=predictors + ["sched_MOV"])
+
+    x = games[predictors].to_numpy(dtype=float)
+    y = games.sched_MOV.to_numpy(dtype=float)
+    results = search(x, y, games.start_time.to_numpy(dtype="datetime64[D]"), processes=processes)
+    best = results.iloc[0]
+    coefs = refit(x, y, predictors, best.l1_ratio, best.alpha)
+    selection = {"model": best.model, "l1_ratio": float(best.l1_ratio), "alpha": float(best.alpha),
+                 "mse": float(best.mse), "mse_std": float(best.mse_std), "seasons": seasons, "n": len(games),
+                 "n_folds": Config.get_property("n_folds"), "created": time.time(), "coefs": coefs.to_dict()}
+    save(selection, path)
+    print("Selected {} with alpha {:.4g} and l1_ratio {}: CV MSE {:.3f}".format(
+        selection["model"], selection["alpha"], selection["l1_ratio"], selection["mse"]))
+    selection["coefs"] = coefs
+    return selection, results
+
+
+if __name__ == "__main__":
+    main(range(2015, Config.get_property("league_year") + 1))
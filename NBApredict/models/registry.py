@@ -0,0 +1,233 @@
+"""
+registry holds the Model base class and the registry of models which predict the home team's margin of victory.
+
+Every model is fit on the same predictors and target and scores the same feature matrix, with one row per game and the
+home_ and away_ four factors of its teams. The training data and the feature matrix are each built once, with one
+read of the database, and shared by every model, so adding a model adds only its own fit and predict time. Each model
+predicts the whole slate in one predict_batch() call, and the time each model takes is recorded.
+
+Models are added to the registry with the register decorator and enabled by name in the 'registered_models' setting.
+
+Example:
+    @register("my_model")
+    class MyModel(Model):
+        ...
+
+    models = registry.fit_models(Config.get_property("registered_models"), session, team_stats_tbl, sched_tbl)
+    features = registry.slate_features(session, latest_tbl, games)
+    predictions, timings = registry.score_slate(models, features)
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from nbapredict.configuration import Config
+from nbapredict.database import getters
+from nbapredict.models import four_factor_regression as ff_reg
+from nbapredict.models import model_selection
+
+MODELS = {}  # {name: Model subclass} of every registered model
+
+
+def register(name):
+    """Return a class decorator which adds a Model subclass to the registry under name."""
+    def decorator(cls):
+        if name in MODELS:
+            raise ValueError("A model is already registered as '{}'".format(name))
+        cls.name = name
+        MODELS[name] = cls
+        return cls
+    return decorator
+
+
+class Model:
+    """Model is the interface shared by every registered model.
+
+    Subclasses implement fit() and predict_batch(). Predictions are the home team's margin of victory.
+
+    Attributes:
+        name: The name the model is registered under
+        resid_std: The standard deviation of a game's margin of victory around its prediction, if the model has one
+        fit_seconds: The seconds fit() took when the model was fit by fit_models()
+    """
+    name = None
+
+    def __init__(self):
+        """Initialize an unfit model"""
+        self.resid_std = None
+        self.fit_seconds = None
+
+    @property
+    def model_id(self):
+        """An id of the fitted model which is stored with its predictions. None if the model has none."""
+        return None
+
+    def fit(self, predictors, target):
+        """Fit the model and return it.
+
+        Args:
+            predictors: A DataFrame of home_ and away_ four factors without a constant column
+            target: A Series of the home team's margin of victory
+        """
+        raise NotImplementedError
+
+    def predict_batch(self, features):
+        """Return an array of the predicted margin of victory of each row in features.
+
+        Args:
+            features: A DataFrame of home_ and away_ four factors, with a const column, from slate_features()
+        """
+        raise NotImplementedError
+
+
+@register("four_factor_regression")
+class LinearModel(Model):
+    """The four factor regression fit by ordinary least squares.
+
+    Attributes:
+        regression: The fitted LinearRegression, or another fitted regression with predict() and resid_std, such as a
+        RegressionState or Artifact
+    """
+
+    def __init__(self, regression=None):
+        """Wrap an already fitted regression if one is given
+
+        Args:
+            regression: An optional fitted regression, such as the one returned by four_factor_regression.main()
+        """
+        super().__init__()
+        self.regression = regression
+        if regression is not None:
+            self.resid_std = regression.resid_std
+
+    @property
+    def model_id(self):
+        return getattr(self.regression, "artifact_id", None)
+
+    def fit(self, predictors, target):
+        self.regression = ff_reg.LinearRegression(target, predictors)
+        self.resid_std = self.regression.resid_std
+        return self
+
+    def predict_batch(self, features):
+        return self.regression.predict(features)
+
+
+@register("regularized_regression")
+class RegularizedModel(Model):
+    """The four factor regression with the penalty saved by model_selection.main().
+
+    Attributes:
+        selection: The saved selection dictionary with the model, l1_ratio, and alpha
+        coefs: values of the coefficients, including the constant
+    """
+
+    def __init__(self, path=None):
+        """Load the saved selection
+
+        Args:
+            path: The path of the saved selection. Defaults to model_selection.selection_file() for the league year
+        """
+        super().__init__()
+        path = path or model_selection.selection_file(Config.get_property("league_year"))
+        self.selection = model_selection.load(path)
+        if self.selection is None:
+            raise ValueError("No model selection is saved at {}. Run model_selection.main() first".format(path))
+        self.coefs = None
+
+    def fit(self, predictors, target):
+        self.coefs = model_selection.refit(predictors.to_numpy(dtype=float), target, predictors.columns,
+                                           self.selection["l1_ratio"], self.selection["alpha"])
+        residuals = np.asarray(target, dtype=float) - self.predict_batch(predictors)
+        self.resid_std = np.sqrt(residuals @ residuals / (len(residuals) - np.count_nonzero(self.coefs)))
+        return self
+
+    def predict_batch(self, features):
+        x = features.reindex(columns=self.coefs.index)
+        x["const"] = 1.0
+        return x.to_numpy(dtype=float) @ self.coefs.to_numpy()
+
+
+def training_data(session, team_stats_tbl, sched_tbl):
+    """Return the predictors and target of every finished game with its teams' four factors as known at tip-off."""
+    regression_df = ff_reg.point_in_time_regression_df(session, team_stats_tbl, sched_tbl, ff_reg.four_factors_list())
+    predictors = regression_df[regression_df.columns.drop(list(regression_df.filter(regex='sched')))]
+    return predictors, regression_df["sched_MOV"]
+
+
+def fit_models(names, session, team_stats_tbl, sched_tbl, fitted=None):
+    """Return a dictionary of each named model fit on the same training data.
+
+    The training data is read once and only if a model is not already fitted.
+
+    Args:
+        names: A list of registered model names
+        session: A SQLalchemy session
+        team_stats_tbl: A mapped team stats table object holding every snapshot of team stats
+        sched_tbl: A mapped schedule table object
+        fitted: An optional dictionary of {name: fitted Model} which are used as they are
+
+    Returns:
+        A dictionary of {name: fitted Model} in the order of names
+    """
+    fitted = fitted or {}
+    unknown = [name for name in names if name not in MODELS and name not in fitted]
+    if unknown:
+        raise ValueError("Unknown models {}. Registered models are {}".format(unknown, list(MODELS)))
+
+    models = {}
+    training = None
+    for name in names:
+        if name in fitted:
+            models[name] = fitted[name]
+            continue
+        if training is None:
+            training = training_data(session, team_stats_tbl, sched_tbl)
+        start = time.perf_counter()
+        models[name] = MODELS[name]().fit(*training)
+        models[name].fit_seconds = time.perf_counter() - start
+    return models
+
+
+def slate_features(session, latest_tbl, games):
+    """Return the feature matrix of the games with each team's latest four factors and a const column.
+
+    Args:
+        session: A SQLalchemy session
+        latest_tbl: A mapped team stats latest table
+        games: A DataFrame with a home_team_id and away_team_id column. The feature matrix keeps its index
+    """
+    ff_list = ff_reg.four_factors_list()
+    latest = getters.read_columns(session, latest_tbl, ["team_id"] + ff_list, fmt="pandas").set_index("team_id")
+    home = latest.reindex(games.home_team_id).add_prefix("home_").set_axis(games.index)
+    away = latest.reindex(games.away_team_id).add_prefix("away_").set_axis(games.index)
+    features = pd.concat([home, away], axis=1)
+    features.insert(0, "const", 1.0)
+    return features
+
+
+def score_slate(models, features):
+    """Score every game in features with every model and time each model.
+
+    Args:
+        models: A dictionary of {name: fitted Model}
+        features: A feature matrix from slate_features()
+
+    Returns:
+        A tuple of a DataFrame with each model's predictions in a column named for the model, indexed as features, and
+        a DataFrame of each model's fit and predict seconds
+    """
+    predictions = pd.DataFrame(index=features.index)
+    timings = []
+    for name, model in models.items():
+        start = time.perf_counter()
+        predictions[name] = model.predict_batch(features)
+        timings.append({"model": name, "fit_seconds": model.fit_seconds,
+                        "predict_seconds": time.perf_counter() - start, "games": len(features)})
+    return predictions, pd.DataFrame(timings, columns=["model", "fit_seconds", "predict_seconds", "games"])
+
+
+# Models defined in their own modules register themselves when imported
+from nbapredict.models import bayesian_regression  # noqa: E402
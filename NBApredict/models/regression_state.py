@@ -0,0 +1,226 @@
+"""
+regression_state holds the RegressionState class which fits the four factor regression incrementally.
+
+An ordinary least squares fit only depends on the sufficient statistics X'X, X'y, n, and y'y. RegressionState keeps
+them between runs in an .npz file. Finished games are added to them, and games whose score, time, or date was corrected
+are removed and added again, so a daily refresh only touches the games which changed. Solving for the coefficients is
+O(p^3) in the number of predictors regardless of the number of games. Each game's features are its teams' stats as
+known at tip-off, which do not change once the game is played.
+
+Example:
+    regression = regression_state.main(session, team_stats_tbl, sched_tbl, changes_tbl)
+    regression.predict(pred_df)
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from nbapredict import configuration
+from nbapredict.configuration import Config
+from nbapredict.database import getters
+from nbapredict.management.tables import schedule_changes
+from nbapredict.models.artifacts import ArtifactStore, fingerprint
+from nbapredict.models.feature_store import FeatureStore
+from nbapredict.models import four_factor_regression as ff_reg
+
+
+class RegressionState:
+    """RegressionState holds the sufficient statistics of an OLS regression and each game's contribution to them.
+
+    Attributes:
+        columns: The names of the coefficients. The first is 'const'
+        xtx: X'X, including the constant
+        xty: X'y
+        n: The number of games in the statistics
+        yty: The sum of squares of the target
+        watermark: The id of the last schedule change applied
+        coefs: values of the coefficients from the last solve()
+        cov_params: covariance matrix of the coefficients from the last solve()
+        resid_std: standard deviation of the residuals from the last solve()
+        artifact_id: The id of the cached artifact of the last solve() if one was stored by main()
+    """
+
+    def __init__(self, predictors):
+        """Initialize empty statistics for the predictors
+
+        Args:
+            predictors: The names of the predictor columns, excluding the constant
+        """
+        self.columns = ["const"] + list(predictors)
+        p = len(self.columns)
+        self.xtx = np.zeros((p, p))
+        self.xty = np.zeros(p)
+        self.n = 0
+        self.yty = 0.0
+        self.watermark = 0
+        self.coefs = None
+        self.cov_params = None
+        self.resid_std = None
+        self.artifact_id = None
+        self._rows = {}  # {game id: (x with the constant, y)} so corrected games can be downdated
+
+    @property
+    def game_ids(self):
+        """The ids of the games in the statistics."""
+        return set(self._rows)
+
+    def update(self, game_ids, predictors, target):
+        """Add games to the statistics. Games already in the statistics are replaced.
+
+        Args:
+            game_ids: A list of game ids
+            predictors: A 2D array with a row of predictors, excluding the constant, for each game
+            target: An array of the target of each game
+        """
+        self.downdate([game_id for game_id in game_ids if game_id in self._rows])
+        x = np.column_stack([np.ones(len(game_ids)), np.asarray(predictors, dtype=float).reshape(len(game_ids), -1)])
+        y = np.asarray(target, dtype=float)
+        self._apply(x, y, 1)
+        self._rows.update({game_id: (x_row, y_val) for game_id, x_row, y_val in zip(game_ids, x, y)})
+
+    def downdate(self, game_ids):
+        """Remove games from the statistics. Ids of games not in the statistics are ignored.
+
+        Args:
+            game_ids: A list of game ids
+        """
+        rows = [self._rows.pop(game_id) for game_id in game_ids if game_id in self._rows]
+        if rows:
+            self._apply(np.array([row[0] for row in rows]), np.array([row[1] for row in rows]), -1)
+
+    def _apply(self, x, y, sign):
+        """Add, if sign is 1, or subtract, if sign is -1, the statistics of x and y."""
+        self.xtx += sign * (x.T @ x)
+        self.xty += sign * (x.T @ y)
+        self.n += sign * len(y)
+        self.yty += sign * (y @ y)
+
+    def solve(self):
+        """Solve for the coefficients and residual standard deviation and return the coefficients as a Series."""
+        if self.n <= len(self.columns):
+            raise ValueError("At least {} games are needed to fit {} coefficients; the state holds {}".format(
+                len(self.columns) + 1, len(self.columns), self.n))
+        xtx_inv = np.linalg.pinv(self.xtx)
+        coefs = xtx_inv @ self.xty
+        ssr = max(self.yty - coefs @ self.xty, 0.0)  # y'y - b'X'y since X'X b = X'y
+        self.coefs = pd.Series(coefs, index=self.columns)
+        self.resid_std = np.sqrt(ssr / (self.n - np.linalg.matrix_rank(self.xtx)))
+        self.cov_params = pd.DataFrame(self.resid_std ** 2 * xtx_inv, index=self.columns, columns=self.columns)
+        return self.coefs
+
+    def predict(self, pred_df):
+        """Return an array of predictions for each observation in pred_df.
+
+        Args:
+            pred_df: A dataframe of observations with a column for each predictor. A constant column is optional
+        """
+        x = pred_df.reindex(columns=self.columns)
+        if "const" not in pred_df:
+            x["const"] = 1.0
+        return x.to_numpy(dtype=float) @ self.coefs.to_numpy()
+
+    def save(self, path):
+        """Write the state to an .npz file at path."""
+        ids = list(self._rows)
+        np.savez(path, columns=np.array(self.columns), xtx=self.xtx, xty=self.xty, n=self.n, yty=self.yty,
+                 watermark=self.watermark, game_ids=np.array(ids, dtype="i8"),
+                 x=np.array([self._rows[game_id][0] for game_id in ids]).reshape(len(ids), len(self.columns)),
+                 y=np.array([self._rows[game_id][1] for game_id in ids]))
+
+    @classmethod
+    def load(cls, path, predictors):
+        """Return the state saved at path, or an empty state if there is none or it was fit on other predictors.
+
+        Args:
+            path: The path of an .npz file written by save()
+            predictors: The names of the predictor columns, excluding the constant
+        """
+        state = cls(predictors)
+        if not os.path.exists(path):
+            return state
+        with np.load(path) as saved:
+            if saved["columns"].tolist() != state.columns:
+                return state
+            state.xtx, state.xty = saved["xtx"], saved["xty"]
+            state.n, state.yty, state.watermark = int(saved["n"]), float(saved["yty"]), int(saved["watermark"])
+            state._rows = {game_id: (x_row, y_val) for game_id, x_row, y_val in
+                           zip(saved["game_ids"].tolist(), saved["x"], saved["y"].tolist())}
+        return state
+
+
+def refresh(session, state, team_stats_tbl, sched_tbl, ff_list, changes_tbl=None):
+    """Bring the state up to date with the finished games in sched_tbl and return the number of games refit.
+
+    With changes_tbl, only games in the schedule change log after the state's watermark are refit. Without it, or for
+    an empty state, finished games are matched to the games in the state by id, which catches new and removed games but
+    not corrections to games already in the state.
+
+    Args:
+        session: A SQLalchemy session
+        state: A RegressionState
+        team_stats_tbl: A mapped team stats table object holding every snapshot of team stats
+        sched_tbl: A mapped schedule table object
+        ff_list: List of the four factors variable
+        changes_tbl: An optional mapped schedule change log table
+    """
+    watermark = schedule_changes.watermark(session, changes_tbl) if changes_tbl is not None else 0
+    columns = ["id", "home_team_id", "away_team_id", "start_time", "MOV"]
+    if changes_tbl is not None and state.n > 0:
+        changes = schedule_changes.changes_since(session, changes_tbl, state.watermark)
+        changed = set(changes.game_id.tolist())
+        state.downdate(changed)
+        games = getters.read_columns(session, sched_tbl, columns, fmt="pandas",
+                                     where=[sched_tbl.id.in_(changed), sched_tbl.home_team_score > 0])
+    else:
+        games = getters.read_columns(session, sched_tbl, columns, where=[sched_tbl.home_team_score > 0],
+                                     fmt="pandas")
+        finished = set(games.id.tolist())
+        state.downdate(state.game_ids - finished)
+        games = games[~games.id.isin(state.game_ids)]
+
+    state.watermark = max(watermark, state.watermark)
+    if len(games) == 0:
+        return 0
+    store = FeatureStore.from_table(session, team_stats_tbl, ff_list)
+    regression_df = store.regression_frame(games.set_index("id"))
+    predictors = ["home_{}".format(f) for f in ff_list] + ["away_{}".format(f) for f in ff_list]
+    state.update(regression_df.index.tolist(), regression_df[predictors].to_numpy(), regression_df["sched_MOV"])
+    return len(regression_df)
+
+
+def state_file(league_year):
+    """Return the path of the saved regression state for the league year."""
+    return os.path.join(configuration.output_directory(), "regression_state_{}.npz".format(league_year))
+
+
+def main(session, team_stats_tbl, sched_tbl, changes_tbl=None, path=None):
+    """Load the saved regression state, refresh it with the latest games, save it, and return it solved.
+
+    Args:
+        session: An instantiated Session object from sqlalchemy
+        team_stats_tbl: A mapped team stats table class holding every snapshot of team stats
+        sched_tbl: A mapped schedule table class
+        changes_tbl: An optional mapped schedule change log table
+        path: The path of the saved state. Defaults to state_file() for the configured league year
+
+    Returns:
+        A solved RegressionState
+    """
+    path = path or state_file(Config.get_property("league_year"))
+    ff_list = ff_reg.four_factors_list()
+    predictors = ["home_{}".format(f) for f in ff_list] + ["away_{}".format(f) for f in ff_list]
+    state = RegressionState.load(path, predictors)
+    refit = refresh(session, state, team_stats_tbl, sched_tbl, ff_list, changes_tbl)
+    print("Refit {} games; {} games in the regression".format(refit, state.n))
+    state.save(path)
+    state.solve()
+    if Config.get_property("cache_artifacts"):
+        store = ArtifactStore()
+        artifact_id = fingerprint([state.xtx, state.xty, [state.n, state.yty]], predictors,
+                                  Config.get_property("four_factor_regression"))
+        if store.get(artifact_id) is None:
+            store.put(artifact_id, state.coefs, state.cov_params, state.resid_std, state.n)
+        state.artifact_id = artifact_id
+    return state
@@ -0,0 +1,198 @@
+"""
+simulation holds the SeasonSimulator class which simulates the remaining games of a season with Monte Carlo.
+
+Each remaining game's margin of victory is drawn from a normal distribution centered on the model's predicted margin
+with the standard deviation of the model's residuals. Seasons are simulated in chunks: the margins of every game in a
+chunk of seasons are drawn as one array, and each team's wins are totaled with one matrix product. Chunks bound the
+memory used regardless of the number of seasons. Teams are then seeded within their conference by wins, with ties broken
+at random, and the win totals, seeds, and playoff berths of every season are aggregated per team.
+
+Example:
+    simulator = simulation.from_database(session, regression, sched_tbl, latest_tbl, teams_tbl)
+    for result in simulator.stream(100000, seed=1):
+        print("{} seasons simulated".format(result.seasons))
+    result.summary()
+"""
+
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from nbapredict.configuration import Config
+from nbapredict.database import getters
+from nbapredict.helpers import br_references as br
+from nbapredict.models import registry
+
+
+class SimulationResult:
+    """Aggregated outcomes of simulated seasons for each team.
+
+    Attributes:
+        teams: An array of team ids
+        conferences: An array of each team's conference
+        seasons: The number of seasons simulated
+        win_counts: A (team, wins) array of the number of seasons each team finished with each win total
+        seed_counts: A (team, seed) array of the number of seasons each team finished with each seed. Seed 1 is index 0
+        playoff_seeds: The number of seeds in each conference which make the playoffs
+    """
+
+    def __init__(self, teams, conferences, max_wins, max_seeds, playoff_seeds):
+        """Initialize empty counts"""
+        self.teams = teams
+        self.conferences = conferences
+        self.seasons = 0
+        self.win_counts = np.zeros((len(teams), max_wins + 1), dtype="i8")
+        self.seed_counts = np.zeros((len(teams), max_seeds), dtype="i8")
+        self.playoff_seeds = playoff_seeds
+
+    def add(self, wins, seeds):
+        """Add the outcomes of a chunk of seasons.
+
+        Args:
+            wins: A (season, team) integer array of win totals
+            seeds: A (season, team) integer array of conference seeds, where 0 is the first seed
+        """
+        n_teams = len(self.teams)
+        team_index = np.arange(n_teams)
+        self.win_counts += np.bincount((team_index * self.win_counts.shape[1] + wins).ravel(),
+                                       minlength=self.win_counts.size).reshape(self.win_counts.shape)
+        self.seed_counts += np.bincount((team_index * self.seed_counts.shape[1] + seeds).ravel(),
+                                        minlength=self.seed_counts.size).reshape(self.seed_counts.shape)
+        self.seasons += len(wins)
+
+    def summary(self):
+        """Return a DataFrame of each team's mean and standard deviation of wins, seed odds, and playoff odds."""
+        win_totals = np.arange(self.win_counts.shape[1])
+        win_odds = self.win_counts / self.seasons
+        mean_wins = win_odds @ win_totals
+        seed_odds = self.seed_counts / self.seasons
+        summary = pd.DataFrame({"team_id": self.teams, "conference": self.conferences, "mean_wins": mean_wins,
+                                "std_wins": np.sqrt(np.maximum(win_odds @ win_totals ** 2 - mean_wins ** 2, 0)),
+                                "mean_seed": seed_odds @ np.arange(1, seed_odds.shape[1] + 1),
+                                "playoff_odds": seed_odds[:, :self.playoff_seeds].sum(axis=1)})
+        for seed in range(self.playoff_seeds):
+            summary["seed_{}".format(seed + 1)] = seed_odds[:, seed]
+        return summary.sort_values(["conference", "mean_wins"], ascending=[True, False]).reset_index(drop=True)
+
+
+class SeasonSimulator:
+    """SeasonSimulator simulates the remaining games of a season from their expected margins of victory.
+
+    Attributes:
+        teams: A sorted array of team ids
+        conferences: An array of each team's conference
+        current_wins: An array of each team's wins in games already played
+        margins: An array of the expected home margin of victory of each remaining game
+        resid_std: The standard deviation of a game's margin of victory around its expected margin
+        playoff_seeds: The number of seeds in each conference which make the playoffs
+    """
+
+    def __init__(self, teams, conferences, current_wins, home_ids, away_ids, margins, resid_std, playoff_seeds=None):
+        """Build the game by team incidence matrices used to total wins
+
+        Args:
+            teams: An array of team ids
+            conferences: An array of each team's conference
+            current_wins: An array of each team's wins in games already played
+            home_ids: An array of the home team id of each remaining game
+            away_ids: An array of the away team id of each remaining game
+            margins: An array of the expected home margin of victory of each remaining game
+            resid_std: The standard deviation of a game's margin of victory around its expected margin
+            playoff_seeds: The number of seeds in each conference which make the playoffs. Defaults to the
+            'playoff_seeds' setting
+        """
+        order = np.argsort(teams)
+        self.teams = np.asarray(teams)[order]
+        self.conferences = np.asarray(conferences, dtype=object)[order]
+        self.current_wins = np.asarray(current_wins, dtype="i8")[order]
+        self.margins = np.asarray(margins, dtype=np.float32)
+        self.resid_std = float(resid_std)
+        self.playoff_seeds = playoff_seeds or Config.get_property("playoff_seeds")
+
+        home = np.searchsorted(self.teams, home_ids)
+        away = np.searchsorted(self.teams, away_ids)
+        games = np.arange(len(self.margins))
+        # A home win credits the home team, and a loss credits the away team
+        self._home_wins = np.zeros((len(games), len(self.teams)), dtype=np.float32)
+        self._home_wins[games, home] = 1
+        self._home_wins[games, away] -= 1
+        self._away_wins = np.bincount(away, minlength=len(self.teams))
+        self._conference_members = [np.flatnonzero(self.conferences == conf) for conf in pd.unique(self.conferences)]
+
+    def simulate_chunk(self, rng, n_seasons):
+        """Simulate n_seasons seasons and return each season's win totals and conference seeds.
+
+        Args:
+            rng: A numpy Generator
+            n_seasons: The number of seasons to simulate
+
+        Returns:
+            A tuple of two (season, team) integer arrays: the win totals and the seeds, where 0 is the first seed
+        """
+        noise = rng.standard_normal((n_seasons, len(self.margins)), dtype=np.float32)
+        home_won = (noise * self.resid_std + self.margins > 0).astype(np.float32)
+        wins = (home_won @ self._home_wins).astype("i8") + self._away_wins + self.current_wins
+
+        # Wins are integers, so a fraction in [0, 1) breaks ties at random without reordering different win totals
+        tiebreak = wins + rng.random((n_seasons, len(self.teams)))
+        seeds = np.empty_like(wins)
+        rows = np.arange(n_seasons)[:, None]
+        for members in self._conference_members:
+            order = members[np.argsort(-tiebreak[:, members], axis=1)]
+            seeds[rows, order] = np.arange(len(members))
+        return wins, seeds
+
+    def stream(self, n_seasons, seed=None, chunk_size=None):
+        """Simulate n_seasons seasons in chunks and yield the aggregated result after each chunk.
+
+        The same result object is updated and yielded after each chunk, so it can be used to report progress or to stop
+        early. Results are reproducible for the same seed and chunk_size.
+
+        Args:
+            n_seasons: The number of seasons to simulate
+            seed: An optional seed for the random number generator
+            chunk_size: The number of seasons simulated at once. Defaults to the 'simulation_chunk_size' setting
+        """
+        chunk_size = chunk_size or Config.get_property("simulation_chunk_size")
+        rng = np.random.default_rng(seed)
+        max_seeds = max(len(members) for members in self._conference_members)
+        result = SimulationResult(self.teams, self.conferences, int(self.current_wins.max()) + len(self.margins),
+                                  max_seeds, self.playoff_seeds)
+        while result.seasons < n_seasons:
+            result.add(*self.simulate_chunk(rng, min(chunk_size, n_seasons - result.seasons)))
+            yield result
+
+    def run(self, n_seasons, seed=None, chunk_size=None):
+        """Simulate n_seasons seasons and return the SimulationResult. Arguments are as in stream()."""
+        result = None
+        for result in self.stream(n_seasons, seed, chunk_size):
+            pass
+        return result
+
+
+def from_database(session, model, sched_tbl, latest_tbl, teams_tbl):
+    """Return a SeasonSimulator of the unplayed games in sched_tbl with margins predicted by model.
+
+    Remaining games are predicted with each team's latest four factors. Current wins are counted from the scores of
+    played games.
+
+    Args:
+        session: A SQLalchemy session
+        model: A fitted model with a predict() method and a resid_std, i.e. a LinearRegression
+        sched_tbl: A mapped schedule table
+        latest_tbl: A mapped team stats latest table
+        teams_tbl: A mapped teams table
+    """
+    teams = getters.read_columns(session, teams_tbl, ["id", "team_name"], fmt="pandas")
+    conferences = [br.team_to_conference.get(str(name).upper()) for name in teams.team_name]
+
+    played = getters.read_columns(session, sched_tbl, ["home_team_id", "away_team_id", "MOV"],
+                                  where=[sched_tbl.home_team_score > 0], fmt="pandas")
+    winners = np.where(played.MOV > 0, played.home_team_id, played.away_team_id)
+    current_wins = pd.Series(winners).value_counts().reindex(teams.id, fill_value=0).to_numpy()
+
+    remaining = getters.read_columns(session, sched_tbl, ["home_team_id", "away_team_id"],
+                                     where=[sched_tbl.home_team_score == 0], fmt="pandas")
+    margins = model.predict(registry.slate_features(session, latest_tbl, remaining))
+    return SeasonSimulator(teams.id.to_numpy(), conferences, current_wins, remaining.home_team_id.to_numpy(),
+                           remaining.away_team_id.to_numpy(), margins, model.resid_std)
@@ -0,0 +1,220 @@
+"""
+backtest contains functions which evaluate how the four factor regression would have fared betting past seasons.
+
+The backtest walks forward through each season one game date at a time. The games on a date are predicted by a
+regression fit only on the games before that date, with each team's four factors as known at tip-off. Rather than
+refitting on every date, the cumulative sufficient statistics X'X and X'y of the games in date order are computed once,
+and every date's coefficients are solved from them in a single batched call. Predictions are then graded against the
+first line stored for each game, and the line is compared to the game's closing line.
+
+Seasons are independent, so each runs in its own process. The report holds, for each season and overall, the number of
+bets, the hit rate, the return on investment of one unit bets, and the closing line value (CLV): the average number of
+points by which the bet line beat the closing line.
+
+Example:
+    report, bets = backtest.run(range(2015, 2021))
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData
+
+# Local Imports
+from nbapredict.configuration import Config
+from nbapredict.database import backend, getters
+from nbapredict.models import four_factor_regression as ff_reg
+from nbapredict.models.feature_store import FeatureStore
+
+DEFAULT_PRICE = -110  # American odds assumed when a line has no price
+
+
+def payout(prices):
+    """Return the profit of a winning one unit bet at each American price in prices. Missing prices use DEFAULT_PRICE."""
+    prices = np.asarray(prices, dtype=float)
+    prices = np.where(np.isnan(prices), DEFAULT_PRICE, prices)
+    return np.where(prices > 0, prices / 100, 100 / np.abs(prices))
+
+
+def local_to_utc(times):
+    """Return a Series of naive local times, such as odds scrape times from datetime.now(), as naive UTC wall times.
+
+    Each distinct time is converted once with the local timezone's offset on that date, so daylight saving time is
+    respected. Times are assumed to have been recorded in the timezone this runs in.
+
+    Args:
+        times: A Series of naive local datetimes
+    """
+    times = pd.to_datetime(times)
+    utc = {time: time.to_pydatetime().astimezone(timezone.utc).replace(tzinfo=None)
+           for time in times.dropna().unique()}
+    return pd.to_datetime(times.map(utc))
+
+
+def load_season(bind, league_year, ff_list):
+    """Return a DataFrame of the season's finished games with point-in-time four factors and bet and closing lines.
+
+    Games are sorted by start_time. Games where either team had no stats yet are dropped. Games without odds have null
+    lines. Only odds scraped before a game's start_time, a UTC wall time, count as lines, so the local odds scrape
+    times are converted to UTC first.
+
+    Args:
+        bind: A SQLalchemy connection or engine
+        league_year: The league year of the season
+        ff_list: List of the four factors variable
+    """
+    metadata = MetaData()
+    names = ["schedule_{}".format(league_year), "team_stats_{}".format(league_year), "odds_{}".format(league_year)]
+    metadata.reflect(bind=bind, only=lambda name, _: name in names)
+    sched_tbl, stats_tbl = metadata.tables[names[0]], metadata.tables[names[1]]
+
+    games = getters.read_columns(bind, sched_tbl, ["id", "home_team_id", "away_team_id", "start_time", "MOV"],
+                                 where=[sched_tbl.c.home_team_score > 0], order_by=["start_time"], fmt="pandas")
+    snapshots = getters.read_columns(bind, stats_tbl, ["team_id", "scrape_time", "valid_from"] + ff_list, fmt="pandas")
+    # Snapshots inserted before validity ranges existed are valid from their scrape_time
+    valid_from = pd.to_datetime(snapshots.valid_from).fillna(pd.to_datetime(snapshots.scrape_time))
+    store = FeatureStore(snapshots.team_id.to_numpy(), valid_from.to_numpy(), snapshots[ff_list].to_numpy(), ff_list)
+    season = store.regression_frame(games.set_index("id"))
+    season = season.join(games.set_index("id")[["start_time"]])
+    season.index.name = "game_id"
+
+    lines = pd.DataFrame(columns=["spread", "home_spread_price", "away_spread_price", "closing_spread"])
+    if names[2] in metadata.tables:
+        odds_tbl = metadata.tables[names[2]]
+        odds = getters.read_columns(bind, odds_tbl, ["game_id", "spread", "home_spread_price", "away_spread_price",
+                                                     "scrape_time"], order_by=["game_id", "scrape_time"], fmt="pandas")
+        odds = odds.join(season.start_time, on="game_id", how="inner")
+        odds["scrape_time"] = local_to_utc(odds.scrape_time)
+        odds = odds[odds.spread.notna() & (odds.scrape_time <= pd.to_datetime(odds.start_time))]
+        lines = odds.drop_duplicates("game_id", keep="first").set_index("game_id")[
+            ["spread", "home_spread_price", "away_spread_price"]]
+        lines["closing_spread"] = odds.drop_duplicates("game_id", keep="last").set_index("game_id").spread
+    return season.join(lines)
+
+
+def walk_forward(predictors, target, dates, min_train_games):
+    """Return each game's prediction from a regression fit only on the games played on earlier dates.
+
+    Args:
+        predictors: A 2D array of predictors, including a constant column, sorted by date
+        target: An array of the target of each game
+        dates: An array of each game's date, sorted
+        min_train_games: Games are only predicted once at least this many games were played on earlier dates
+
+    Returns:
+        An array of predictions. Games without enough earlier games are NaN
+    """
+    n, p = predictors.shape
+    # prior_xtx[k] and prior_xty[k] are the statistics of the first k games
+    prior_xtx = np.zeros((n + 1, p, p))
+    prior_xty = np.zeros((n + 1, p))
+    np.cumsum(np.einsum("ni,nj->nij", predictors, predictors), axis=0, out=prior_xtx[1:])
+    np.cumsum(predictors * target[:, None], axis=0, out=prior_xty[1:])
+
+    prior_games = np.searchsorted(dates, dates, side="left")  # The number of games played before each game's date
+    trained = prior_games >= max(min_train_games, p + 1)
+    predictions = np.full(n, np.nan)
+    if not trained.any():
+        return predictions
+    sizes, game_fits = np.unique(prior_games[trained], return_inverse=True)
+    coefs = np.einsum("dij,dj->di", np.linalg.pinv(prior_xtx[sizes]), prior_xty[sizes])
+    predictions[trained] = np.einsum("ij,ij->i", predictors[trained], coefs[game_fits])
+    return predictions
+
+
+def grade(season):
+    """Return the bets the predictions in season would have made, graded against the lines.
+
+    The home team is bet if its predicted margin of victory beats the line and the away team if it falls short. CLV is
+    the number of points by which the bet line beat the closing line, from the side of the team bet on.
+
+    Args:
+        season: A DataFrame from load_season() with a prediction column
+    """
+    games = season[season.prediction.notna() & season.spread.notna()]
+    spread = games.spread.to_numpy(dtype=float)
+    side = np.sign(games.prediction.to_numpy() + spread)  # 1 to bet home, -1 to bet away, 0 if the line is the pick
+    cover = np.sign((games.sched_MOV.to_numpy(dtype=float) + spread) * side)
+    price = np.where(side > 0, games.home_spread_price.to_numpy(dtype=float),
+                     games.away_spread_price.to_numpy(dtype=float))
+    bets = pd.DataFrame({"start_time": games.start_time, "prediction": games.prediction, "spread": spread,
+                         "closing_spread": games.closing_spread.to_numpy(dtype=float), "side": side,
+                         "result": np.select([cover > 0, cover < 0], ["WIN", "LOSS"], "PUSH"),
+                         "profit": np.select([cover > 0, cover < 0], [payout(price), -1.0], 0.0),
+                         "clv": side * (spread - games.closing_spread.to_numpy(dtype=float))}, index=games.index)
+    return bets[side != 0]
+
+
+def backtest_season(league_year, url=None, min_train_games=None):
+    """Walk forward through a season and return a DataFrame of its graded bets.
+
+    Args:
+        league_year: The league year of the season
+        url: The database url. Defaults to the 'database' setting
+        min_train_games: The number of games played before the first prediction. Defaults to the 'min_train_games'
+        setting
+    """
+    min_train_games = min_train_games if min_train_games is not None else Config.get_property("min_train_games")
+    ff_list = ff_reg.four_factors_list()
+    engine = backend.engine(url)
+    try:
+        with engine.connect() as connection:
+            season = load_season(connection, league_year, ff_list)
+    finally:
+        engine.dispose()
+
+    predictors = ["home_{}".format(f) for f in ff_list] + ["away_{}".format(f) for f in ff_list]
+    x = np.column_stack([np.ones(len(season)), season[predictors].to_numpy(dtype=float)])
+    dates = pd.to_datetime(season.start_time).to_numpy(dtype="datetime64[D]")
+    season["prediction"] = walk_forward(x, season.sched_MOV.to_numpy(dtype=float), dates, min_train_games)
+    bets = grade(season)
+    bets.insert(0, "season", league_year)
+    return bets.reset_index()
+
+
+def report(bets):
+    """Return a DataFrame of the bet count, hit rate, ROI, and CLV of each season and of all seasons together.
+
+    Args:
+        bets: A DataFrame of graded bets from backtest_season()
+    """
+    def summarize(group):
+        wins, losses = (group.result == "WIN").sum(), (group.result == "LOSS").sum()
+        return pd.Series({"bets": len(group), "wins": wins, "losses": losses, "pushes": len(group) - wins - losses,
+                          "hit_rate": wins / (wins + losses) if wins + losses else np.nan,
+                          "profit": group.profit.sum(), "roi": group.profit.mean() if len(group) else np.nan,
+                          "clv": group.clv.mean(), "beat_close": (group.clv > 0).mean() if len(group) else np.nan})
+
+    seasons = [summarize(group).rename(season) for season, group in bets.groupby("season")]
+    return pd.DataFrame(seasons + [summarize(bets).rename("all")])
+
+
+def run(seasons, url=None, processes=None, min_train_games=None):
+    """Backtest each season in a process pool and return the report and the graded bets.
+
+    Args:
+        seasons: An iterable of league years
+        url: The database url. Defaults to the 'database' setting
+        processes: The number of worker processes. Defaults to the 'backtest_processes' setting, or one per season
+        min_train_games: The number of games played in a season before its first prediction
+
+    Returns:
+        A tuple of the report DataFrame from report() and a DataFrame of every graded bet
+    """
+    seasons = list(seasons)
+    url = url or Config.get_property("database")
+    processes = processes or Config.get_property("backtest_processes") or len(seasons)
+    args = [seasons, [url] * len(seasons), [min_train_games] * len(seasons)]
+    if processes == 1:
+        results = list(map(backtest_season, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(seasons))) as pool:
+            results = list(pool.map(backtest_season, *args))
+    bets = pd.concat(results, ignore_index=True)
+    return report(bets), bets
+
+
+if __name__ == "__main__":
+    backtest_report, _ = run(range(2015, Config.get_property("league_year") + 1))
+    print(backtest_report)
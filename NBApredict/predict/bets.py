@@ -3,9 +3,10 @@ Predict.odds contains functions organized around comparing predictions to odds
 
 ToDo:
     In theory, the module will allow multiple model inputs. Thus, we can pass it a linear, bayesian, ML, etc. model,
-    generate results, and store them. That functionality does not exist. This should also have a class of some sort to
-    manage predictions. It will add specificity and remove call complexity and name overlaps (i.e.
-    predict_games_on_day() vs. predict_games_on_date())
+    generate results, and store them. Models are registered in models/registry.py, and predict_games_in_odds() scores
+    every registered model on the same games. This should also have a class of some sort to manage predictions. It will
+    add specificity and remove call complexity and name overlaps (i.e. predict_games_on_day() vs.
+    predict_games_on_date())
 """
 
 from datetime import datetime
@@ -24,19 +25,22 @@ from datatotable.data import DataOperator
 from nbapredict.database import getters
 from nbapredict.management import conversion
 from nbapredict.management.tables import predictions
+from nbapredict.models import bayesian_regression
 from nbapredict.models import four_factor_regression as ff_reg
+from nbapredict.models import regression_state
+from nbapredict.models import registry
 
 
 def get_prediction(reg, pred_df):
     """Generate and return a prediction for the observations in the pred_df.
 
     Args:
-        reg: LinearRegression class from four_factors_regression.py
+        reg: LinearRegression class from four_factors_regression.py or a solved RegressionState
         pred_df: A dataframe of observations, with home and away statistics, from which to generate a prediction
 
     Returns:
         The predicted value generated from the regression object and the predictors"""
-    return reg.results.predict(pred_df).values[0]
+    return reg.predict(pred_df)[0]
 
 
 def get_team_name(team):
@@ -272,27 +276,40 @@ def predict_game(session, regression, x_df, console_out=False):
     # if console_out:
     #     prediction_result_console_output(home_tm, away_tm, prediction, probability)
 
-    return {"prediction": prediction}
+    return {"prediction": prediction, "model_id": getattr(regression, "artifact_id", None)}
 
 
-def predict_games_in_odds(session, regression, odds_tbl):
-    """Generate and return predictions for all games with odds in the odds_tbl
+def predict_games_in_odds(session, models, odds_tbl, sched_tbl, latest_tbl, console_out=False):
+    """Generate and return predictions of every model for all games with odds in the odds_tbl
+
+    The feature matrix of the games is built once and each model scores every game in one pass.
 
-    ToDo: Take tables as inputs vs. DB
     Args:
         session: A SQLalchemy session object
-        regression: A linear regression object generated from four_factor_regression
+        models: A dictionary of {name: fitted Model} from registry.fit_models()
         odds_tbl: Mapped sqlalchemy odds table
+        sched_tbl: Mapped sqlalchemy schedule table
+        latest_tbl: Mapped sqlalchemy team stats latest table
+        console_out: If true, print the time each model took
 
+    Returns:
+        A list of prediction dictionaries with one row per game and model
     """
-    all_odds = session.query(odds_tbl).all()
+    odds = getters.read_columns(session, odds_tbl, ["game_id", "spread"], fmt="pandas")
+    odds = odds.drop_duplicates("game_id", keep="last").set_index("game_id")
+    games = getters.read_columns(session, sched_tbl, ["id", "home_team_id", "away_team_id", "start_time"],
+                                 where=[sched_tbl.id.in_(odds.index.tolist())], fmt="pandas").set_index("id")
+    features = registry.slate_features(session, latest_tbl, games)
+    slate, timings = registry.score_slate(models, features)
+    if console_out:
+        print(timings)
+
     predictions = []
-    for odds in all_odds:
-        home_team = odds.home_team
-        away_team = odds.away_team
-        start_time = odds.start_time
-        line = odds.spread
-        predictions.append(predict_game(session, regression, home_team, away_team, start_time, line))
+    for name, model in models.items():
+        for game_id, prediction in slate[name].items():
+            predictions.append({"game_id": game_id, "start_time": games.start_time[game_id],
+                                "line": odds.spread[game_id], "prediction": prediction, "model": name,
+                                "model_id": model.model_id})
     return predictions
 
 
@@ -364,41 +381,43 @@ def predict_games_on_date(database, session, league_year, date, console_out):
 
 
 def predict_all(db):
-    """Generate and store predictions for all games available in the odds table.
+    """Generate and store predictions of every registered model for all games available in the odds table.
 
-    Checks if the table exists. If it doesn't, generate a table in the database.
+    Checks if the table exists. If it doesn't, generate a table in the database. Each prediction is stored with the
+    name of its model and the model's id, if it has one.
     """
     session = Session(bind=db.engine)
     league_year = Config.get_property("league_year")
     sched_tbl = db.table_mappings["schedule_{}".format(league_year)]
     team_stats_tbl = db.table_mappings['team_stats_{}'.format(league_year)]
+    latest_tbl = db.table_mappings['team_stats_latest_{}'.format(league_year)]
     odds_tbl = db.table_mappings['odds_{}'.format(league_year)]
 
-    regression = ff_reg.main(session, team_stats_tbl, sched_tbl)
-
+    if Config.get_property("incremental_fit"):
+        changes_tbl_name = 'schedule_changes_{}'.format(league_year)
+        # Without a change log, the state is matched to the finished games by id
+        changes_tbl = db.table_mappings[changes_tbl_name] if db.table_exists(changes_tbl_name) else None
+        regression = regression_state.main(session, team_stats_tbl, sched_tbl, changes_tbl)
+    else:
+        regression = ff_reg.main(session, latest_tbl, sched_tbl, team_stats_tbl=team_stats_tbl)
+    fitted = {"four_factor_regression": registry.LinearModel(regression)}
+    if "bayesian_regression" in Config.get_property("registered_models"):
+        fitted["bayesian_regression"] = bayesian_regression.main(session, team_stats_tbl, sched_tbl)
+    # Other registered models share the training data, which is read once
+    models = registry.fit_models(Config.get_property("registered_models"), session, team_stats_tbl, sched_tbl,
+                                 fitted=fitted)
+
+    results = predict_games_in_odds(session, models, odds_tbl, sched_tbl, latest_tbl)
+    if not results:
+        return
+    pred_data = predictions.format_data(results)
     pred_tbl_name = "predictions_{}".format(league_year)
-
     if not db.table_exists(pred_tbl_name):
-        sample = get_sample_prediction(session, regression, sched_tbl)
-        pred_data = predictions.format_data()
-        predictions.create_table()
-        pred_tbl = db.table_mappings[pred_tbl_name]
-        session.add_all([pred_tbl(**row) for row in pred_data.rows])
-        session.commit()
-    else:
-        # Data operator
-        pred_tbl = db.table_mappings[pred_tbl_name]
-        schedule_tbl = db.table_mappings[pred_tbl_name]
-        update_rows = predictions.insert(session, )
-        results = predict_games_in_odds(session, regression, odds_tbl)
-        session.add_all(update_rows)
-        session.commit()
-
-    insert_new_predictions(results, session, pred_tbl, sched_tbl, odds_tbl)
-
-    session.commit()  # Commit here b/c update_prediction_tbl() needs the inserted values
-
-    update_prediction_table(session, pred_tbl, sched_tbl, odds_tbl)
+        session.commit()  # The table is created on a separate connection, which SQLite blocks while the session reads
+        predictions.create_table(db, pred_tbl_name, pred_data, sched_tbl)
+    pred_tbl = db.table_mappings[pred_tbl_name]
+    predictions.insert(session, pred_tbl, pred_data)
+    session.commit()
 
 
 if __name__ == "__main__":
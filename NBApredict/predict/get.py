@@ -58,7 +58,7 @@ def game_prediction(database, session, regression, home_tm, away_tm, start_time,
 
     # Get Misc stats for year
     ff_list = lm.four_factors_list()
-    ff_df = getters.get_pandas_df_from_table(database, session, "misc_stats_{}".format(year), ff_list)
+    ff_df = getters.get_pandas_df_from_table(database, session, "misc_stats_{}".format(year), ff_list + ["team_name"])
 
     pred_df = prediction_df(home_tm, away_tm, ff_df)
     pred = prediction(regression, pred_df)
@@ -79,7 +79,7 @@ def prediction(reg, pred_df):
 
     Returns:
         The predicted value generated from the regression object and the predictors"""
-    return reg.results.predict(pred_df).values[0]
+    return reg.predict(pred_df)[0]
 
 
 def console_output(home_tm, away_tm, line, prediction, probability):
@@ -0,0 +1,85 @@
+"""Tests of schedule change detection and application against an in-memory SQLite database."""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, create_engine
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.orm import Session
+
+from nbapredict.database.manipulator import ColumnarOperator
+from nbapredict.management.tables import schedule
+
+FIRST_GAME = datetime(2020, 1, 1, 19)
+
+
+@pytest.fixture
+def db():
+    """Return a session and the mapped schedule and odds tables of four stored games, the first two with odds."""
+    engine = create_engine("sqlite://")  # backend enables foreign keys on every SQLite connection
+    metadata = MetaData()
+    Table("teams_2020", metadata, Column("id", Integer, primary_key=True), Column("team_name", String))
+    Table("schedule_2020", metadata, Column("id", Integer, primary_key=True), Column("start_time", DateTime),
+          Column("game_date", DateTime), Column("home_team_id", Integer, ForeignKey("teams_2020.id")),
+          Column("away_team_id", Integer, ForeignKey("teams_2020.id")), Column("home_team_score", Integer),
+          Column("away_team_score", Integer), Column("MOV", Integer), Column("playoffs", String),
+          Column("home_stats_id", Integer), Column("away_stats_id", Integer), Column("row_hash", String))
+    Table("odds_2020", metadata, Column("id", Integer, primary_key=True),
+          Column("game_id", Integer, ForeignKey("schedule_2020.id")), Column("spread", Float))
+    metadata.create_all(engine)
+
+    base = automap_base()
+    base.prepare(engine, reflect=True)
+    teams_tbl, sched_tbl, odds_tbl = base.classes.teams_2020, base.classes.schedule_2020, base.classes.odds_2020
+    session = Session(bind=engine)
+    session.add_all([teams_tbl(id=i, team_name="Team {}".format(i)) for i in range(1, 5)])
+    session.flush()
+    for row in game_rows():
+        session.add(sched_tbl(**row))
+    session.flush()
+    session.add_all([odds_tbl(game_id=1, spread=-3.5), odds_tbl(game_id=2, spread=2.5),
+                     odds_tbl(game_id=2, spread=3.0)])
+    session.commit()
+    yield session, sched_tbl, odds_tbl
+    session.close()
+
+
+def game_rows():
+    """Return the rows of four games, one a day, with their row hashes."""
+    rows = []
+    for day, (home, away) in enumerate([(1, 2), (3, 4), (2, 1), (4, 3)]):
+        start_time = FIRST_GAME + timedelta(days=day)
+        rows.append({"start_time": start_time, "game_date": start_time.date(), "home_team_id": home,
+                     "away_team_id": away, "home_team_score": None, "away_team_score": None, "MOV": None,
+                     "playoffs": None, "home_stats_id": None, "away_stats_id": None})
+    for row in rows:
+        row["row_hash"] = schedule.row_hash(row)
+    return rows
+
+
+def scraped(rows):
+    """Return rows as formatted schedule data."""
+    return ColumnarOperator({key: [row[key] for row in rows] for key in rows[0]})
+
+
+def test_unchanged_schedule_has_no_changes(db):
+    session, sched_tbl, _ = db
+    changes = schedule.detect_changes(session, sched_tbl, scraped(game_rows()))
+    assert changes[:4] == ([], [], [], [])
+
+
+def test_deleted_game_with_odds(db):
+    session, sched_tbl, odds_tbl = db
+    rows = game_rows()
+    del rows[1]  # Game 2, which has two odds rows, is removed from the scraped schedule
+    schedule_data = scraped(rows)
+
+    changes = schedule.detect_changes(session, sched_tbl, schedule_data)
+    assert changes.deletes == [2]
+    log = []
+    schedule.apply_changes(session, sched_tbl, schedule_data, changes, log)
+    session.commit()
+
+    assert [game_id for (game_id,) in session.query(sched_tbl.id).order_by(sched_tbl.id)] == [1, 3, 4]
+    assert [game_id for (game_id,) in session.query(odds_tbl.game_id)] == [1]
+    assert [entry["change_type"] for entry in log] == ["delete"]